@@ -7,7 +7,6 @@ from telegram.ext import (
     ContextTypes
 )
 import asyncio
-import re
 import time
 import configparser
 import os
@@ -16,7 +15,7 @@ import datetime
 # Importa le utility
 from utils.timer_data import (
     TIMER_DATA, config, config_path, ADMIN_USERNAME, 
-    daily_stats, TOKEN, registered_users, save_registered_users,
+    daily_stats, TOKEN, registered_users, register_user,
     user_stats, disabled_avventura, disabled_slot, disabled_borsellino,
     disabled_nanoc, disabled_nanor, disabled_gica, disabled_pozzo,
     disabled_sonda, disabled_forno, disabled_compattatore
@@ -24,9 +23,19 @@ from utils.timer_data import (
 from utils.formatters import format_remaining_time
 from utils.player_data import (
     migrate_existing_data, get_all_subscribes_users,
-    load_player_data, reset_daily_stats
+    load_player_data, reset_daily_stats, player_writer, player_index_writer, player_store,
+    get_timer_start, restore_pending_notifications, player_storage,
+    json_player_store, migrate_players_layout,
+    restore_state_snapshot, take_state_snapshot
 )
-from utils.stats_manager import should_send_admin_stats
+from utils.stats_manager import should_send_admin_stats, unique_users_store, usage_series
+from utils.broadcast import unblock_user
+from utils.command_router import CommandRouter
+from utils.scheduler import notification_scheduler
+from utils.messaging import register_shared_bot, shutdown_shared_bot, outbound_queue, CONNECTION_POOL_SIZE
+
+# Numero massimo di update elaborati contemporaneamente (non oltre le connessioni HTTP disponibili)
+CONCURRENT_UPDATES = min(config.getint('bot', 'concurrent_updates', fallback=16), CONNECTION_POOL_SIZE)
 
 # Aggiungi l'import per il nuovo modulo di logging
 from utils.logger import logger, log_error
@@ -73,20 +82,22 @@ async def timer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Mostra i timer rimanenti per l'utente che esegue il comando."""
     user_id = update.effective_user.id
     username = update.effective_user.username or f"utente_{user_id}"
+    # Carica il profilo senza bloccare il loop: get_timer_start lo troverà in cache
+    if user_id in registered_users:
+        await player_storage.get(user_id)
     now = time.time()
     
     response_lines = [f"⏱️ *Timer per @{username}* ⏱️"]
     
     # Iterate through the defined timers
     for item_name, data in TIMER_DATA.items():
-        times_dict = data["times"]
         active_tasks_dict = data["active"]
         max_cooldown = data["cooldown"]
         emoji = data["emoji"]
         
         # Controlla se l'utente ha un task attivo per questo comando
         has_active_task = user_id in active_tasks_dict
-        last_start_time = times_dict.get(user_id, 0)
+        last_start_time = get_timer_start(user_id, item_name)
         
         if last_start_time == 0:
             # Nessun timer mai usato
@@ -109,9 +120,40 @@ async def timer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     await update.message.reply_text("\n".join(response_lines), parse_mode="Markdown")
 
+# Chiusura della giornata: scambio dei contatori, riepilogo e salvataggio dei totali
+async def close_daily_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Chiude la giornata e lavora sulla fotografia congelata dei contatori.
+
+    Lo scambio avviene subito, sul thread del loop: gli utilizzi registrati
+    durante l'invio del riepilogo finiscono già nella nuova giornata.
+    """
+    snapshot = daily_stats.swap()
+    print(f"Giornata {snapshot.day} chiusa: {snapshot.total} utilizzi, {snapshot.unique_users} utenti unici")
+    try:
+        await send_daily_stats(context, snapshot)
+    finally:
+        # Il salvataggio nei totali avviene anche se l'invio fallisce
+        await asyncio.to_thread(reset_daily_stats, snapshot)
+
+# Ogni quanto gli utilizzi accumulati in memoria vengono scritti nella serie oraria
+USAGE_FLUSH_INTERVAL = config.getint('stats', 'usage_flush_seconds', fallback=300)
+
+async def flush_usage_series(context: ContextTypes.DEFAULT_TYPE = None):
+    """Scrive nella serie oraria su disco gli utilizzi accumulati dall'ultimo flush."""
+    pending = usage_series.take_pending()
+    if pending:
+        await asyncio.to_thread(usage_series.apply, pending)
+
+# Ogni quanto viene salvato lo snapshot dello stato in memoria (secondi, 0 = solo all'arresto)
+SNAPSHOT_INTERVAL = config.getint('snapshot', 'interval', fallback=600)
+
+async def save_state_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """Job periodico dello snapshot dello stato."""
+    await take_state_snapshot()
+
 # Funzione per inviare le statistiche giornaliere
-async def send_daily_stats(context: ContextTypes.DEFAULT_TYPE):
-    """Invia le statistiche giornaliere all'admin se l'opzione è attivata."""
+async def send_daily_stats(context: ContextTypes.DEFAULT_TYPE, snapshot):
+    """Invia all'admin le statistiche della giornata chiusa, se l'opzione è attivata."""
     if not should_send_admin_stats():
         print("Invio statistiche giornaliere disattivato nelle preferenze admin")
         return
@@ -124,18 +166,13 @@ async def send_daily_stats(context: ContextTypes.DEFAULT_TYPE):
     
     stats_message = "📊 *Riepilogo Statistiche Giornaliere* 📊\n\n"
     
-    for cmd, count in daily_stats.items():
-        if cmd != "unique_users":
-            emoji = TIMER_DATA[cmd]["emoji"] if cmd in TIMER_DATA else "📈"
-            stats_message += f"{emoji} {cmd.capitalize()}: {count}\n"
+    for cmd, count in snapshot.items():
+        emoji = TIMER_DATA[cmd]["emoji"] if cmd in TIMER_DATA else "📈"
+        stats_message += f"{emoji} {cmd.capitalize()}: {count}\n"
     
-    stats_message += f"\n👥 Utenti unici oggi: {len(daily_stats['unique_users'])}"
+    stats_message += f"\n👥 Utenti unici oggi: {snapshot.unique_users}"
     
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text=stats_message,
-        parse_mode="Markdown"
-    )
+    await outbound_queue.send(chat_id, stats_message, parse_mode="Markdown")
     print(f"Statistiche giornaliere inviate a {chat_id}")
 
 # Comando start
@@ -146,11 +183,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = user.username or f"utente_{user_id}"
     
     # Registra l'utente se non è già registrato
-    if user_id not in registered_users:
-        registered_users.add(user_id)
-        save_registered_users()
+    if register_user(user_id):
         print(f"Nuovo utente registrato: {username} (ID: {user_id})")
     
+    # Un utente che riavvia il bot può di nuovo ricevere i broadcast
+    unblock_user(user_id)
+    
     welcome_message = (
         f"Ciao {user.mention_html()}! 👋\n\n"
         "Sono **InventoryHelpBot**, un bot che ti aiuta a tenere traccia dei timer per Inventory.\n\n"
@@ -166,9 +204,15 @@ async def send_startup_notifications(app: Application):
     print("Notifiche di avvio disabilitate")
     return
 
-async def post_init(app: Application):
-    """Runs after the application has been initialized."""
-    # Migrazione dei dati esistenti alle nuove strutture
+# Task della migrazione avviata in post_init
+startup_migration_task = None
+
+async def run_startup_migration(rebuild_timers, sync_state=True):
+    """Migrazione dei dati esistenti, eseguita in background dopo l'avvio.
+
+    Con `sync_state` falso (stato ripreso da uno snapshot fresco) salta le
+    sincronizzazioni che scorrono i profili.
+    """
     disabled_commands = {
         "avventura": disabled_avventura,
         "slot": disabled_slot,
@@ -182,17 +226,81 @@ async def post_init(app: Application):
         "compattatore": disabled_compattatore
     }
     
-    # Questa funzione ora include anche sync_timers_from_files() e recreate_active_timers()
     try:
-        await migrate_existing_data(registered_users, disabled_commands, user_stats, TIMER_DATA)
+        if sync_state:
+            await migrate_existing_data(
+                registered_users, disabled_commands, user_stats, TIMER_DATA,
+                rebuild_timers=rebuild_timers
+            )
+        # Poi, a blocchi, sposta i profili del vecchio layout piatto nelle sottocartelle
+        if player_store is json_player_store:
+            await migrate_players_layout()
     except Exception as e:
         print(f"Errore durante la migrazione dei dati: {e}")
         import traceback
         traceback.print_exc()
+
+async def post_init(app: Application):
+    """Runs after the application has been initialized."""
+    global startup_migration_task
+    # Tutti gli invii fuori dagli handler riusano il client (e il pool HTTP) dell'Application
+    register_shared_bot(app.bot)
+
+    # Stato dall'ultimo snapshot: se è fresco, cache, timer e impostazioni sono già pronti
+    start = time.perf_counter()
+    snapshot, snapshot_fresh = restore_state_snapshot()
+    if snapshot is not None:
+        kind = "completo" if snapshot_fresh else "solo contatori giornalieri (profili cambiati dopo lo snapshot)"
+        print(f"Snapshot dello stato ripristinato: {kind}, {len(snapshot['players'])} profili")
+
+    # Ripristina dal journal (o, se manca, dallo snapshot) solo le notifiche ancora in attesa
+    restored = restore_pending_notifications(snapshot["notifications"] if snapshot is not None else None)
+    if restored is not None:
+        print(f"Ripristinate {restored} notifiche in attesa.")
+    print(f"Stato di avvio pronto in {time.perf_counter() - start:.3f}s")
+
+    # Riprende lo sketch degli utenti unici di oggi salvato all'ultimo arresto
+    today = daily_stats.current()
+    saved_sketch = unique_users_store.load_day(today.day)
+    if saved_sketch is not None:
+        today.users.merge(saved_sketch)
     
+    # Avvia la coda dei messaggi in uscita, lo scheduler centrale delle notifiche
+    # e il salvataggio differito dei profili
+    outbound_queue.start()
+    notification_scheduler.start(app.bot)
+    player_writer.start()
+    player_index_writer.start()
+
+    # La migrazione gira in background: il polling parte subito. Senza journal
+    # (primo avvio) ricostruisce anche i timer attivi scorrendo l'archivio.
+    startup_migration_task = asyncio.create_task(
+        run_startup_migration(rebuild_timers=restored is None, sync_state=not snapshot_fresh)
+    )
+
     # Funzione disabilitata come richiesto
     # await send_startup_notifications(app)
 
+async def post_shutdown(app: Application):
+    """Runs after the application has been shut down."""
+    if startup_migration_task is not None and not startup_migration_task.done():
+        startup_migration_task.cancel()
+    await notification_scheduler.stop()
+    # Lascia partire i messaggi già accodati prima di chiudere il client
+    await outbound_queue.stop()
+    # Scrive su disco i profili modificati ancora in sospeso
+    await player_writer.stop()
+    await player_index_writer.stop()
+    # Con tutti i profili scritti lo snapshot è fresco: il prossimo avvio non scorre l'archivio
+    await take_state_snapshot()
+    player_storage.shutdown()
+    player_store.close()
+    await flush_usage_series()
+    # Conserva gli utenti unici della giornata in corso (l'unione degli sketch è idempotente)
+    today = daily_stats.current()
+    await asyncio.to_thread(unique_users_store.save_day, today.day, today.users.copy())
+    await shutdown_shared_bot()
+
 # Comando info
 async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = """
@@ -259,50 +367,54 @@ async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 """
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
+def build_command_router():
+    """Costruisce la tabella dei comandi testuali a partire da TIMER_DATA."""
+    timer_callbacks = {
+        "avventura": (handle_avventura_mention, toggle_avventura),
+        "slot": (handle_slot_mention, toggle_slot),
+        "borsellino": (handle_borsellino_mention, toggle_borsellino),
+        "nanoc": (handle_nanoc_mention, toggle_nanoc),
+        "nanor": (handle_nanor_mention, toggle_nanor),
+        "gica": (handle_gica_mention, toggle_gica),
+        "pozzo": (handle_pozzo_mention, toggle_pozzo),
+        "sonda": (handle_sonda_mention, toggle_sonda),
+        "forno": (handle_forno_mention, toggle_forno),
+        "compattatore": (handle_compattatore_mention, toggle_compattatore),
+    }
+    router = CommandRouter()
+    for command, data in TIMER_DATA.items():
+        start_callback, toggle_callback = timer_callbacks[command]
+        router.add_timer(command, data["aliases"], start_callback, toggle_callback)
+    router.add_command("siutilizzi", toggle_utilizzi_notifications)
+    router.add_command("noutilizzi", toggle_utilizzi_notifications)
+    return router
+
+command_router = build_command_router()
+
+async def dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Esegue il comando testuale risolto dal router, se presente."""
+    if update.message is None:
+        return
+    resolved = command_router.resolve(update.message.text)
+    if resolved is None:
+        return
+    callback, args = resolved
+    await callback(update, context, *args)
+
 def main():
     # Use post_init for startup notifications
-    app = Application.builder().token(TOKEN).post_init(post_init).build()
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .connection_pool_size(CONNECTION_POOL_SIZE)
+        # Update elaborati in parallelo; gli handler che modificano lo stato di un
+        # utente o di un messaggio si serializzano con utils.keyed_locks
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
-    # Registrazione dei handler per avventura
-    app.add_handler(MessageHandler(filters.Regex(r'^/avventura(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_avventura_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/noavventura(?:@InventoryBot)?$'), toggle_avventura))
-    
-    # Registrazione degli handler per slot
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+(?:sl|slo|slot)(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_slot_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/noslot(?:@InventoryBot)?$'), toggle_slot))
-    
-    # Registrazione degli handler per borsellino
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+(?:borsellino|borse|bors|sel|sell|sellino)(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_borsellino_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/noborsellino(?:@InventoryBot)?$'), toggle_borsellino))
-    
-    # Registrazione degli handler per nanoc
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+nanoc(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_nanoc_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nonanoc(?:@InventoryBot)?$'), toggle_nanoc))
-    
-    # Registrazione degli handler per nanor
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+nanor(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_nanor_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nonanor(?:@InventoryBot)?$'), toggle_nanor))
-    
-    # Registrazione degli handler per gica
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+gica(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_gica_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nogica(?:@InventoryBot)?$'), toggle_gica))
-    
-    # Registrazione degli handler per pozzo
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+pozzo(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_pozzo_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nopozzo(?:@InventoryBot)?$'), toggle_pozzo))
-    
-    # Registrazione degli handler per sonda
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+sonda(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_sonda_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nosonda(?:@InventoryBot)?$'), toggle_sonda))
-    
-    # Registrazione degli handler per forno
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+forno(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_forno_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/noforno(?:@InventoryBot)?$'), toggle_forno))
-    
-    # Registrazione degli handler per compattatore
-    app.add_handler(MessageHandler(filters.Regex(r'^/usa\s+(?:compattatore|comp)(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'), handle_compattatore_mention))
-    app.add_handler(MessageHandler(filters.Regex(r'^/nocompattatore(?:@InventoryBot)?$'), toggle_compattatore))
-    
     # Registrazione dei comandi utility
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("info", info_command))
@@ -314,31 +426,38 @@ def main():
     
     # Registrazione dei comandi per le statistiche
     app.add_handler(CommandHandler("utilizzi", handle_utilizzi_command))
-    app.add_handler(MessageHandler(filters.Regex(r'^/siutilizzi(?:@InventoryBot)?$'), toggle_utilizzi_notifications))
-    app.add_handler(MessageHandler(filters.Regex(r'^/noutilizzi(?:@InventoryBot)?$'), toggle_utilizzi_notifications))
     
     # Registrazione dei comandi admin
     register_admin_handlers(app)
     
+    # Comandi dei timer (/usa <alias>, /<comando>, /no<comando>) e toggle delle statistiche:
+    # un unico handler che risolve il comando con il router, registrato per ultimo
+    app.add_handler(MessageHandler(filters.TEXT, dispatch_command))
+    
     # Job Queue per statistiche giornaliere
     job_queue = app.job_queue
     now = datetime.datetime.now()
     midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
     seconds_until_midnight = (midnight - now).total_seconds()
     
-    # Reset contatori giornalieri - Meglio utilizzare una callback asincrona
-    job_queue.run_daily(
-        lambda ctx: asyncio.create_task(reset_daily_stats_async(ctx)),
-        time=datetime.time(0, 1),  # 00:01 per dare tempo al job delle statistiche di eseguire
-    )
-    
-    # Statistiche globali
+    # Statistiche globali: un unico job scambia i contatori, invia il riepilogo e salva i totali
     job_queue.run_repeating(
-        send_daily_stats,
+        close_daily_stats,
         interval=24*60*60,
         first=seconds_until_midnight
     )
     
+    # Serie oraria degli utilizzi
+    job_queue.run_repeating(
+        flush_usage_series,
+        interval=USAGE_FLUSH_INTERVAL,
+        first=USAGE_FLUSH_INTERVAL
+    )
+    
+    # Snapshot periodico dello stato in memoria
+    if SNAPSHOT_INTERVAL > 0:
+        job_queue.run_repeating(save_state_snapshot, interval=SNAPSHOT_INTERVAL, first=SNAPSHOT_INTERVAL)
+    
     # Statistiche personali
     job_queue.run_repeating(
         send_daily_personal_stats, 
@@ -352,14 +471,6 @@ def main():
     print("Bot starting polling...")
     app.run_polling()
 
-# Aggiungi questa funzione per gestire il reset in modo asincrono
-async def reset_daily_stats_async(context):
-    """Wrapper asincrono per reset_daily_stats"""
-    print("Avvio reset giornaliero statistiche...")
-    # Esegui il reset in un thread separato per non bloccare il loop principale
-    await asyncio.to_thread(reset_daily_stats)
-    print("Reset giornaliero completato con successo")
-
 # Gestore di errori
 async def error_handler(update, context):
     """Gestisce gli errori generati durante l'esecuzione degli handler."""
@@ -0,0 +1,101 @@
+"""Micro-benchmark del dispatch dei comandi testuali.
+
+Confronta il costo per update di:
+  - la vecchia catena di MessageHandler a regex (una regex per handler provata
+    in ordine, più la seconda `re.match` dentro l'handler che risponde);
+  - il router a passaggio singolo con tabelle hash (utils/command_router.py).
+
+Uso: python benchmarks/bench_command_router.py [numero_update]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.command_router import CommandRouter  # noqa: E402
+
+# Stessi alias di utils/timer_data.ALIASES (qui duplicati per non dover leggere config.ini)
+ALIASES = {
+    "avventura": [],
+    "slot": ["sl", "slo", "slot"],
+    "borsellino": ["borsellino", "borse", "bors", "sel", "sell", "sellino"],
+    "nanoc": ["nanoc"], "nanor": ["nanor"], "gica": ["gica"],
+    "pozzo": ["pozzo"], "sonda": ["sonda"], "forno": ["forno"],
+    "compattatore": ["compattatore", "comp"],
+}
+
+SAMPLE_MESSAGES = [
+    "/avventura", "/avventura 10:00", "/usa slot", "/usa sl 03:20", "/usa bors",
+    "/usa nanoc@InventoryBot", "/usa sonda 6:23:59:59", "/usa comp 12:00:00",
+    "/noforno", "/noutilizzi", "/siutilizzi@InventoryBot",
+    # Messaggi che non sono comandi dei timer: la maggior parte del traffico nei gruppi
+    "ciao a tutti", "qualcuno ha la sonda pronta?", "/timer", "/usa pozione", "ok",
+]
+
+
+def build_regex_handlers():
+    """Ricostruisce la lista di (filtro, regex interna) registrata in passato in main()."""
+    handlers = []
+    for command, aliases in ALIASES.items():
+        if aliases:
+            names = "|".join(aliases)
+            start = rf'^/usa\s+(?:{names})(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'
+            inner = rf'^/usa\s+(?:{names})(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
+        else:
+            start = rf'^/{command}(?:@InventoryBot)?(?:\s+\d+(?::\d+)+)?$'
+            inner = rf'^/{command}(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
+        handlers.append((re.compile(start), re.compile(inner)))
+        handlers.append((re.compile(rf'^/no{command}(?:@InventoryBot)?$'), None))
+    handlers.append((re.compile(r'^/siutilizzi(?:@InventoryBot)?$'), None))
+    handlers.append((re.compile(r'^/noutilizzi(?:@InventoryBot)?$'), None))
+    return handlers
+
+
+def regex_dispatch(handlers, text):
+    for pattern, inner in handlers:
+        if pattern.search(text):
+            if inner is not None:
+                return inner.match(text)
+            return True
+    return None
+
+
+def build_router():
+    router = CommandRouter()
+    for command, aliases in ALIASES.items():
+        router.add_timer(command, aliases, command, "no" + command)
+    router.add_command("siutilizzi", "utilizzi")
+    router.add_command("noutilizzi", "utilizzi")
+    return router
+
+
+def bench(name, dispatch, messages):
+    start = time.perf_counter()
+    for text in messages:
+        dispatch(text)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {elapsed * 1e9 / len(messages):8.0f} ns/update")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(n)]
+
+    handlers = build_regex_handlers()
+    router = build_router()
+
+    # Verifica che le due strategie riconoscano gli stessi messaggi
+    for text in SAMPLE_MESSAGES:
+        assert (regex_dispatch(handlers, text) is not None) == (router.resolve(text) is not None), text
+
+    print(f"Dispatch di {n} update ({len(handlers)} regex handler)")
+    bench("regex", lambda text: regex_dispatch(handlers, text), messages)
+    bench("router", router.resolve, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Confronto di memoria tra profili a dizionari annidati e PlayerRecord.
+
+Costruisce N profili nel formato JSON su disco (dizionari annidati, come
+venivano tenuti in cache) e gli stessi N profili come PlayerRecord
+(utils/player_record.py), misurando con tracemalloc la memoria allocata
+da ciascuna rappresentazione. Misura anche il costo delle conversioni.
+
+Uso: python benchmarks/bench_player_record.py [numero_utenti]
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.player_record import PlayerRecord, COMMANDS  # noqa: E402
+
+
+def make_profile(rng, user_id, day):
+    """Profilo realistico nel formato su disco (schema corrente)."""
+    now = 1_700_000_000 + rng.randrange(0, 30 * 86400)
+    return {
+        "settings": {
+            "notifications": {command: rng.random() > 0.1 for command in COMMANDS},
+            "startup_notifications": False,
+            "daily_stats": rng.random() < 0.2,
+            "preferred_notification_chat": None if rng.random() < 0.7 else -1001000000000 - rng.randrange(50),
+        },
+        "stats": {
+            command: {"today": rng.randrange(5), "total": rng.randrange(5, 5000), "day": day}
+            for command in COMMANDS
+        },
+        "last_timers": {
+            command: (now - rng.randrange(0, 86400) + rng.random()) if rng.random() < 0.6 else 0
+            for command in COMMANDS
+        },
+        "username": f"giocatore_{user_id}",
+        "register_date": now - rng.randrange(0, 365 * 86400),
+        "last_active": now,
+        "schema_version": 2,
+    }
+
+
+def measure(build):
+    """Memoria allocata da `build()` (il tempo si misura a parte: tracemalloc rallenta)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    day = 739_000
+
+    # Profili serializzati: la sorgente comune di entrambe le rappresentazioni
+    profiles = [(user_id, make_profile(rng, user_id, day)) for user_id in range(1, n + 1)]
+
+    dicts, dict_bytes = measure(lambda: {
+        # Copia profonda "fresca", come dopo json.load
+        user_id: {
+            "settings": dict(data["settings"], notifications=dict(data["settings"]["notifications"])),
+            "stats": {command: dict(record) for command, record in data["stats"].items()},
+            "last_timers": dict(data["last_timers"]),
+            "username": data["username"][:],
+            "register_date": data["register_date"],
+            "last_active": data["last_active"],
+            "schema_version": data["schema_version"],
+        }
+        for user_id, data in profiles
+    })
+    records, record_bytes = measure(lambda: {
+        user_id: PlayerRecord.from_dict(data) for user_id, data in profiles
+    })
+
+    start = time.perf_counter()
+    for _, data in profiles:
+        PlayerRecord.from_dict(data)
+    from_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for record in records.values():
+        record.to_dict()
+    to_seconds = time.perf_counter() - start
+
+    # Le conversioni non devono perdere dati
+    for user_id, data in profiles[:1000]:
+        assert records[user_id].to_dict() == data, user_id
+
+    print(f"Profili in memoria: {n}")
+    print(f"dizionari    {dict_bytes / 2**20:8.1f} MiB  ({dict_bytes / n:6.0f} B/profilo)")
+    print(f"PlayerRecord {record_bytes / 2**20:8.1f} MiB  ({record_bytes / n:6.0f} B/profilo)")
+    print(f"riduzione    {dict_bytes / record_bytes:8.1f}x")
+    print(f"from_dict    {from_seconds * 1e6 / n:8.2f} µs/profilo")
+    print(f"to_dict      {to_seconds * 1e6 / n:8.2f} µs/profilo")
+    del dicts
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Throughput di salvataggio e caricamento dei profili per ciascun codec.
+
+Genera N profili sintetici nel formato su disco (come bench_player_record.py)
+e misura per ogni codec disponibile (utils/serialization.py) serializzazione,
+deserializzazione con riconoscimento automatico del formato e dimensione
+totale. Il riferimento è il vecchio `json.dumps(..., indent=2)`.
+
+Uso: python benchmarks/bench_serialization.py [numero_utenti]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_player_record import make_profile  # noqa: E402
+from utils.serialization import available_codecs, decode, get_codec  # noqa: E402
+
+
+class IndentedJson:
+    """Il formato precedente, come riferimento."""
+
+    name = "json indent=2"
+
+    def dumps(self, data):
+        return json.dumps(data, indent=2).encode("utf-8")
+
+
+def bench(codec, profiles):
+    start = time.perf_counter()
+    payloads = [codec.dumps(data) for data in profiles]
+    save_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loaded = [decode(payload) for payload in payloads]
+    load_seconds = time.perf_counter() - start
+
+    # Il formato non deve perdere dati
+    for data, back in zip(profiles[:1000], loaded):
+        assert back == data
+    return save_seconds, load_seconds, sum(map(len, payloads))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    profiles = [make_profile(rng, user_id, 739_000) for user_id in range(1, n + 1)]
+
+    codecs = [IndentedJson()] + [get_codec(name) for name in available_codecs()]
+    print(f"Profili: {n}")
+    print(f"{'codec':<15} {'salvataggio':>14} {'caricamento':>14} {'dimensione':>12}")
+    for codec in codecs:
+        save_seconds, load_seconds, size = bench(codec, profiles)
+        print(f"{codec.name:<15} {n / save_seconds:>9.0f} pr/s {n / load_seconds:>9.0f} pr/s "
+              f"{size / n:>7.0f} B/pr")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Benchmark delle strategie di pianificazione delle notifiche.
+
+Confronta, a parità di timer in attesa:
+  - un task `asyncio.sleep` per ogni timer (approccio storico);
+  - lo scheduler a min-heap;
+  - la ruota gerarchica (giorni/ore/minuti/secondi).
+
+Uso: python benchmarks/bench_timer_scheduler.py [numero_timer]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.timer_queues import HeapTimerQueue, HierarchicalTimingWheel  # noqa: E402
+
+# Distribuzione dei cooldown simile a quella reale: molti oggetti giornalieri e settimanali
+COOLDOWNS = [15 * 60, 5 * 60, 30 * 60] + [24 * 3600] * 5 + [168 * 3600] * 2
+
+
+def make_due_times(n, now):
+    rng = random.Random(42)
+    return [now + rng.random() * rng.choice(COOLDOWNS) for _ in range(n)]
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return after - before
+
+
+def bench_asyncio_tasks(due_times, now):
+    async def sleeper(delay):
+        await asyncio.sleep(delay)
+
+    async def build():
+        tasks = [asyncio.create_task(sleeper(due - now)) for due in due_times]
+        await asyncio.sleep(0)  # lascia partire i task fino alla prima sleep
+        return tasks
+
+    async def run():
+        start = time.perf_counter()
+        tasks = await build()
+        insert_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for task in tasks[: len(tasks) // 10]:
+            task.cancel()
+        await asyncio.sleep(0)
+        cancel_time = time.perf_counter() - start
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return insert_time, cancel_time
+
+    insert_time, cancel_time = asyncio.run(run())
+
+    async def run_memory():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks = await build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return after - before
+
+    memory = asyncio.run(run_memory())
+    return insert_time, cancel_time, None, memory
+
+
+def bench_queue(queue_factory, due_times, now):
+    def build():
+        queue = queue_factory()
+        entries = []
+        for seq, due in enumerate(due_times):
+            entry = [due, seq, seq, "nanoc", "", False]
+            queue.push(entry)
+            entries.append(entry)
+        return queue, entries
+
+    start = time.perf_counter()
+    queue, entries = build()
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for entry in entries[: len(entries) // 10]:
+        queue.cancel(entry)
+    cancel_time = time.perf_counter() - start
+
+    # Simula una settimana di risvegli al secondo, svuotando la coda
+    start = time.perf_counter()
+    fired = 0
+    horizon = int(now) + 168 * 3600 + 1
+    step = 1
+    tick = int(now)
+    while tick <= horizon:
+        tick += step
+        fired += len(queue.pop_due(tick))
+        # Salta i periodi senza scadenze (come farebbe il loop dello scheduler)
+        next_due = queue.next_due()
+        if next_due is None:
+            break
+        step = max(1, int(next_due) - tick)
+    drain_time = time.perf_counter() - start
+    assert fired == len(entries) - len(entries) // 10, fired
+
+    memory = measure_memory(build)
+    return insert_time, cancel_time, drain_time, memory
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    now = time.time()
+    due_times = make_due_times(n, now)
+
+    print(f"Timer in attesa: {n:,}")
+    print(f"{'strategia':<22}{'insert s':>10}{'cancel 10% s':>14}{'drain 7g s':>12}{'memoria MB':>12}{'B/timer':>10}")
+    results = [
+        ("asyncio.sleep task", bench_asyncio_tasks(due_times, now)),
+        ("min-heap", bench_queue(HeapTimerQueue, due_times, now)),
+        ("timing wheel", bench_queue(lambda: HierarchicalTimingWheel(now=now), due_times, now)),
+    ]
+    for name, (insert_time, cancel_time, drain_time, memory) in results:
+        drain = f"{drain_time:.2f}" if drain_time is not None else "-"
+        print(f"{name:<22}{insert_time:>10.2f}{cancel_time:>14.3f}{drain:>12}{memory / 1e6:>12.1f}{memory / n:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
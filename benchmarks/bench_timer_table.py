@@ -0,0 +1,73 @@
+"""Interrogazioni sui cooldown di tutta la popolazione: dizionari vs tabella NumPy.
+
+Riempie con gli stessi avvii la tabella a dizionari (un dict per comando,
+come i vecchi `<comando>_times`) e la tabella colonnare NumPy
+(utils/timer_table.py), poi misura le interrogazioni usate da /admin_timers
+e dalla ripianificazione all'avvio.
+
+Uso: python benchmarks/bench_timer_table.py [numero_utenti]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.timer_table import DictTimerTable, TimerTable, np  # noqa: E402
+
+# Cooldown di default di utils/timer_data.COOLDOWNS (qui duplicati per non dover leggere config.ini)
+COOLDOWNS = {
+    "avventura": 15 * 60, "slot": 5 * 60, "borsellino": 30 * 60,
+    "nanoc": 24 * 3600, "nanor": 24 * 3600, "gica": 24 * 3600,
+    "pozzo": 24 * 3600, "sonda": 7 * 24 * 3600, "forno": 7 * 24 * 3600,
+    "compattatore": 24 * 3600,
+}
+
+
+def fill(tables, n, now):
+    rng = random.Random(42)
+    for user_id in range(1, n + 1):
+        for command, cooldown in COOLDOWNS.items():
+            if rng.random() < 0.6:
+                timestamp = now - rng.uniform(0, 2 * cooldown)
+                for table in tables:
+                    table.column(command)[user_id] = timestamp
+
+
+def bench(name, func, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {name:<28} {elapsed * 1e3:9.2f} ms")
+    return result
+
+
+def main():
+    if np is None:
+        print("NumPy non è installato: niente da confrontare.")
+        return
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    now = time.time()
+    dict_table = DictTimerTable(COOLDOWNS)
+    numpy_table = TimerTable(COOLDOWNS)
+    fill((dict_table, numpy_table), n, now)
+
+    edges = [0, 15 * 60, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600]
+    print(f"Timer di {n} utenti")
+    for table in (dict_table, numpy_table):
+        print("NumPy" if table.numpy else "dizionari")
+        counts = bench("cooldown_counts", lambda: table.cooldown_counts(now))
+        bench("available_within(1h)", lambda: table.available_within(3600, now))
+        bench("remaining_histogram(sonda)", lambda: table.remaining_histogram("sonda", edges, now))
+        bench("on_cooldown (tutti i comandi)",
+              lambda: [table.on_cooldown(command, now) for command in COOLDOWNS])
+        if table is dict_table:
+            expected = counts
+        else:
+            assert counts == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,18 @@ import datetime
 import time
 
 from utils.formatters import format_remaining_time
+from utils.helpers import cancel_active_task
+from utils.messaging import outbound_queue
+from utils.broadcast import run_broadcast
+from utils.keyed_locks import user_lock, callback_lock, update_locks
 from utils.timer_data import (
     TIMER_DATA, user_stats, registered_users, ADMIN_USERNAME,
-    daily_stats, daily_stats_subscribers, config, config_path
+    daily_stats, config, config_path, timer_table
+)
+from utils.player_data import player_index, player_cache, player_writer, get_timer_start, state_snapshots
+from utils.stats_manager import (
+    toggle_admin_stats_notification, should_send_admin_stats, unique_users_store, usage_series
 )
-from utils.stats_manager import toggle_admin_stats_notification, should_send_admin_stats
 
 async def is_admin(update: Update) -> bool:
     """Verifica se l'utente è un amministratore."""
@@ -37,11 +44,13 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Statistiche giornaliere
     reply_text += "*Utilizzi Oggi:*\n"
-    for cmd, count in daily_stats.items():
-        if cmd != "unique_users":
-            emoji = TIMER_DATA[cmd]["emoji"] if cmd in TIMER_DATA else "📈"
-            reply_text += f"{emoji} {cmd.capitalize()}: {count}\n"
-    reply_text += f"👥 Utenti unici oggi: {len(daily_stats['unique_users'])}\n\n"
+    today = daily_stats.current()
+    for cmd, count in today.items():
+        emoji = TIMER_DATA[cmd]["emoji"] if cmd in TIMER_DATA else "📈"
+        reply_text += f"{emoji} {cmd.capitalize()}: {count}\n"
+    reply_text += f"👥 Utenti unici oggi: {today.unique_users}\n"
+    reply_text += f"📬 Iscritti statistiche giornaliere: {len(player_index.subscribers)}\n"
+    reply_text += f"💬 Chat di notifica personalizzate: {len(player_index.chat_users)}\n\n"
     
     # Statistiche totali da file
     reply_text += "*Utilizzi Totali (persistenti):*\n"
@@ -52,6 +61,14 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             safe_cmd = cmd.replace("*", "\\*").replace("_", "\\_").replace("`", "\\`").replace("[", "\\[")
             reply_text += f"{emoji} {safe_cmd.capitalize()}: {count}\n"
     
+    # Utenti unici stimati dagli sketch HyperLogLog (lettura dei file in un thread)
+    unique = await asyncio.to_thread(unique_users_store.estimates, today.day, today.users.copy())
+    reply_text += "\n*Utenti Unici (stima):*\n"
+    reply_text += f"📅 Oggi: {unique['today']}\n"
+    reply_text += f"🗓 Ultimi 7 giorni: {unique['week']}\n"
+    reply_text += f"📆 Ultimi 30 giorni: {unique['month']}\n"
+    reply_text += f"♾ Da sempre: {unique['all_time']}\n"
+    
     # Stato impostazioni
     reply_text += "\n*Impostazioni Admin:*\n"
     status = "✅ Attivo" if should_send_admin_stats() else "❌ Disattivato"
@@ -99,7 +116,7 @@ async def admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for user_id in block:
             # Per ogni utente, aggiungi statistiche base
             user_commands = len([cmd for cmd in user_stats.get(user_id, {}) if user_stats[user_id][cmd].get("today", 0) > 0])
-            in_daily_stats = "✅" if user_id in daily_stats_subscribers else "❌"
+            in_daily_stats = "✅" if user_id in player_index.subscribers else "❌"
             response_lines.append(f"🆔 `{user_id}` - Comandi oggi: {user_commands} - Notifiche: {in_daily_stats}")
     
     # Invia l'ultimo blocco o l'unico blocco se ce n'è solo uno
@@ -127,7 +144,7 @@ async def admin_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         response_lines = [f"👤 *Informazioni Utente* `{user_id}`"]
         
         # Info base
-        subscription_status = "✅ Attivo" if user_id in daily_stats_subscribers else "❌ Disattivo"
+        subscription_status = "✅ Attivo" if user_id in player_index.subscribers else "❌ Disattivo"
         response_lines.append(f"🔔 *Abbonamento notifiche*: {subscription_status}")
         
         # Statistiche utilizzo per ogni comando
@@ -160,12 +177,11 @@ async def admin_user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         now = time.time()
         
         for command, data in TIMER_DATA.items():
-            times_dict = data["times"]
             max_cooldown = data["cooldown"]
             emoji = data["emoji"]
             
-            if user_id in times_dict:
-                last_time = times_dict[user_id]
+            last_time = get_timer_start(user_id, command)
+            if last_time:
                 elapsed = now - last_time
                 remaining = max(0, max_cooldown - elapsed)
                 
@@ -225,17 +241,14 @@ async def admin_reset_timer(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"❌ Comando '{command}' non valido.")
             return
         
-        # Resetta il timer (imposta a un tempo passato per renderlo disponibile)
-        past_time = time.time() - TIMER_DATA[command]["cooldown"] - 1
-        TIMER_DATA[command]["times"][user_id] = past_time
-        
-        # Cancella anche eventuali task attivi
-        if user_id in TIMER_DATA[command]["active"]:
-            try:
-                TIMER_DATA[command]["active"][user_id].cancel()
-            except:
-                pass
-            del TIMER_DATA[command]["active"][user_id]
+        # Stesso lock dei comandi dell'utente: il reset non si intreccia con un suo /usa in corso
+        async with user_lock(user_id):
+            # Resetta il timer (imposta a un tempo passato per renderlo disponibile)
+            past_time = time.time() - TIMER_DATA[command]["cooldown"] - 1
+            TIMER_DATA[command]["times"][user_id] = past_time
+            
+            # Cancella anche eventuali notifiche pianificate
+            await cancel_active_task(user_id, TIMER_DATA[command]["active"], command.capitalize())
         
         await update.message.reply_text(
             f"✅ Timer '{command}' resettato per l'utente {user_id}. Il comando è ora disponibile."
@@ -284,6 +297,11 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def admin_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gestisce le callback dei bottoni per il broadcast."""
+    # Un doppio tocco su "conferma" non deve avviare due broadcast
+    async with callback_lock(update.callback_query):
+        await _handle_broadcast_callback(update, context)
+
+async def _handle_broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
@@ -298,36 +316,46 @@ async def admin_broadcast_callback(update: Update, context: ContextTypes.DEFAULT
         return
     
     if action == "cancel":
+        if context.user_data:
+            context.user_data.pop("broadcast_message", None)
         await query.edit_message_text("❌ Invio del messaggio annullato.")
         return
     
-    # Procedi con l'invio del messaggio
-    message = context.user_data.get("broadcast_message", "") if context.user_data else ""
+    # Procedi con l'invio del messaggio (rimosso subito: la conferma vale una volta sola)
+    message = context.user_data.pop("broadcast_message", "") if context.user_data else ""
     if not message:
         await query.edit_message_text("❌ Errore: messaggio non trovato.")
         return
     
-    # Invia il messaggio a tutti gli utenti
-    sent_count = 0
-    error_count = 0
-    
     await query.edit_message_text("⏳ Invio messaggio in corso...")
     
-    for user_id in registered_users:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"📣 *MESSAGGIO DALL'AMMINISTRATORE*\n\n{message}",
-                parse_mode="Markdown"
-            )
-            sent_count += 1
-            # Breve pausa per evitare di raggiungere limiti di rate
-            await asyncio.sleep(0.1)
-        except Exception as e:
-            error_count += 1
-            print(f"Error sending broadcast to user {user_id}: {e}")
+    # Il broadcast gira in background così l'handler non resta occupato per tutto l'invio
+    context.application.create_task(
+        _run_broadcast_job(query, list(registered_users), message)
+    )
+
+async def _run_broadcast_job(query, recipients, message):
+    """Esegue il broadcast aggiornando periodicamente il messaggio dell'admin."""
+    async def update_progress(done, total):
+        await query.edit_message_text(f"⏳ Invio messaggio in corso... {done}/{total}")
+    
+    # Invio con parallelismo limitato; il ritmo è imposto dalla coda in uscita
+    result = await run_broadcast(
+        recipients,
+        f"📣 *MESSAGGIO DALL'AMMINISTRATORE*\n\n{message}",
+        progress=update_progress,
+        parse_mode="Markdown"
+    )
     
-    summary = f"✅ Messaggio inviato a {sent_count} utenti.\n❌ Errori: {error_count}"
+    error_count = sum(result["errors"].values())
+    summary = (
+        f"✅ Messaggio inviato a {result['sent']} utenti in {result['elapsed']:.0f}s.\n"
+        f"❌ Errori: {error_count}"
+    )
+    for error_class, count in sorted(result["errors"].items(), key=lambda item: -item[1]):
+        summary += f"\n  • {error_class}: {count}"
+    if result["skipped"]:
+        summary += f"\n🚫 Saltati (bloccati/disattivati): {result['skipped']}"
     await query.edit_message_text(summary)
 
 async def admin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -347,9 +375,9 @@ async def admin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = int(args[0])
         message = " ".join(args[1:])
         
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=f"📣 *MESSAGGIO DALL'AMMINISTRATORE*\n\n{message}",
+        await outbound_queue.send(
+            user_id,
+            f"📣 *MESSAGGIO DALL'AMMINISTRATORE*\n\n{message}",
             parse_mode="Markdown"
         )
         
@@ -360,6 +388,165 @@ async def admin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Errore nell'invio del messaggio: {str(e)}")
 
+async def admin_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra lo stato della coda dei messaggi in uscita."""
+    if not await is_admin(update):
+        return
+    
+    stats = outbound_queue.stats()
+    message = (
+        "📬 *CODA MESSAGGI IN USCITA*\n\n"
+        f"In coda: {stats['depth']} (massimo: {stats['max_depth']})\n"
+        f"Chat in attesa: {stats['chats_waiting']}\n"
+        f"Invii in corso: {stats['in_flight']}\n"
+        f"Inviati: {stats['sent']}\n"
+        f"Falliti: {stats['failed']}\n"
+        f"Ritentati (429): {stats['retried']}\n"
+        f"Throughput ultimo minuto: {stats['per_second_1m']:.2f} msg/s"
+    )
+    locks = update_locks.stats()
+    message += (
+        f"\nLock per utente/messaggio attivi: {locks['active']} "
+        f"(massimo: {locks['max_active']}, attese: {locks['contended']})"
+    )
+    if stats['paused_for'] > 0:
+        message += f"\n⏸️ Invii sospesi per altri {stats['paused_for']:.1f}s"
+    
+    await update.message.reply_text(message, parse_mode="Markdown")
+
+async def admin_cache(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mostra le metriche della cache dei profili."""
+    if not await is_admin(update):
+        return
+    
+    stats = player_cache.stats()
+    max_entries = stats['max_entries'] or "illimitato"
+    message = (
+        "🗄️ *CACHE PROFILI*\n\n"
+        f"Profili in cache: {stats['entries']} / {max_entries}\n"
+        f"Protetti: {stats['protected']} - In prova: {stats['probation']}\n"
+    )
+    if stats['max_bytes']:
+        message += f"Memoria stimata: {stats['bytes'] / 1024:.0f} / {stats['max_bytes'] / 1024:.0f} KB\n"
+    message += (
+        f"Hit: {stats['hits']} - Miss: {stats['misses']} ({stats['hit_rate'] * 100:.1f}% hit rate)\n"
+        f"Eviction: {stats['evictions']} - Bloccate (timer o modifiche in sospeso): {stats['blocked']}\n"
+        f"Profili da salvare: {player_writer.pending_count()}"
+    )
+    if state_snapshots.last_taken_at is not None:
+        age = format_remaining_time(int(time.time() - state_snapshots.last_taken_at))
+        message += (
+            f"\nUltimo snapshot dello stato: {age} fa, {state_snapshots.last_size / 1024:.0f} KB "
+            f"in {state_snapshots.last_seconds * 1000:.0f} ms"
+        )
+    
+    await update.message.reply_text(message, parse_mode="Markdown")
+
+# Intervalli dell'istogramma dei tempi residui di /admin_timers (secondi)
+TIMER_HISTOGRAM_EDGES = [0, 15 * 60, 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600]
+TIMER_HISTOGRAM_LABELS = ["< 15 min", "15 min - 1 h", "1 - 6 h", "6 - 24 h", "1 - 7 giorni"]
+
+async def admin_timers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Panoramica dei cooldown di tutti gli utenti, o distribuzione per un comando."""
+    if not await is_admin(update):
+        return
+    
+    now = time.time()
+    args = context.args
+    
+    if args:
+        command = args[0].lower()
+        if command not in TIMER_DATA:
+            await update.message.reply_text(f"❌ Comando '{command}' non valido.", parse_mode="Markdown")
+            return
+        
+        counts = timer_table.remaining_histogram(command, TIMER_HISTOGRAM_EDGES, now)
+        next_users = timer_table.users_available_within(command, 3600, now)
+        lines = [f"{TIMER_DATA[command]['emoji']} *COOLDOWN {command.upper()}*\n", "Tempo residuo:"]
+        for label, count in zip(TIMER_HISTOGRAM_LABELS, counts):
+            lines.append(f"{label}: {count}")
+        lines.append(f"\nDisponibili entro 1 ora: {len(next_users)}")
+        if next_users:
+            lines.append("Prossimi: " + ", ".join(str(user_id) for user_id in next_users[:10]))
+        await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+        return
+    
+    on_cooldown = timer_table.cooldown_counts(now)
+    within_hour = timer_table.available_within(3600, now)
+    engine = "NumPy" if timer_table.numpy else "dizionari"
+    lines = [f"⏱️ *TIMER IN COOLDOWN* ({engine})\n"]
+    for command, data in TIMER_DATA.items():
+        lines.append(
+            f"{data['emoji']} {command.capitalize()}: {on_cooldown[command]} in cooldown, "
+            f"{within_hour[command]} liberi entro 1 ora"
+        )
+    lines.append("\nUsa `/admin_timers [comando]` per la distribuzione dei tempi residui.")
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
+# Barre per il grafico compatto degli utilizzi per ora di /admin_trend
+TREND_BARS = "▁▂▃▄▅▆▇█"
+
+def _trend_summary(days, pending):
+    """Ore di punta e utilizzi giornalieri dalla serie oraria (eseguita in un thread)."""
+    usage_series.apply(pending)
+    by_hour = usage_series.peak_hours(days)
+    totals = usage_series.daily_totals(2 * days)
+    return by_hour, totals
+
+async def admin_trend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ore di punta e andamento degli utilizzi negli ultimi giorni."""
+    if not await is_admin(update):
+        return
+    
+    max_days = usage_series.hours // 48
+    try:
+        days = int(context.args[0]) if context.args else 7
+    except ValueError:
+        days = 0
+    if not 1 <= days <= max_days:
+        await update.message.reply_text(f"Utilizzo: `/admin_trend [giorni]` (da 1 a {max_days})", parse_mode="Markdown")
+        return
+    
+    # Porta nella serie anche gli utilizzi non ancora scritti dal job periodico
+    pending = usage_series.take_pending()
+    by_hour, totals = await asyncio.to_thread(_trend_summary, days, pending)
+    
+    total = sum(by_hour)
+    lines = [f"📈 *ANDAMENTO ULTIMI {days} GIORNI*\n"]
+    if not total:
+        lines.append("Nessun utilizzo registrato nel periodo.")
+        await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+        return
+    
+    # Grafico per ora del giorno e ore di punta
+    peak = max(by_hour)
+    lines.append("Utilizzi per ora (0-23):")
+    lines.append("`" + "".join(TREND_BARS[count * (len(TREND_BARS) - 1) // peak] for count in by_hour) + "`")
+    top_hours = sorted(range(24), key=lambda hour: by_hour[hour], reverse=True)[:3]
+    lines.append("Ore di punta: " + ", ".join(f"{hour:02d}:00 ({by_hour[hour]})" for hour in top_hours))
+    
+    # Giorno più intenso del periodo
+    per_day = [sum(day) for day in zip(*totals.values())][-days:]
+    busiest = max(range(days), key=lambda i: per_day[i])
+    busiest_date = datetime.date.today() - datetime.timedelta(days=days - 1 - busiest)
+    lines.append(f"Giorno più intenso: {busiest_date.strftime('%d/%m')} ({per_day[busiest]})")
+    lines.append(f"Media giornaliera: {total / days:.1f}\n")
+    
+    # Confronto con i `days` giorni precedenti, per comando
+    lines.append(f"*Rispetto ai {days} giorni precedenti:*")
+    for command, data in TIMER_DATA.items():
+        counts = totals.get(command)
+        if not counts:
+            continue
+        current, previous = sum(counts[-days:]), sum(counts[:-days])
+        if previous:
+            change = f"{(current - previous) * 100 / previous:+.0f}%"
+        else:
+            change = "nuovo" if current else "="
+        lines.append(f"{data['emoji']} {command.capitalize()}: {current} ({change})")
+    
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+
 async def admin_setstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Imposta statistiche per un utente o per tutti."""
     if not await is_admin(update):
@@ -399,19 +586,19 @@ async def admin_setstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Il valore deve essere un numero intero.", parse_mode="Markdown")
         return
     
-    from utils.player_data import load_player_data, save_player_data
+    from utils.player_data import player_storage
+    from utils.player_record import PlayerRecord, COMMAND_INDEX
     
     if target == "all":
         # Aggiorna le statistiche per tutti gli utenti
         from utils.timer_data import registered_users
         updated_count = 0
         
-        for user_id in registered_users:
+        # Copia: durante le attese possono registrarsi nuovi utenti
+        for user_id in list(registered_users):
             try:
-                data = load_player_data(user_id)
-                if command in data["stats"]:
-                    data["stats"][command][stat_type] = value
-                    save_player_data(user_id)
+                if command in COMMAND_INDEX:
+                    await player_storage.update(user_id, PlayerRecord.set_stat, command, stat_type, value)
                     updated_count += 1
             except Exception as e:
                 print(f"Error updating stats for user {user_id}: {e}")
@@ -424,11 +611,8 @@ async def admin_setstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Aggiorna le statistiche per un utente specifico
         try:
             user_id = int(target)
-            data = load_player_data(user_id)
-            
-            if command in data["stats"]:
-                data["stats"][command][stat_type] = value
-                save_player_data(user_id)
+            if command in COMMAND_INDEX:
+                await player_storage.update(user_id, PlayerRecord.set_stat, command, stat_type, value)
                 
                 await update.message.reply_text(
                     f"✅ Aggiornate statistiche '{command}.{stat_type}' a {value} per l'utente {user_id}.", 
@@ -456,11 +640,15 @@ Ecco l'elenco dei comandi disponibili solo per te, amministratore:
 
 📊 *Statistiche e Utenti*:
 `/admin_stats` - Mostra statistiche globali del bot
+`/admin_queue` - Mostra lo stato della coda dei messaggi in uscita
+`/admin_cache` - Mostra le metriche della cache dei profili
+`/admin_trend [giorni]` - Mostra ore di punta e andamento degli utilizzi
 `/admin_users` - Elenca tutti gli utenti registrati
 `/admin_user_info [user_id]` - Mostra info dettagliate su un utente specifico
 `/admin_setstats [user_id|all] [comando] [today|total] [valore]` - Imposta statistiche per un utente
 
 ⏱️ *Gestione Timer*:
+`/admin_timers [comando]` - Mostra i cooldown di tutti gli utenti
 `/admin_reset [user_id] [comando]` - Resetta un timer specifico
 
 📣 *Comunicazioni*:
@@ -488,6 +676,10 @@ def register_admin_handlers(app):
     app.add_handler(CommandHandler("admin_broadcast", admin_broadcast))
     app.add_handler(CommandHandler("admin_message", admin_message))
     app.add_handler(CommandHandler("admin_setstats", admin_setstats))
+    app.add_handler(CommandHandler("admin_queue", admin_queue))
+    app.add_handler(CommandHandler("admin_cache", admin_cache))
+    app.add_handler(CommandHandler("admin_timers", admin_timers))
+    app.add_handler(CommandHandler("admin_trend", admin_trend))
     app.add_handler(CommandHandler("info_admin", info_admin_command))
     
     # Handler per la callback del broadcast
@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -22,15 +21,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per avventura
 avventura_handler = TimerHandler("avventura")
 
-async def handle_avventura_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_avventura_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /avventura."""
-    regex_pattern = r'^/avventura(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await avventura_handler.handle_command(update, context, match)
+    await avventura_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_avventura(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per avventura."""
@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -18,15 +17,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per borsellino
 borsellino_handler = TimerHandler("borsellino")
 
-async def handle_borsellino_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_borsellino_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa borsellino."""
-    regex_pattern = r'^/usa\s+(?:borsellino|borse|bors|sel|sell|sellino)(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await borsellino_handler.handle_command(update, context, match)
+    await borsellino_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_borsellino(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per borsellino."""
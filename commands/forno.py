@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -17,15 +16,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per forno
 forno_handler = TimerHandler("forno")
 
-async def handle_forno_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_forno_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa forno."""
-    regex_pattern = r'^/usa\s+forno(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await forno_handler.handle_command(update, context, match)
+    await forno_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_forno(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per forno."""
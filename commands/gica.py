@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -17,15 +16,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per gica
 gica_handler = TimerHandler("gica")
 
-async def handle_gica_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_gica_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa gica."""
-    regex_pattern = r'^/usa\s+gica(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await gica_handler.handle_command(update, context, match)
+    await gica_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_gica(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per gica."""
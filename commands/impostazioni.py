@@ -3,11 +3,11 @@ import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 
+from utils.player_record import PlayerRecord
+from utils.keyed_locks import callback_lock
 from utils.player_data import (
-    load_player_data, update_player_notification_setting, 
-    update_daily_stats_subscription, update_startup_notification_setting,
-    get_startup_notification_status, update_preferred_notification_chat,
-    get_preferred_notification_chat
+    player_storage, update_startup_notification_setting,
+    get_startup_notification_status
 )
 from utils.timer_data import (
     TIMER_DATA, disabled_avventura, disabled_slot, disabled_borsellino,
@@ -21,9 +21,8 @@ async def impostazioni_command(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id = user.id
     
     # Carica i dati dell'utente
-    data = load_player_data(user_id)
-    settings = data.get("settings", {})
-    notifications = settings.get("notifications", {})
+    data = await player_storage.get(user_id)
+    notifications = data.notifications()
     
     # Crea la tastiera inline con una struttura più compatta
     keyboard = []
@@ -61,7 +60,7 @@ async def impostazioni_command(update: Update, context: ContextTypes.DEFAULT_TYP
     keyboard.append(row4)
     
     # Riga 5: Altre impostazioni
-    daily_stats = settings.get("daily_stats", False)
+    daily_stats = data.daily_stats
     keyboard.append([
         InlineKeyboardButton(
             f"{'✅' if daily_stats else '❌'} Stats Giornaliere", 
@@ -70,7 +69,7 @@ async def impostazioni_command(update: Update, context: ContextTypes.DEFAULT_TYP
     ])
     
     # Riga 6: Impostazioni per il gruppo di notifiche
-    preferred_chat = get_preferred_notification_chat(user_id)
+    preferred_chat = data.preferred_notification_chat
     is_current_chat = preferred_chat == update.effective_chat.id if preferred_chat else False
     
     keyboard.append([
@@ -96,6 +95,11 @@ async def impostazioni_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gestisce le callback dei pulsanti delle impostazioni."""
+    # Con gli update concorrenti, i tocchi sullo stesso messaggio vengono gestiti uno alla volta
+    async with callback_lock(update.callback_query):
+        await _handle_impostazioni_callback(update, context)
+
+async def _handle_impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
     callback_data = query.data
@@ -106,25 +110,19 @@ async def impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         if callback_data.startswith("toggle_notif_"):
             command = callback_data.replace("toggle_notif_", "")
-            player_data = load_player_data(user_id)
-            current_setting = player_data["settings"]["notifications"].get(command, True)
-            
-            # Aggiorna l'impostazione (inverti il valore corrente)
-            update_player_notification_setting(user_id, command, not current_setting)
+            # Inverte l'impostazione corrente in un'unica modifica del profilo
+            enabled = await player_storage.update(user_id, PlayerRecord.toggle_notification, command)
             
             # Fornisci un feedback specifico
-            status = "attivate" if not current_setting else "disattivate"
+            status = "attivate" if enabled else "disattivate"
             await query.answer(f"Notifiche {command} {status}", show_alert=False)
             
         elif callback_data == "toggle_daily_stats":
-            player_data = load_player_data(user_id)
-            current_setting = player_data["settings"].get("daily_stats", False)
-            
             # Aggiorna l'impostazione
-            update_daily_stats_subscription(user_id, not current_setting)
+            subscribed = await player_storage.update(user_id, PlayerRecord.toggle_daily_stats)
             
             # Fornisci un feedback specifico
-            status = "attivate" if not current_setting else "disattivate"
+            status = "attivate" if subscribed else "disattivate"
             await query.answer(f"Statistiche giornaliere {status}", show_alert=False)
     except Exception as e:
         print(f"Errore durante l'elaborazione della callback: {e}")
@@ -134,9 +132,9 @@ async def impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TY
     # NON chiamare impostazioni_command che causa errore con callback
     try:
         username = update.effective_user.username or f"utente_{user_id}"
-        player_data = load_player_data(user_id)
-        notification_settings = player_data["settings"]["notifications"]
-        daily_stats_enabled = player_data["settings"].get("daily_stats", False)
+        player_data = await player_storage.get(user_id)
+        notification_settings = player_data.notifications()
+        daily_stats_enabled = player_data.daily_stats
         
         # Prepara il messaggio con le impostazioni attuali
         response_lines = [f"⚙️ *Impostazioni di @{username}* ⚙️\n"]
@@ -155,7 +153,7 @@ async def impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TY
         response_lines.append(f"Notifiche statistiche giornaliere: {stats_status}")
         
         # Info registrazione
-        register_date = datetime.datetime.fromtimestamp(player_data["register_date"])
+        register_date = datetime.datetime.fromtimestamp(player_data.register_date)
         response_lines.append(f"\n📆 *Registrato dal:* {register_date.strftime('%d/%m/%Y')}")
         
         # Pulsanti per modificare le impostazioni
@@ -227,6 +225,11 @@ async def impostazioni_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gestisce i callback dei pulsanti inline con feedback immediato."""
+    # Un toggle alla volta per messaggio: la tastiera ridisegnata riflette sempre l'ultimo stato
+    async with callback_lock(update.callback_query):
+        await _handle_button(update, context)
+
+async def _handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
     callback_data = query.data
@@ -244,7 +247,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_title = update.effective_chat.title if chat_type != "private" else "Chat privata"
         
         # Aggiorna le impostazioni
-        update_preferred_notification_chat(user_id, chat_id)
+        await player_storage.update(user_id, PlayerRecord.set_preferred_chat, chat_id)
         
         # Feedback immediato
         await query.answer(f"Notifiche impostate in: {chat_title}", show_alert=True)
@@ -253,19 +256,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update_settings_message(query, user_id)
         return
     
-    # Carica i dati utente
-    data = load_player_data(user_id)
-    
     if callback_data.startswith("toggle_"):
         option = callback_data[7:]  # Rimuovi "toggle_" per ottenere l'opzione
         
         if option in TIMER_DATA:
-            # Toggle per le notifiche di comando
-            current = data.get("settings", {}).get("notifications", {}).get(option, True)
-            new_value = not current
-            
-            # Aggiorna le impostazioni
-            update_player_notification_setting(user_id, option, new_value)
+            # Toggle per le notifiche di comando, in un'unica modifica del profilo
+            new_value = await player_storage.update(user_id, PlayerRecord.toggle_notification, option)
             
             # Applica anche al sistema in memoria (compatibilità)
             disabled_set = TIMER_DATA[option]["disabled"]
@@ -282,11 +278,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         elif option == "daily_stats":
             # Toggle per le statistiche giornaliere
-            current = data.get("settings", {}).get("daily_stats", False)
-            new_value = not current
-            
-            # Aggiorna le impostazioni
-            update_daily_stats_subscription(user_id, new_value)
+            new_value = await player_storage.update(user_id, PlayerRecord.toggle_daily_stats)
             
             # Feedback immediato
             status = "attivate" if new_value else "disattivate"
@@ -298,9 +290,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def update_settings_message(query, user_id):
     """Aggiorna il messaggio delle impostazioni con lo stato corrente."""
     # Carica i dati dell'utente
-    data = load_player_data(user_id)
-    settings = data.get("settings", {})
-    notifications = settings.get("notifications", {})
+    data = await player_storage.get(user_id)
+    notifications = data.notifications()
     
     # Ricrea la tastiera inline con lo stato aggiornato
     keyboard = []
@@ -338,7 +329,7 @@ async def update_settings_message(query, user_id):
     keyboard.append(row4)
     
     # Riga 5: Altre impostazioni
-    daily_stats = settings.get("daily_stats", False)
+    daily_stats = data.daily_stats
     keyboard.append([
         InlineKeyboardButton(
             f"{'✅' if daily_stats else '❌'} Stats Giornaliere", 
@@ -347,7 +338,7 @@ async def update_settings_message(query, user_id):
     ])
     
     # Riga 6: Impostazioni per il gruppo di notifiche
-    preferred_chat = get_preferred_notification_chat(user_id)
+    preferred_chat = data.preferred_notification_chat
     is_current_chat = preferred_chat == query.message.chat.id if preferred_chat else False
     
     keyboard.append([
@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -17,17 +16,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per nanoc
 nanoc_handler = TimerHandler("nanoc")
 
-async def handle_nanoc_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_nanoc_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa nanoc."""
-    print(f"[Nanoc] Received: '{update.message.text}'")
-    regex_pattern = r'^/usa\s+nanoc(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        print("[Nanoc] Regex did not match.")
-        return
-
-    await nanoc_handler.handle_command(update, context, match)
+    await nanoc_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_nanoc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per nanoc."""
@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -17,15 +16,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per pozzo
 pozzo_handler = TimerHandler("pozzo")
 
-async def handle_pozzo_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_pozzo_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa pozzo."""
-    regex_pattern = r'^/usa\s+pozzo(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await pozzo_handler.handle_command(update, context, match)
+    await pozzo_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_pozzo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per pozzo."""
@@ -1,5 +1,4 @@
 import asyncio
-import re
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -17,15 +16,9 @@ from utils.timer_handler import TimerHandler
 # Crea un'istanza dell'handler per slot
 slot_handler = TimerHandler("slot")
 
-async def handle_slot_mention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_slot_mention(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str=None, total_seconds=None):
     """Gestisce il comando /usa slot."""
-    regex_pattern = r'^/usa\s+(?:sl|slo|slot)(?:@InventoryBot)?(?:\s+(\d+(?::\d+)+))?$'
-    match = re.match(regex_pattern, update.message.text)
-
-    if not match:
-        return
-
-    await slot_handler.handle_command(update, context, match)
+    await slot_handler.handle_command(update, context, time_str, total_seconds)
 
 async def toggle_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Attiva/disattiva le notifiche per slot."""
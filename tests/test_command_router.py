@@ -0,0 +1,74 @@
+"""Il router deve accettare e rifiutare gli stessi testi delle vecchie regex dei MessageHandler."""
+import pytest
+
+from utils.command_router import CommandRouter
+
+
+def start_avventura(): pass
+def toggle_avventura(): pass
+def start_slot(): pass
+def toggle_slot(): pass
+def start_compattatore(): pass
+def toggle_compattatore(): pass
+def toggle_utilizzi(): pass
+
+
+@pytest.fixture
+def router():
+    router = CommandRouter()
+    router.add_timer("avventura", (), start_avventura, toggle_avventura)
+    router.add_timer("slot", ("sl", "slo", "slot"), start_slot, toggle_slot)
+    router.add_timer("compattatore", ("compattatore", "comp"), start_compattatore, toggle_compattatore)
+    router.add_command("siutilizzi", toggle_utilizzi)
+    return router
+
+
+def test_usa_alias_with_bot_suffix_and_time(router):
+    assert router.resolve("/usa comp@InventoryBot 1:00:00") == (start_compattatore, ("1:00:00", 3600))
+
+
+def test_usa_alias_without_time(router):
+    assert router.resolve("/usa slo") == (start_slot, ())
+
+
+def test_command_with_time(router):
+    # mm:ss ha la forma ammessa dalla regex, ma parse_dhms_time accetta solo hh:mm:ss e dd:hh:mm:ss
+    assert router.resolve("/avventura 05:00") == (start_avventura, ("05:00", None))
+
+
+def test_command_with_full_time(router):
+    assert router.resolve("/avventura 00:01:05:00") == (start_avventura, ("00:01:05:00", 3900))
+
+
+def test_command_with_bot_suffix(router):
+    assert router.resolve("/avventura@InventoryBot") == (start_avventura, ())
+
+
+def test_toggle(router):
+    assert router.resolve("/noslot") == (toggle_slot, ())
+    assert router.resolve("/noslot@InventoryBot") == (toggle_slot, ())
+
+
+@pytest.mark.parametrize("text", [
+    "/avventura extra",
+    "/avventura 05:00 extra",
+    "/avventura 5",
+    "/usa",
+    "/usa@InventoryBot",
+    "/usa sconosciuto",
+    "/usa comp 1:00 2:00",
+    "/noslot 05:00",
+    "/siutilizzi 05:00",
+    "/slot",
+    "/avventura@AltroBot",
+    "avventura",
+    "",
+])
+def test_rejected(router, text):
+    assert router.resolve(text) is None
+
+
+def test_invalid_time_keeps_text(router):
+    # Forma accettata dalla regex ma valori fuori intervallo: l'handler risponde con l'errore
+    assert router.resolve("/usa comp 1:99:00") == (start_compattatore, ("1:99:00", None))
+    assert router.resolve("/avventura 1:2:3:4:5") == (start_avventura, ("1:2:3:4:5", None))
@@ -0,0 +1,59 @@
+import datetime
+
+import pytest
+
+from utils.daily_counters import DailyCounters
+from utils.hyperloglog import HyperLogLog
+
+COMMANDS = ("avventura", "slot")
+TODAY = datetime.date(2026, 10, 18)
+
+
+def sketch_of(ids):
+    sketch = HyperLogLog()
+    for user_id in ids:
+        sketch.add(user_id)
+    return sketch
+
+
+@pytest.fixture
+def counters():
+    counters = DailyCounters(COMMANDS)
+    counters.swap(TODAY)
+    return counters
+
+
+def test_swap_freezes_closed_day(counters):
+    counters.record("slot", 1)
+    counters.record("slot", 2)
+    closed = counters.swap(TODAY + datetime.timedelta(days=1))
+    assert closed.day == TODAY and closed.frozen
+    assert dict(closed.items()) == {"avventura": 0, "slot": 2}
+    assert closed.unique_users == 2
+    with pytest.raises(TypeError):
+        closed.counts["slot"] = 0
+    assert counters.current().total == 0
+
+
+def test_restore_same_day_adds_counts(counters):
+    counters.record("slot", 1)
+    assert counters.restore(TODAY, {"slot": 3, "sconosciuto": 5}, sketch_of([2, 3])) is None
+    assert dict(counters.current().items()) == {"avventura": 0, "slot": 4}
+    assert counters.current().unique_users == 3
+
+
+def test_restore_past_day_returns_closed_buffer(counters):
+    # Riavvio dopo la mezzanotte: la giornata precedente va salvata, non scartata
+    counters.record("avventura", 1)
+    yesterday = TODAY - datetime.timedelta(days=1)
+    closed = counters.restore(yesterday, {"slot": 7}, sketch_of([5, 6]))
+    assert closed.day == yesterday and closed.frozen
+    assert dict(closed.items()) == {"avventura": 0, "slot": 7}
+    assert closed.unique_users == 2
+    # La giornata in corso non cambia
+    assert dict(counters.current().items()) == {"avventura": 1, "slot": 0}
+
+
+def test_restore_future_day_is_ignored(counters):
+    assert counters.restore(TODAY + datetime.timedelta(days=1), {"slot": 7}) is None
+    assert counters.current().total == 0
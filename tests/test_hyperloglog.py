@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+
+from utils.hyperloglog import HyperLogLog, SketchStore
+
+
+def sketch_of(ids):
+    sketch = HyperLogLog()
+    for user_id in ids:
+        sketch.add(user_id)
+    return sketch
+
+
+def test_empty():
+    assert HyperLogLog().count() == 0
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50_000])
+def test_estimate_within_error(n):
+    # Errore tipico ~1.6% con p=12: 5% lascia un ampio margine con ID deterministici
+    assert sketch_of(range(n)).count() == pytest.approx(n, rel=0.05)
+
+
+def test_duplicates_are_not_counted():
+    sketch = sketch_of(range(1000))
+    before = sketch.count()
+    for user_id in range(1000):
+        sketch.add(user_id)
+    assert sketch.count() == before
+
+
+def test_merge_is_union_and_idempotent():
+    a = sketch_of(range(0, 6000))
+    b = sketch_of(range(4000, 10_000))
+    union = a.copy().merge(b)
+    assert union.registers == sketch_of(range(10_000)).registers
+    assert union.copy().merge(b).registers == union.registers
+    # merge non modifica l'altro sketch
+    assert b.registers == sketch_of(range(4000, 10_000)).registers
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=3)
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=12, registers=bytes(10))
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+def test_bytes_round_trip():
+    sketch = sketch_of(range(500))
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.precision == sketch.precision
+    assert restored.registers == sketch.registers
+
+
+def test_store_windows(tmp_path):
+    store = SketchStore(str(tmp_path))
+    today = datetime.date(2026, 10, 18)
+    # Ogni giorno 100 utenti nuovi, per 40 giorni
+    for offset in range(40, 0, -1):
+        day = today - datetime.timedelta(days=offset)
+        start = (40 - offset) * 100
+        store.save_day(day, sketch_of(range(start, start + 100)))
+
+    live = sketch_of(range(4000, 4100))
+    estimates = store.estimates(today, live)
+    assert estimates["today"] == pytest.approx(100, rel=0.05)
+    assert estimates["week"] == pytest.approx(700, rel=0.05)
+    assert estimates["month"] == pytest.approx(3000, rel=0.05)
+    assert estimates["all_time"] == pytest.approx(4100, rel=0.05)
+
+
+def test_store_save_day_merges(tmp_path):
+    store = SketchStore(str(tmp_path))
+    day = datetime.date(2026, 10, 18)
+    store.save_day(day, sketch_of(range(100)))
+    # Un secondo salvataggio dello stesso giorno (es. al riavvio) si unisce al primo
+    all_time = store.save_day(day, sketch_of(range(50, 200)))
+    assert store.load_day(day).registers == sketch_of(range(200)).registers
+    assert all_time.registers == sketch_of(range(200)).registers
+
+
+def test_store_ignores_unreadable_files(tmp_path):
+    store = SketchStore(str(tmp_path))
+    day = datetime.date(2026, 10, 18)
+    (tmp_path / f"{day.isoformat()}.hll").write_bytes(b"\x0c\x00")
+    assert store.load_day(day) is None
+    assert store.load_day(day - datetime.timedelta(days=1)) is None
@@ -0,0 +1,52 @@
+import pytest
+
+from utils.json_store import JsonPlayerStore
+from utils.serialization import CodecUnavailableError, decode, detect_format, msgpack
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JsonPlayerStore(tmp_path)
+
+
+def write_raw(store, user_id, payload):
+    path = store.get_shard_path(user_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(payload)
+    return path
+
+
+def test_round_trip(store):
+    store.write_batch([(1, store.encode(1, {"username": "a", "last_timers": {"slot": 10}}))])
+    assert store.read(1) == {"username": "a", "last_timers": {"slot": 10}}
+    assert store.read(2) is None
+
+
+@pytest.mark.parametrize("payload", [b"", b"   \n", b"\x00\x00", b"\xef\xbb\xbf{}", b'{"username": "a"'])
+def test_corrupt_profile_is_quarantined(store, tmp_path, payload):
+    path = write_raw(store, 7, payload)
+    assert store.read(7) is None
+    assert not path.exists()
+    quarantined = list((tmp_path / "quarantine").glob("7.*.json"))
+    assert [q.read_bytes() for q in quarantined] == [payload]
+
+
+@pytest.mark.parametrize("payload", [b"", b"  ", b"\x00", b"\xef\xbb\xbf{}", b"\x01"])
+def test_unrecognized_payload_is_value_error(payload):
+    assert detect_format(payload) is None
+    with pytest.raises(ValueError):
+        decode(payload)
+
+
+def test_msgpack_detection():
+    assert detect_format(b"\x81\xa1a\x01") == "msgpack"
+    assert detect_format(b"\xde\x00\x10") == "msgpack"
+    assert detect_format(b' \n{"a": 1}') == "json"
+
+
+@pytest.mark.skipif(msgpack is not None, reason="msgpack installato")
+def test_msgpack_without_library_is_not_quarantined(store):
+    path = write_raw(store, 7, b"\x81\xa1a\x01")
+    with pytest.raises(CodecUnavailableError):
+        store.read(7)
+    assert path.exists()
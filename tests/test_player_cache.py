@@ -0,0 +1,69 @@
+from utils.player_cache import PlayerCache
+
+
+def test_lookup_promotes_and_counts():
+    cache = PlayerCache(max_entries=10)
+    cache[1] = {"a": 1}
+    assert cache.lookup(1) == {"a": 1}
+    assert cache.lookup(2) is None
+    stats = cache.stats()
+    assert (stats["protected"], stats["probation"]) == (1, 0)
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_get_does_not_promote():
+    cache = PlayerCache(max_entries=10)
+    cache[1] = {}
+    assert cache.get(1) == {}
+    assert cache.stats()["probation"] == 1
+
+
+def test_scan_does_not_evict_protected():
+    cache = PlayerCache(max_entries=10, protected_ratio=0.5)
+    for user_id in range(5):
+        cache[user_id] = {}
+        cache.lookup(user_id)
+    # Una scansione di molti profili letti una sola volta scaccia solo il segmento di prova
+    for user_id in range(100, 200):
+        cache[user_id] = {}
+    assert len(cache) == 10
+    assert all(user_id in cache for user_id in range(5))
+    assert cache.evictions == 95
+
+
+def test_protected_overflow_is_demoted():
+    cache = PlayerCache(max_entries=4, protected_ratio=0.5)
+    for user_id in range(3):
+        cache[user_id] = {}
+        cache.lookup(user_id)
+    stats = cache.stats()
+    assert (stats["protected"], stats["probation"]) == (2, 1)
+    # Il meno recente del segmento protetto torna in prova, non viene scartato
+    assert 0 in cache
+
+
+def test_blocked_entries_are_kept():
+    dirty = {1, 2}
+    requested = []
+    cache = PlayerCache(max_entries=2, can_evict=lambda user_id: user_id not in dirty,
+                        on_blocked=requested.append)
+    cache[1] = {}
+    cache[2] = {}
+    cache[3] = {}
+    # Nessuno scartabile tranne il nuovo, che però il chiamante sta per usare
+    assert len(cache) == 3
+    assert set(requested) == {1, 2}
+    dirty.clear()
+    assert cache.shrink() == 1
+    assert len(cache) == 2
+
+
+def test_byte_budget():
+    cache = PlayerCache(max_bytes=2000)
+    for user_id in range(50):
+        cache[user_id] = {"name": "x" * 100}
+    assert 0 < cache.bytes <= 2000
+    assert 49 in cache and 0 not in cache
+    data = cache.pop(49)
+    assert data == {"name": "x" * 100}
+    assert 49 not in cache
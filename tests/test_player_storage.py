@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+import pytest
+
+# player_data legge config.ini all'importazione (token del bot compreso)
+if not os.path.exists(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")):
+    pytest.skip("config.ini non presente", allow_module_level=True)
+
+from utils import player_data  # noqa: E402
+from utils.player_record import PlayerRecord  # noqa: E402
+
+USER_ID = -424242
+
+
+@pytest.fixture
+def cached_record():
+    record = PlayerRecord(register_date=0, last_active=0)
+    player_data.player_cache[USER_ID] = record
+    yield record
+    player_data.player_cache.pop(USER_ID)
+
+
+def test_get_rolls_cached_record_past_midnight(monkeypatch, cached_record):
+    today = player_data.current_day()
+    cached_record.increment("slot", today)
+    assert asyncio.run(player_data.player_storage.get(USER_ID)).get_stat("slot") == (1, 1)
+
+    monkeypatch.setattr(player_data, "current_day", lambda: today + 1)
+    record = asyncio.run(player_data.player_storage.get(USER_ID))
+    assert record is cached_record
+    assert record.get_stat("slot") == (0, 1)
@@ -0,0 +1,46 @@
+import pytest
+
+from utils.rate_limit import TokenBucket
+
+
+def make_bucket(rate, capacity, now=100.0):
+    bucket = TokenBucket(rate, capacity)
+    bucket.updated = now
+    return bucket
+
+
+def test_burst_up_to_capacity():
+    bucket = make_bucket(rate=1, capacity=3)
+    for _ in range(3):
+        assert bucket.delay(100.0) == 0.0
+        bucket.consume(100.0)
+    assert bucket.delay(100.0) == pytest.approx(1.0)
+
+
+def test_refill_at_rate():
+    bucket = make_bucket(rate=2, capacity=1)
+    bucket.consume(100.0)
+    assert bucket.delay(100.0) == pytest.approx(0.5)
+    assert bucket.delay(100.25) == pytest.approx(0.25)
+    assert bucket.delay(100.5) == 0.0
+
+
+def test_refill_is_capped():
+    bucket = make_bucket(rate=10, capacity=2)
+    bucket.consume(100.0)
+    bucket.consume(100.0)
+    assert not bucket.is_full(100.1)
+    assert bucket.is_full(200.0)
+    assert bucket.tokens == 2
+
+
+def test_group_rate_spacing():
+    # 20 messaggi al minuto per gruppo: dopo il primo, uno ogni 3 secondi
+    bucket = make_bucket(rate=20 / 60, capacity=1)
+    now = 100.0
+    sent = []
+    for _ in range(5):
+        now += bucket.delay(now)
+        bucket.consume(now)
+        sent.append(now)
+    assert [b - a for a, b in zip(sent, sent[1:])] == pytest.approx([3.0] * 4)
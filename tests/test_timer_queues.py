@@ -0,0 +1,107 @@
+import random
+import time
+
+import pytest
+
+from utils.timer_queues import TIMER_QUEUES, COMMAND, SEQ, HierarchicalTimingWheel
+
+
+def make_entry(seq, due_at, command="slot"):
+    return [due_at, seq, 1000 + seq, command, "", False]
+
+
+@pytest.fixture
+def now():
+    # La ruota vuota si riallinea all'ora corrente: i test partono da lì
+    return int(time.time())
+
+
+@pytest.mark.parametrize("mode", sorted(TIMER_QUEUES))
+def test_pop_due_returns_only_expired(mode, now):
+    queue = TIMER_QUEUES[mode]()
+    late = make_entry(1, now + 30)
+    soon = make_entry(2, now + 5)
+    queue.push(late)
+    queue.push(soon)
+    assert len(queue) == 2
+    assert queue.pop_due(now + 4) == []
+    assert queue.pop_due(now + 5) == [soon]
+    assert queue.pop_due(now + 60) == [late]
+    assert len(queue) == 0
+
+
+@pytest.mark.parametrize("mode", sorted(TIMER_QUEUES))
+def test_cancel_marks_entry(mode, now):
+    queue = TIMER_QUEUES[mode]()
+    entry = make_entry(1, now + 10)
+    other = make_entry(2, now + 10)
+    queue.push(entry)
+    queue.push(other)
+    queue.cancel(entry)
+    # Lo scheduler usa COMMAND None per ignorare una seconda cancellazione
+    assert entry[COMMAND] is None
+    assert len(queue) == 1
+    assert queue.entries() == [other]
+    assert queue.pop_due(now + 10) == [other]
+
+
+def test_wheel_expires_across_levels(now):
+    wheel = HierarchicalTimingWheel(now)
+    # Secondi, minuti, ore, giorni e oltre la ruota dei giorni
+    offsets = [1, 59, 61, 3599, 3601, 86399, 86401, 2 * 86400 + 7, 70 * 86400 + 5]
+    for seq, offset in enumerate(offsets):
+        wheel.push(make_entry(seq, now + offset))
+
+    # Come il loop dello scheduler: si dorme fino a next_due() e si estrae ciò che è scaduto
+    expired = {}
+    wakeups = 0
+    while (tick := wheel.next_due()) is not None:
+        wakeups += 1
+        for entry in wheel.pop_due(tick):
+            expired[entry[SEQ]] = tick - now
+    assert expired == dict(enumerate(offsets))
+    # Un risveglio per scadenza più i cascading, non uno al secondo
+    assert wakeups < 200
+    assert len(wheel) == 0
+
+
+def test_wheel_sleeps_until_far_deadline(now):
+    wheel = HierarchicalTimingWheel(now)
+    wheel.push(make_entry(1, now + 7 * 86400))
+    first = wheel.next_due()
+    assert first > now + 3600
+    # Un timer più vicino deve risvegliare lo scheduler, uno più lontano no
+    assert wheel.push(make_entry(2, now + 30))
+    # Al più presto la scadenza stessa, o il cascading del minuto che la contiene
+    assert now < wheel.next_due() <= now + 30
+    assert not wheel.push(make_entry(3, now + 8 * 86400))
+
+
+def test_wheel_next_due_empty(now):
+    wheel = HierarchicalTimingWheel(now)
+    assert wheel.next_due() is None
+    entry = make_entry(1, now + 10)
+    wheel.push(entry)
+    wheel.cancel(entry)
+    assert wheel.next_due() is None
+
+
+def test_wheel_matches_heap(now):
+    rng = random.Random(7)
+    heap, wheel = TIMER_QUEUES["heap"](), TIMER_QUEUES["wheel"](now)
+    pairs = []
+    for seq in range(500):
+        # Scadenze intere: la ruota ha la risoluzione di un secondo
+        due_at = now + rng.randint(1, 3 * 3600)
+        pair = (make_entry(seq, due_at), make_entry(seq, due_at))
+        heap.push(pair[0])
+        wheel.push(pair[1])
+        pairs.append(pair)
+    for heap_entry, wheel_entry in rng.sample(pairs, 100):
+        heap.cancel(heap_entry)
+        wheel.cancel(wheel_entry)
+    assert len(heap) == len(wheel) == 400
+
+    for t in range(now + 60, now + 3 * 3600 + 60, 60):
+        assert {e[SEQ] for e in wheel.pop_due(t)} == {e[SEQ] for e in heap.pop_due(t)}
+    assert len(heap) == len(wheel) == 0
@@ -0,0 +1,81 @@
+"""Ricodifica in blocco i profili della directory players in un altro formato.
+
+Legge ogni profilo (in qualsiasi formato supportato) e lo riscrive con il
+codec richiesto, con le stesse scritture atomiche del bot. I profili già nel
+formato di destinazione non vengono toccati. Da eseguire a bot fermo:
+il bot potrebbe altrimenti riscrivere un profilo mentre viene ricodificato.
+
+Uso: python tools/reencode_players.py <players_dir> [--codec auto|json|orjson|msgpack] [--batch 500] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_store import JsonPlayerStore  # noqa: E402
+from utils.serialization import CodecUnavailableError, available_codecs, decode, get_codec  # noqa: E402
+from utils.write_behind import PartialWriteError  # noqa: E402
+
+
+def write_batch(store, batch):
+    """Scrive un blocco e restituisce il numero di profili non salvati."""
+    try:
+        store.write_batch(batch)
+    except PartialWriteError as e:
+        return len(e.keys)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricodifica i profili dei giocatori")
+    parser.add_argument("players_dir", type=Path)
+    parser.add_argument("--codec", default="auto", help=f"disponibili: auto, {', '.join(available_codecs())}")
+    parser.add_argument("--batch", type=int, default=500, help="profili per blocco di scrittura")
+    parser.add_argument("--dry-run", action="store_true", help="conta soltanto i profili da ricodificare")
+    args = parser.parse_args()
+
+    if not args.players_dir.is_dir():
+        parser.error(f"{args.players_dir} non è una directory")
+
+    store = JsonPlayerStore(args.players_dir, get_codec(args.codec))
+    print(f"Codec di destinazione: {store.codec.name}")
+
+    start = time.perf_counter()
+    scanned = changed = failed = 0
+    bytes_before = bytes_after = 0
+    batch = []
+    for user_id in store.iter_user_ids():
+        scanned += 1
+        try:
+            with open(store.get_player_file_path(user_id), 'rb') as f:
+                payload = f.read()
+            encoded = store.codec.dumps(decode(payload))
+        except (OSError, ValueError, CodecUnavailableError) as e:
+            print(f"Profilo {user_id} saltato: {e}")
+            failed += 1
+            continue
+        bytes_before += len(payload)
+        bytes_after += len(encoded)
+        if encoded == payload:
+            continue
+        changed += 1
+        if not args.dry_run:
+            batch.append((user_id, encoded))
+            if len(batch) >= args.batch:
+                failed += write_batch(store, batch)
+                batch = []
+    if batch:
+        failed += write_batch(store, batch)
+
+    elapsed = time.perf_counter() - start
+    action = "da ricodificare" if args.dry_run else "ricodificati"
+    print(f"Profili letti: {scanned}, {action}: {changed}, saltati: {failed} ({elapsed:.1f}s)")
+    if bytes_before:
+        print(f"Dimensione totale: {bytes_before / 2**20:.1f} MiB -> {bytes_after / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logger import logger
+from utils.serialization import CodecUnavailableError
+
+
+class AsyncPlayerStorage:
+    """Facciata asincrona sui profili dei giocatori.
+
+    `await get(user_id)` e `await update(user_id, fn)` non bloccano il loop:
+    la lettura di un profilo non in cache avviene in un piccolo pool di
+    thread dedicato, mentre conversione, cache e modifiche restano sul
+    thread del loop. Le operazioni sullo stesso utente vengono eseguite una
+    alla volta in ordine di arrivo (FIFO), quindi due aggiornamenti
+    concorrenti non possono invertirsi né perdere modifiche; utenti diversi
+    procedono in parallelo.
+
+    Args:
+        lookup: `lookup(user_id)` -> profilo in cache o None (thread del loop)
+        read: `read(user_id)` -> dati su disco o None (bloccante, nel pool)
+        install: `install(user_id, dati)` -> profilo pronto all'uso, messo in
+            cache (thread del loop; con dati None crea un profilo nuovo)
+        save: `save(user_id, profilo)` segna il profilo come da scrivere
+        max_workers: thread del pool di I/O
+    """
+
+    def __init__(self, lookup, read, install, save, max_workers=2):
+        self._lookup = lookup
+        self._read = read
+        self._install = install
+        self._save = save
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="player-io")
+        # user_id -> future completata quando termina l'ultima operazione in coda per l'utente
+        self._tails = {}
+        self.reads = 0
+        self.updates = 0
+
+    def pending_users(self):
+        """Numero di utenti con operazioni in corso o in attesa."""
+        return len(self._tails)
+
+    async def _serialized(self, user_id, operation, *args):
+        """Esegue `operation` dopo tutte quelle già in coda per lo stesso utente."""
+        loop = asyncio.get_running_loop()
+        previous = self._tails.get(user_id)
+        done = loop.create_future()
+        self._tails[user_id] = done
+        try:
+            if previous is not None:
+                # shield: se questa attesa viene cancellata, l'operazione precedente non ne risente
+                await asyncio.shield(previous)
+            return await operation(user_id, *args)
+        finally:
+            if previous is not None and not previous.done():
+                # Cancellati mentre si aspettava: chi segue deve comunque attendere il precedente
+                previous.add_done_callback(lambda _: done.done() or done.set_result(None))
+            elif not done.done():
+                done.set_result(None)
+            if self._tails.get(user_id) is done:
+                del self._tails[user_id]
+
+    async def _load(self, user_id):
+        record = self._lookup(user_id)
+        if record is not None:
+            return record
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self.executor, self._read, user_id)
+            self.reads += 1
+        except CodecUnavailableError:
+            # Il profilo esiste ma non è leggibile: crearne uno nuovo lo sovrascriverebbe
+            raise
+        except Exception as e:
+            logger.error(f"[Storage] Error reading profile {user_id}: {e}")
+            data = None
+        return self._install(user_id, data)
+
+    async def get(self, user_id):
+        """Restituisce il profilo di un utente, leggendolo dal disco senza bloccare il loop."""
+        if user_id not in self._tails:
+            # Nessuna operazione in corso per l'utente: se è in cache non serve attendere
+            record = self._lookup(user_id)
+            if record is not None:
+                return record
+        return await self._serialized(user_id, self._load)
+
+    async def _apply(self, user_id, fn, args):
+        record = await self._load(user_id)
+        result = fn(record, *args)
+        self._save(user_id, record)
+        self.updates += 1
+        return result
+
+    async def update(self, user_id, fn, *args):
+        """Applica `fn(profilo, *args)` al profilo dell'utente e lo segna come da salvare.
+
+        Gli aggiornamenti dello stesso utente sono applicati in ordine di chiamata.
+        Restituisce il valore restituito da `fn`.
+        """
+        return await self._serialized(user_id, self._apply, fn, args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import asyncio
+from collections import Counter
+
+from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
+
+from utils.logger import logger
+from utils.messaging import outbound_queue
+from utils.timer_data import config
+
+# Utenti che hanno bloccato il bot o disattivato l'account: esclusi dai broadcast successivi
+BLOCKED_USERS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'blocked_users.json')
+
+# Numero massimo di messaggi del broadcast accodati contemporaneamente
+BROADCAST_CONCURRENCY = config.getint('broadcast', 'concurrency', fallback=25)
+# Intervallo minimo (secondi) tra due aggiornamenti del messaggio di avanzamento
+PROGRESS_EDIT_INTERVAL = config.getfloat('broadcast', 'progress_interval', fallback=3.0)
+
+_blocked_users = None
+
+def load_blocked_users():
+    """Carica l'insieme degli utenti che non possono ricevere messaggi."""
+    global _blocked_users
+    if _blocked_users is None:
+        try:
+            with open(BLOCKED_USERS_PATH, 'r') as f:
+                _blocked_users = set(json.load(f))
+        except FileNotFoundError:
+            _blocked_users = set()
+        except Exception as e:
+            print(f"Errore nel caricamento degli utenti bloccati: {e}")
+            _blocked_users = set()
+    return _blocked_users
+
+def save_blocked_users():
+    """Salva l'insieme degli utenti bloccati nella directory data."""
+    os.makedirs(os.path.dirname(BLOCKED_USERS_PATH), exist_ok=True)
+    try:
+        with open(BLOCKED_USERS_PATH, 'w') as f:
+            json.dump(sorted(load_blocked_users()), f)
+    except Exception as e:
+        print(f"Errore nel salvataggio degli utenti bloccati: {e}")
+
+def unblock_user(user_id):
+    """Rimuove un utente dai bloccati (es. quando torna a scrivere al bot)."""
+    blocked = load_blocked_users()
+    if user_id in blocked:
+        blocked.discard(user_id)
+        save_blocked_users()
+
+def classify_error(error):
+    """Restituisce la classe di errore usata nel riepilogo del broadcast."""
+    if isinstance(error, Forbidden):
+        message = str(error).lower()
+        if "deactivated" in message:
+            return "deactivated"
+        if "blocked" in message:
+            return "blocked"
+        return "forbidden"
+    if isinstance(error, BadRequest):
+        if "chat not found" in str(error).lower():
+            return "chat_not_found"
+        return "bad_request"
+    if isinstance(error, RetryAfter):
+        return "flood"
+    if isinstance(error, TimedOut):
+        return "timeout"
+    if isinstance(error, NetworkError):
+        return "network"
+    return type(error).__name__
+
+# Classi di errore per cui l'utente non potrà mai ricevere messaggi
+_PERMANENT_ERRORS = {"blocked", "deactivated", "chat_not_found"}
+
+async def run_broadcast(user_ids, text, progress=None, concurrency=BROADCAST_CONCURRENCY,
+                        progress_interval=PROGRESS_EDIT_INTERVAL, **send_kwargs):
+    """Invia `text` a tutti gli utenti con parallelismo limitato.
+
+    Il ritmo effettivo è imposto dalla coda in uscita; qui si limita solo il
+    numero di messaggi accodati insieme. `progress(done, total)` viene
+    chiamata al massimo una volta ogni `progress_interval` secondi.
+
+    Returns:
+        dict con "sent", "skipped", "total", "errors" (conteggi per classe)
+        e "elapsed".
+    """
+    blocked = load_blocked_users()
+    # Gli ID duplicati ricevono un solo messaggio ma non contano come saltati
+    unique_ids = list(dict.fromkeys(user_ids))
+    recipients = [user_id for user_id in unique_ids if user_id not in blocked]
+    skipped = len(unique_ids) - len(recipients)
+    total = len(recipients)
+
+    errors = Counter()
+    newly_blocked = []
+    sent = 0
+    done = 0
+    start = time.monotonic()
+    last_progress = start
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def report_progress(force=False):
+        nonlocal last_progress
+        now = time.monotonic()
+        if progress is None or (not force and now - last_progress < progress_interval):
+            return
+        last_progress = now
+        try:
+            await progress(done, total)
+        except Exception as e:
+            # Un errore nell'aggiornamento (es. "message is not modified") non ferma il broadcast
+            logger.warning(f"[Broadcast] Progress update failed: {e}")
+
+    async def deliver(user_id):
+        nonlocal sent, done
+        async with semaphore:
+            try:
+                await outbound_queue.send(user_id, text, **send_kwargs)
+                sent += 1
+            except Exception as e:
+                error_class = classify_error(e)
+                errors[error_class] += 1
+                if error_class in _PERMANENT_ERRORS:
+                    newly_blocked.append(user_id)
+                else:
+                    logger.warning(f"[Broadcast] Error sending to user {user_id}: {e}")
+            done += 1
+        await report_progress()
+
+    await asyncio.gather(*(deliver(user_id) for user_id in recipients))
+    await report_progress(force=True)
+
+    if newly_blocked:
+        blocked.update(newly_blocked)
+        save_blocked_users()
+
+    elapsed = time.monotonic() - start
+    logger.info(
+        f"[Broadcast] {sent}/{total} sent in {elapsed:.1f}s, {skipped} skipped, errors: {dict(errors)}"
+    )
+    return {
+        "sent": sent,
+        "skipped": skipped,
+        "total": total,
+        "errors": dict(errors),
+        "elapsed": elapsed,
+    }
@@ -0,0 +1,91 @@
+from utils.formatters import parse_dhms_time
+
+# Suffisso accettato dopo il comando quando il bot viene menzionato nei gruppi
+BOT_SUFFIX = "@InventoryBot"
+
+
+def _is_time_argument(token):
+    """Verifica che il token abbia la forma \\d+(:\\d+)+ (es. 05:00, 1:02:03:04)."""
+    parts = token.split(":")
+    return len(parts) > 1 and all(part.isdigit() for part in parts)
+
+
+class CommandRouter:
+    """Dispatcher a passaggio singolo per i comandi testuali dei timer.
+
+    Il testo viene diviso in token una sola volta; il comando (`/avventura`,
+    `/noslot`, `/siutilizzi`, ...) e gli alias di `/usa <alias>` vengono
+    risolti con una ricerca in tabelle hash costruite all'avvio, al posto di
+    provare in sequenza una regex per ogni handler.
+    """
+
+    def __init__(self, bot_suffix=BOT_SUFFIX):
+        self._suffix = bot_suffix
+        # "/comando" -> (callback, accetta un argomento di tempo)
+        self._commands = {}
+        # alias di /usa -> callback
+        self._usa_aliases = {}
+
+    def add_command(self, command, callback, accepts_time=False):
+        """Registra `/command`; con `accepts_time` è ammesso un argomento dd:hh:mm:ss."""
+        self._commands["/" + command] = (callback, accepts_time)
+
+    def add_usa_alias(self, alias, callback):
+        """Registra `/usa <alias>` (accetta sempre l'argomento di tempo)."""
+        self._usa_aliases[alias] = callback
+
+    def add_timer(self, command, aliases, start_callback, toggle_callback):
+        """Registra avvio e toggle notifiche di un timer.
+
+        Se `aliases` è vuoto il timer si avvia con `/command`, altrimenti con
+        `/usa <alias>`; il toggle è sempre `/no<command>`.
+        """
+        if aliases:
+            for alias in aliases:
+                self.add_usa_alias(alias, start_callback)
+        else:
+            self.add_command(command, start_callback, accepts_time=True)
+        self.add_command("no" + command, toggle_callback)
+
+    def _strip_suffix(self, token):
+        if token.endswith(self._suffix):
+            return token[:-len(self._suffix)]
+        return token
+
+    def resolve(self, text):
+        """Risolve il testo di un messaggio.
+
+        Returns:
+            None se il testo non è un comando registrato, altrimenti
+            (callback, args) dove args è () oppure (time_str, total_seconds)
+            per i timer avviati con un tempo; total_seconds è None se il
+            tempo ha un formato non valido.
+        """
+        if not text or text[0] != "/":
+            return None
+        tokens = text.split()
+        if len(tokens) > 3:
+            return None
+
+        head = tokens[0]
+        if head == "/usa":
+            if len(tokens) < 2:
+                return None
+            callback = self._usa_aliases.get(self._strip_suffix(tokens[1]))
+            accepts_time = True
+            rest = tokens[2:]
+        else:
+            route = self._commands.get(self._strip_suffix(head))
+            if route is None:
+                return None
+            callback, accepts_time = route
+            rest = tokens[1:]
+
+        if callback is None:
+            return None
+        if not rest:
+            return callback, ()
+        if not accepts_time or len(rest) > 1 or not _is_time_argument(rest[0]):
+            return None
+        time_str = rest[0]
+        return callback, (time_str, parse_dhms_time(time_str))
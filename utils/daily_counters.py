@@ -0,0 +1,97 @@
+import datetime
+from types import MappingProxyType
+
+from utils.hyperloglog import HyperLogLog
+
+
+class DailyBuffer:
+    """Contatori di una singola giornata: utilizzi per comando e utenti unici.
+
+    Gli utenti unici sono uno sketch HyperLogLog a memoria fissa, che a fine
+    giornata viene salvato e unito a quelli dei giorni precedenti.
+    """
+
+    __slots__ = ("day", "counts", "users", "frozen")
+
+    def __init__(self, commands, day=None):
+        self.day = day or datetime.date.today()
+        self.counts = dict.fromkeys(commands, 0)
+        self.users = HyperLogLog()
+        self.frozen = False
+
+    def freeze(self):
+        """Rende il buffer di sola lettura: da qui in poi è la fotografia della giornata."""
+        if not self.frozen:
+            self.counts = MappingProxyType(self.counts)
+            self.frozen = True
+        return self
+
+    @property
+    def unique_users(self):
+        return self.users.count()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def items(self):
+        """Coppie (comando, utilizzi) nell'ordine dei comandi."""
+        return self.counts.items()
+
+
+class DailyCounters:
+    """Contatori giornalieri a doppio buffer.
+
+    Gli handler incrementano sempre il buffer attivo (`record`, senza lock né
+    attese). A mezzanotte `swap()` sostituisce il buffer attivo con uno
+    vuoto con una sola assegnazione sul thread del loop e restituisce quello
+    precedente congelato: invio del riepilogo e salvataggio nei totali
+    lavorano su quella fotografia, quindi nessun utilizzo viene perso o
+    contato due volte anche se arriva mentre il report è in corso.
+    """
+
+    def __init__(self, commands):
+        self.commands = tuple(commands)
+        self._active = DailyBuffer(self.commands)
+
+    def record(self, command, user_id):
+        """Conta un utilizzo del comando nella giornata corrente."""
+        active = self._active
+        active.counts[command] += 1
+        active.users.add(user_id)
+
+    def current(self):
+        """Buffer della giornata in corso (da usare solo in lettura)."""
+        return self._active
+
+    def restore(self, day, counts, sketch=None):
+        """Riprende i contatori salvati (es. da uno snapshot).
+
+        Se appartengono alla giornata in corso vengono sommati a quelli già
+        registrati dopo l'avvio e restituisce None. Se sono di un giorno
+        passato (riavvio a cavallo della mezzanotte, prima della chiusura)
+        restituisce quella giornata come buffer congelato, da salvare nei
+        totali come il risultato di `swap()`. Dati di un giorno futuro
+        (orologio spostato indietro) vengono ignorati.
+        """
+        active = self._active
+        if day > active.day:
+            return None
+        target = active if day == active.day else DailyBuffer(self.commands, day)
+        for command, count in counts.items():
+            if command in target.counts:
+                target.counts[command] += count
+        if sketch is not None:
+            target.users.merge(sketch)
+        if target is active:
+            return None
+        return target.freeze()
+
+    def swap(self, day=None):
+        """Chiude la giornata: attiva un buffer vuoto e restituisce il precedente congelato."""
+        closed = self._active
+        if day is None:
+            # Il job di mezzanotte può scattare con qualche istante di anticipo
+            day = max(datetime.date.today(), closed.day + datetime.timedelta(days=1))
+        self._active = DailyBuffer(self.commands, day)
+        return closed.freeze()
@@ -1,14 +1,13 @@
-import asyncio
-from utils.player_data import update_last_timer
+from utils.scheduler import notification_scheduler
 
 async def cancel_active_task(user_id: int, active_tasks_dict: dict, item_name: str):
-    """Cancella e rimuove un task attivo se esiste."""
+    """Cancella e rimuove una notifica pianificata se esiste."""
     if user_id in active_tasks_dict:
         try:
-            print(f"[{item_name}] Cancelling active task for user {user_id}.")
-            active_tasks_dict[user_id].cancel()
+            print(f"[{item_name}] Cancelling pending notification for user {user_id}.")
+            notification_scheduler.cancel(active_tasks_dict[user_id])
         except Exception as e:
-            print(f"[{item_name}] Error cancelling task for user {user_id}: {e}")
+            print(f"[{item_name}] Error cancelling notification for user {user_id}: {e}")
         finally:
             # Rimuovi l'entry indipendentemente dal successo della cancellazione
             if user_id in active_tasks_dict:
@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import math
+import os
+
+# Precisione di default: 2^12 registri da un byte (4 KiB per sketch, errore tipico ~1.6%)
+DEFAULT_PRECISION = 12
+
+
+def _hash64(item):
+    """Hash a 64 bit stabile tra un avvio e l'altro (hash() di Python non lo è per le stringhe)."""
+    return int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Contatore approssimato di elementi distinti a memoria fissa.
+
+    Ogni elemento aggiorna uno solo dei 2^p registri; due sketch con la stessa
+    precisione si uniscono prendendo il massimo registro per registro, quindi
+    gli sketch giornalieri si combinano in conteggi settimanali, mensili e
+    totali senza dover conservare gli ID. L'unione è idempotente: unire due
+    volte lo stesso giorno non cambia il risultato.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"Precisione HyperLogLog non valida: {precision}")
+        self.precision = precision
+        size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(size)
+        elif len(registers) != size:
+            raise ValueError(f"Attesi {size} registri, trovati {len(registers)}")
+        else:
+            self.registers = bytearray(registers)
+
+    def add(self, item):
+        h = _hash64(item)
+        bits = 64 - self.precision
+        index = h >> bits
+        # Posizione del primo bit a 1 nei bit restanti (bits + 1 se sono tutti zero)
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Unisce `other` in questo sketch (stessa precisione) e restituisce self."""
+        if other.precision != self.precision:
+            raise ValueError("Impossibile unire sketch con precisioni diverse")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def copy(self):
+        return HyperLogLog(self.precision, self.registers)
+
+    def count(self):
+        """Stima del numero di elementi distinti."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Pochi elementi: il linear counting sui registri vuoti è più preciso
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+    def to_bytes(self):
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], data[1:])
+
+
+class SketchStore:
+    """Sketch HyperLogLog giornalieri su disco, più quello cumulativo di sempre.
+
+    Un file per giorno (`AAAA-MM-GG.hll`) e `all_time.hll`, che contiene
+    l'unione di tutti i giorni salvati. Le finestre (ultimi 7 o 30 giorni)
+    si ottengono unendo i file dei giorni richiesti.
+    """
+
+    ALL_TIME = "all_time"
+
+    def __init__(self, directory, precision=DEFAULT_PRECISION):
+        self.directory = directory
+        self.precision = precision
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.hll")
+
+    def _read(self, name):
+        try:
+            with open(self._path(name), 'rb') as file:
+                sketch = HyperLogLog.from_bytes(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, IndexError) as e:
+            print(f"Sketch {name} illeggibile, ignorato: {e}")
+            return None
+        if sketch.precision != self.precision:
+            print(f"Sketch {name} con precisione {sketch.precision} invece di {self.precision}, ignorato")
+            return None
+        return sketch
+
+    def _write(self, name, sketch):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        # Scrittura su file temporaneo e rename: chi legge non vede mai uno sketch a metà
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(sketch.to_bytes())
+        os.replace(tmp_path, path)
+
+    def load_day(self, day):
+        return self._read(day.isoformat())
+
+    def save_day(self, day, sketch):
+        """Salva lo sketch del giorno (unito a quello già su disco) e aggiorna il totale.
+
+        Restituisce lo sketch cumulativo di sempre aggiornato.
+        """
+        merged = sketch.copy()
+        stored = self.load_day(day)
+        if stored is not None:
+            merged.merge(stored)
+        self._write(day.isoformat(), merged)
+        all_time = self.all_time(merged)
+        self._write(self.ALL_TIME, all_time)
+        return all_time
+
+    def window(self, end_day, days, live=None):
+        """Unione degli sketch degli ultimi `days` giorni fino a `end_day` compreso.
+
+        `live` è lo sketch non ancora salvato della giornata in corso.
+        """
+        merged = live.copy() if live is not None else HyperLogLog(self.precision)
+        for offset in range(days):
+            stored = self.load_day(end_day - datetime.timedelta(days=offset))
+            if stored is not None:
+                merged.merge(stored)
+        return merged
+
+    def all_time(self, live=None):
+        """Sketch cumulativo di sempre, eventualmente unito allo sketch della giornata in corso."""
+        merged = live.copy() if live is not None else HyperLogLog(self.precision)
+        stored = self._read(self.ALL_TIME)
+        if stored is not None:
+            merged.merge(stored)
+        return merged
+
+    def estimates(self, today, live=None):
+        """Utenti unici stimati: oggi, ultimi 7 giorni, ultimi 30 giorni e da sempre."""
+        return {
+            "today": self.window(today, 1, live).count(),
+            "week": self.window(today, 7, live).count(),
+            "month": self.window(today, 30, live).count(),
+            "all_time": self.all_time(live).count(),
+        }
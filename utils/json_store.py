@@ -0,0 +1,269 @@
+import os
+import time
+import hashlib
+
+from utils.serialization import decode, get_codec
+from utils.write_behind import PartialWriteError
+
+
+def fsync_directory(directory):
+    """Sincronizza le voci di una cartella (le rinomine); non supportato su Windows."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JsonPlayerStore:
+    """Archivio dei profili come un file JSON per utente.
+
+    I file sono distribuiti su due livelli di sottocartelle scelte da un hash
+    dello user_id (`players/3/f/<user_id>.json`, 256 cartelle in tutto), così
+    nessuna directory cresce con il numero di utenti. I profili del vecchio
+    layout piatto (`players/<user_id>.json`) restano leggibili finché
+    `migrate_flat_batch` non li ha spostati: la migrazione può avvenire a bot
+    avviato e riprende da dove era rimasta, perché lo stato è la directory stessa.
+    """
+
+    name = "json"
+
+    def __init__(self, players_dir, codec=None):
+        self.players_dir = players_dir
+        # Formato usato in scrittura; in lettura il formato è riconosciuto dal contenuto
+        # (l'estensione .json resta anche per i file msgpack, così i percorsi non cambiano)
+        self.codec = codec or get_codec("auto")
+        # Diventa True quando non restano profili nel layout piatto
+        self.flat_migrated = False
+
+    def get_shard_path(self, user_id):
+        """Percorso del profilo nel layout a cartelle."""
+        digest = hashlib.blake2b(str(user_id).encode(), digest_size=1).hexdigest()
+        return self.players_dir / digest[0] / digest[1] / f"{user_id}.json"
+
+    def get_flat_path(self, user_id):
+        """Percorso del profilo nel vecchio layout piatto."""
+        return self.players_dir / f"{user_id}.json"
+
+    def get_player_file_path(self, user_id):
+        """Restituisce il percorso del file per un utente specifico (in entrambi i layout)."""
+        shard_path = self.get_shard_path(user_id)
+        if self.flat_migrated or shard_path.exists():
+            return shard_path
+        flat_path = self.get_flat_path(user_id)
+        return flat_path if flat_path.exists() else shard_path
+
+    def read(self, user_id):
+        """Legge il profilo di un utente; None se non esiste o se il file è corrotto.
+
+        Un file illeggibile viene spostato in quarantena prima di restituire
+        None: il profilo nuovo che lo sostituisce non sovrascrive i dati originali.
+        Un file in un formato la cui libreria non è installata non è corrotto:
+        CodecUnavailableError viene propagata e il file resta dov'è.
+        """
+        file_path = self.get_player_file_path(user_id)
+        try:
+            try:
+                with open(file_path, 'rb') as f:
+                    return decode(f.read())
+            except FileNotFoundError:
+                # Il file può essere stato appena spostato dalla migrazione del layout
+                shard_path = self.get_shard_path(user_id)
+                if file_path == shard_path or not shard_path.exists():
+                    return None
+                file_path = shard_path
+                with open(file_path, 'rb') as f:
+                    return decode(f.read())
+        except ValueError as e:
+            self.quarantine(user_id, file_path, reason=str(e))
+            return None
+
+    def quarantine(self, user_id, file_path=None, reason=""):
+        """Sposta il file di un profilo corrotto in `players/quarantine/`, senza cancellarlo."""
+        file_path = file_path or self.get_player_file_path(user_id)
+        quarantine_dir = self.players_dir / "quarantine"
+        target = quarantine_dir / f"{user_id}.{int(time.time())}.json"
+        try:
+            quarantine_dir.mkdir(exist_ok=True)
+            os.replace(file_path, target)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Impossibile mettere in quarantena il profilo {user_id}: {e}")
+            return None
+        print(f"Profilo {user_id} corrotto ({reason}): spostato in {target}")
+        return target
+
+    def encode(self, user_id, data):
+        """Serializza il profilo (chiamata sul thread del loop)."""
+        return self.codec.dumps(data)
+
+    def write_batch(self, batch):
+        """Scrive un blocco di profili in modo atomico, sincronizzando i dati prima delle rinomine.
+
+        Ogni profilo viene scritto in un file temporaneo accanto a quello
+        definitivo. I temporanei restano aperti finché tutto il blocco è stato
+        scritto e solo allora vengono sincronizzati uno per uno (`fdatasync`
+        dove disponibile): il kernel può accodare le scritture di tutto il
+        blocco invece di attendere il disco a ogni profilo. Dopo, i temporanei
+        sostituiscono gli originali con `os.replace` e ogni cartella coinvolta
+        viene sincronizzata una volta. Un arresto in qualsiasi momento lascia
+        su disco la versione vecchia o quella nuova di ogni profilo, mai un
+        file troncato.
+
+        Un errore su un profilo non interrompe il blocco: alla fine viene
+        sollevata PartialWriteError con gli utenti non salvati, così il
+        chiamante può riprovarli.
+        """
+        sync = getattr(os, "fdatasync", os.fsync)
+        pending = []
+        failed = []
+        try:
+            for user_id, payload in batch:
+                # Si scrive sempre nel layout a cartelle; l'eventuale copia piatta diventa obsoleta
+                file_path = self.get_shard_path(user_id)
+                tmp_path = file_path.with_name(file_path.name + ".tmp")
+                try:
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    f = open(tmp_path, 'wb')
+                except Exception as e:
+                    print(f"Errore nel salvataggio dei dati per l'utente {user_id}: {e}")
+                    failed.append(user_id)
+                    continue
+                pending.append((user_id, tmp_path, file_path, f))
+                try:
+                    f.write(payload)
+                    f.flush()
+                except Exception as e:
+                    print(f"Errore nel salvataggio dei dati per l'utente {user_id}: {e}")
+                    failed.append(user_id)
+                    pending.pop()
+                    f.close()
+            written = []
+            for user_id, tmp_path, file_path, f in pending:
+                try:
+                    sync(f.fileno())
+                    written.append((user_id, tmp_path, file_path))
+                except Exception as e:
+                    print(f"Errore nel salvataggio dei dati per l'utente {user_id}: {e}")
+                    failed.append(user_id)
+        finally:
+            for _, _, _, f in pending:
+                f.close()
+        directories = set()
+        for user_id, tmp_path, file_path in written:
+            try:
+                os.replace(tmp_path, file_path)
+                directories.add(file_path.parent)
+                if not self.flat_migrated:
+                    flat_path = self.get_flat_path(user_id)
+                    if flat_path.exists():
+                        flat_path.unlink(missing_ok=True)
+                        directories.add(self.players_dir)
+            except Exception as e:
+                print(f"Errore nel salvataggio dei dati per l'utente {user_id}: {e}")
+                failed.append(user_id)
+        # Rende persistenti le rinomine: un fsync per cartella, non per profilo
+        for directory in directories:
+            fsync_directory(directory)
+        if failed:
+            raise PartialWriteError(failed)
+
+    def iter_user_ids(self):
+        """Itera sugli ID di tutti i profili salvati."""
+        seen = set()
+        for file in self.players_dir.glob("*/*/*.json"):
+            try:
+                user_id = int(file.stem)
+            except ValueError:
+                continue
+            seen.add(user_id)
+            yield user_id
+        if self.flat_migrated:
+            return
+        # Profili non ancora migrati (durante la migrazione un profilo può comparire in entrambi)
+        for file in self.players_dir.glob("*.json"):
+            try:
+                user_id = int(file.stem)
+            except ValueError:
+                continue
+            if user_id not in seen:
+                yield user_id
+
+    def migrate_flat_batch(self, limit):
+        """Sposta nel layout a cartelle fino a `limit` profili del layout piatto.
+
+        Lo spostamento usa `os.link` + `unlink`: il link non sovrascrive mai un
+        profilo già presente nella cartella (scritto nel frattempo, quindi più
+        recente), e in ogni istante il profilo è raggiungibile in almeno uno
+        dei due percorsi. Restituisce il numero di profili spostati; 0 quando
+        la migrazione è completa.
+        """
+        linked = []
+        directories = set()
+        with os.scandir(self.players_dir) as entries:
+            for entry in entries:
+                if len(linked) >= limit:
+                    break
+                if not entry.name.endswith(".json") or not entry.is_file():
+                    continue
+                try:
+                    user_id = int(entry.name[:-5])
+                except ValueError:
+                    continue
+                shard_path = self.get_shard_path(user_id)
+                shard_path.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(entry.path, shard_path)
+                    directories.add(shard_path.parent)
+                except FileExistsError:
+                    pass  # Il profilo è già stato riscritto nel nuovo layout
+                except FileNotFoundError:
+                    continue  # Rimosso nel frattempo da una scrittura
+                linked.append(entry.path)
+        # I nuovi link devono essere su disco prima di rimuovere i percorsi vecchi
+        for directory in directories:
+            fsync_directory(directory)
+        for path in linked:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        if linked:
+            fsync_directory(self.players_dir)
+        else:
+            self.flat_migrated = True
+        return len(linked)
+
+    def iter_profiles(self):
+        """Itera su (user_id, dati) per tutti i profili salvati."""
+        for user_id in self.iter_user_ids():
+            try:
+                data = self.read(user_id)
+            except Exception as e:
+                print(f"Errore nella lettura del profilo {user_id}: {e}")
+                continue
+            if data is not None:
+                yield user_id, data
+
+    def subscribed_users(self):
+        """Utenti iscritti alle statistiche giornaliere."""
+        return [
+            user_id for user_id, data in self.iter_profiles()
+            if data.get("settings", {}).get("daily_stats", False)
+        ]
+
+    def last_timers(self):
+        """Itera su (user_id, comando, timestamp) per tutti i timer avviati."""
+        for user_id, data in self.iter_profiles():
+            for command, timestamp in data.get("last_timers", {}).items():
+                if timestamp and timestamp > 0:
+                    yield user_id, command, timestamp
+
+    def close(self):
+        pass
@@ -0,0 +1,63 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class KeyedLocks:
+    """Registro di lock asincroni per chiave (utente, messaggio di callback, ...).
+
+    Con l'elaborazione concorrente degli update, gli handler dello stesso
+    utente vengono serializzati mentre utenti diversi procedono in parallelo.
+    Un lock esiste solo finché qualcuno lo tiene o lo attende: quando torna
+    inattivo viene rimosso, così il registro non cresce con il numero di utenti.
+    """
+
+    def __init__(self):
+        # chiave -> [lock, numero di possessori + in attesa]
+        self._locks = {}
+        self.max_size = 0
+        self.contended = 0
+
+    def __len__(self):
+        return len(self._locks)
+
+    def locked(self, key):
+        slot = self._locks.get(key)
+        return slot is not None and slot[0].locked()
+
+    @asynccontextmanager
+    async def hold(self, key):
+        """Context manager asincrono che tiene il lock della chiave."""
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = self._locks[key] = [asyncio.Lock(), 0]
+            self.max_size = max(self.max_size, len(self._locks))
+        elif slot[0].locked():
+            self.contended += 1
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0 and self._locks.get(key) is slot:
+                del self._locks[key]
+
+    def stats(self):
+        return {"active": len(self._locks), "max_active": self.max_size, "contended": self.contended}
+
+
+# Registro condiviso da tutti gli handler
+update_locks = KeyedLocks()
+
+
+def user_lock(user_id):
+    """Serializza gli handler che modificano lo stato di un utente."""
+    return update_locks.hold(("user", user_id))
+
+
+def callback_lock(query):
+    """Serializza le callback dei pulsanti dello stesso messaggio."""
+    message = query.message
+    if message is None:
+        return update_locks.hold(("inline", query.inline_message_id))
+    return update_locks.hold(("message", message.chat_id, message.message_id))
@@ -1,27 +1,275 @@
+import asyncio
+import heapq
+import itertools
 import logging
-from telegram import Update
-from telegram.ext import ApplicationBuilder
-from utils.timer_data import TOKEN
-from telegram.ext import ContextTypes
-from utils.player_data import get_preferred_notification_chat
+import time
+from collections import deque
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.request import HTTPXRequest
+from utils.timer_data import TOKEN, config
+from utils.player_data import player_storage
 from utils.logger import logger
+from utils.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
-async def send_notification(update, user_id, username, message, command_name=None):
+# Dimensione del pool di connessioni HTTP (keep-alive) verso le API di Telegram
+CONNECTION_POOL_SIZE = config.getint('bot', 'connection_pool_size', fallback=32)
+
+# Client Telegram condiviso da tutto il processo per gli invii fuori dagli handler
+_shared_bot = None
+_owns_shared_bot = False
+_shared_bot_lock = None
+
+def register_shared_bot(bot):
+    """Registra il bot dell'Application in esecuzione come client condiviso."""
+    global _shared_bot, _owns_shared_bot
+    _shared_bot = bot
+    _owns_shared_bot = False
+
+async def get_shared_bot():
+    """Restituisce il client condiviso, creandone uno solo se l'Application non l'ha registrato."""
+    global _shared_bot, _owns_shared_bot, _shared_bot_lock
+    if _shared_bot is not None:
+        return _shared_bot
+    if _shared_bot_lock is None:
+        _shared_bot_lock = asyncio.Lock()
+    async with _shared_bot_lock:
+        if _shared_bot is None:
+            bot = Bot(TOKEN, request=HTTPXRequest(connection_pool_size=CONNECTION_POOL_SIZE))
+            await bot.initialize()
+            _shared_bot = bot
+            _owns_shared_bot = True
+    return _shared_bot
+
+async def shutdown_shared_bot():
+    """Chiude il client condiviso se è stato creato qui (quello dell'Application lo chiude PTB)."""
+    global _shared_bot, _owns_shared_bot
+    bot, owned = _shared_bot, _owns_shared_bot
+    _shared_bot = None
+    _owns_shared_bot = False
+    if bot is not None and owned:
+        await bot.shutdown()
+
+# Limiti di invio verso Telegram (messaggi al secondo globali, per chat privata e per gruppo)
+GLOBAL_RATE = config.getfloat('rate_limit', 'global_per_second', fallback=30)
+PRIVATE_CHAT_RATE = config.getfloat('rate_limit', 'private_per_second', fallback=1)
+GROUP_CHAT_RATE = config.getfloat('rate_limit', 'group_per_minute', fallback=20) / 60
+MAX_SEND_RETRIES = config.getint('rate_limit', 'max_retries', fallback=3)
+
+class OutboundQueue:
+    """Coda centrale dei messaggi in uscita con rate limiting.
+
+    Un token bucket globale limita il ritmo complessivo, un bucket per chat
+    (più restrittivo per i gruppi) evita il flood sulla singola chat. Le
+    risposte 429 (`RetryAfter`) sospendono gli invii per il tempo indicato
+    e il messaggio viene ritentato.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, private_rate=PRIVATE_CHAT_RATE,
+                 group_rate=GROUP_CHAT_RATE, max_retries=MAX_SEND_RETRIES, max_in_flight=16):
+        self._global_bucket = TokenBucket(global_rate, max(1, global_rate))
+        self._private_rate = private_rate
+        self._group_rate = group_rate
+        self._max_retries = max_retries
+        self._max_in_flight = max_in_flight
+        self._chat_queues = {}
+        self._chat_buckets = {}
+        # Heap di (pronto_da, seq, chat_id): ogni chat con messaggi in coda compare una sola volta
+        self._ready = []
+        self._scheduled = set()
+        self._counter = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._in_flight = None
+        self._in_flight_count = 0
+        self._task = None
+        # Metriche
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.max_depth = 0
+        self._sent_times = deque()
+
+    def _bucket_for(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Gli ID negativi sono gruppi e canali, soggetti a limiti più stretti
+            rate = self._group_rate if chat_id < 0 else self._private_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, 1)
+        return bucket
+
+    def _schedule_chat(self, chat_id, ready_at):
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            heapq.heappush(self._ready, (ready_at, next(self._counter), chat_id))
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def submit(self, chat_id, text, **kwargs):
+        """Accoda un messaggio e restituisce un Future con il risultato dell'invio."""
+        if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+            # Gli ID letti da config.ini sono stringhe
+            chat_id = int(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        queue = self._chat_queues.setdefault(chat_id, deque())
+        queue.append([dict(kwargs, chat_id=chat_id, text=text), future, 0])
+        self.max_depth = max(self.max_depth, self.depth())
+        now = time.monotonic()
+        self._schedule_chat(chat_id, now + self._bucket_for(chat_id).delay(now))
+        return future
+
+    async def send(self, chat_id, text, **kwargs):
+        """Accoda un messaggio e attende l'esito dell'invio."""
+        return await self.submit(chat_id, text, **kwargs)
+
+    def depth(self):
+        """Numero di messaggi in attesa di invio."""
+        return sum(len(queue) for queue in self._chat_queues.values())
+
+    def stats(self):
+        """Metriche della coda: profondità, invii, errori e throughput recente."""
+        now = time.monotonic()
+        while self._sent_times and now - self._sent_times[0] > 60:
+            self._sent_times.popleft()
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "chats_waiting": len(self._scheduled),
+            "in_flight": self._in_flight_count,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "per_second_1m": len(self._sent_times) / 60,
+            "paused_for": max(0.0, self._paused_until - now),
+        }
+
+    def start(self):
+        """Avvia il dispatcher della coda."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout=5.0):
+        """Attende (per al massimo `drain_timeout` secondi) lo svuotamento e ferma il dispatcher."""
+        deadline = time.monotonic() + drain_timeout
+        while self.depth() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in self._chat_queues.values():
+            for _, future, _ in queue:
+                if not future.done():
+                    future.cancel()
+        self._chat_queues.clear()
+        self._scheduled.clear()
+        self._ready.clear()
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            ready_at, _, chat_id = self._ready[0]
+            wait = max(ready_at - now, self._paused_until - now, self._global_bucket.delay(now))
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._ready)
+            bucket = self._bucket_for(chat_id)
+            chat_delay = bucket.delay(now)
+            if chat_delay > 0:
+                heapq.heappush(self._ready, (now + chat_delay, next(self._counter), chat_id))
+                continue
+
+            queue = self._chat_queues.get(chat_id)
+            if not queue:
+                self._scheduled.discard(chat_id)
+                self._chat_queues.pop(chat_id, None)
+                continue
+
+            item = queue.popleft()
+            self._global_bucket.consume(now)
+            bucket.consume(now)
+            if queue:
+                heapq.heappush(self._ready, (now + bucket.delay(now), next(self._counter), chat_id))
+            else:
+                self._scheduled.discard(chat_id)
+                self._chat_queues.pop(chat_id, None)
+
+            await self._in_flight.acquire()
+            self._in_flight_count += 1
+            asyncio.create_task(self._deliver(chat_id, item))
+            self._evict_idle_buckets(now)
+
+    def _evict_idle_buckets(self, now):
+        # Mantiene piccola la tabella dei bucket: una chat senza messaggi e con bucket pieno non serve più
+        if len(self._chat_buckets) > 4096:
+            for chat_id in [c for c, b in self._chat_buckets.items() if c not in self._scheduled and b.is_full(now)]:
+                del self._chat_buckets[chat_id]
+
+    async def _deliver(self, chat_id, item):
+        kwargs, future, attempts = item
+        try:
+            bot = await get_shared_bot()
+            result = await bot.send_message(**kwargs)
+            self.sent += 1
+            self._sent_times.append(time.monotonic())
+            if not future.done():
+                future.set_result(result)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            self.retried += 1
+            # Il flood control di Telegram riguarda l'intero bot: sospendi tutti gli invii
+            self._paused_until = max(self._paused_until, time.monotonic() + float(retry_after))
+            logger.warning(f"[OutboundQueue] 429 for chat {chat_id}, retrying in {retry_after}s")
+            if attempts < self._max_retries and not future.done():
+                item[2] = attempts + 1
+                self._chat_queues.setdefault(chat_id, deque()).appendleft(item)
+                self._schedule_chat(chat_id, self._paused_until)
+            else:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._in_flight_count -= 1
+            self._in_flight.release()
+
+# Coda condivisa per tutti gli invii del bot
+outbound_queue = OutboundQueue()
+
+async def send_notification(user_id, username, message, command_name=None):
     """Invia una notifica all'utente, usando la chat preferita se impostata."""
     try:
         # Ottieni la chat preferita (se impostata, altrimenti usa la chat utente)
-        preferred_chat_id = get_preferred_notification_chat(user_id)
+        preferred_chat_id = (await player_storage.get(user_id)).preferred_notification_chat
         
         # Se non c'è una chat preferita, usa la chat utente direttamente
         chat_id = preferred_chat_id if preferred_chat_id else user_id
         
-        # Invia il messaggio alla chat appropriata
-        await update.get_bot().send_message(
-            chat_id=chat_id,
-            text=message
-        )
+        # Invia il messaggio alla chat appropriata passando dalla coda con rate limiting
+        await outbound_queue.send(chat_id, message)
         
         if command_name:
             logger.info(f"[{command_name}] Notification sent to user {user_id} in chat {chat_id}")
@@ -35,23 +283,14 @@ async def send_notification(update, user_id, username, message, command_name=Non
 async def send_direct_message(user_id, message, command_name=None):
     """Invia un messaggio diretto all'utente, usando la chat preferita se impostata."""
     try:
-        from telegram.ext import ApplicationBuilder
-        from utils.timer_data import TOKEN
-        
         # Ottieni la chat preferita (se impostata, altrimenti usa la chat utente)
-        preferred_chat_id = get_preferred_notification_chat(user_id) 
+        preferred_chat_id = (await player_storage.get(user_id)).preferred_notification_chat
         
         # Se non c'è una chat preferita, usa la chat utente direttamente
         chat_id = preferred_chat_id if preferred_chat_id else user_id
         
-        # Crea un'applicazione temporanea
-        app = ApplicationBuilder().token(TOKEN).build()
-        
-        # Invia il messaggio alla chat appropriata
-        await app.bot.send_message(
-            chat_id=chat_id,
-            text=message
-        )
+        # Invia il messaggio con il client condiviso, passando dalla coda con rate limiting
+        await outbound_queue.send(chat_id, message)
         
         if command_name:
             logger.info(f"[{command_name}] Direct message sent to user {user_id} in chat {chat_id}")
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import datetime
+
+from utils.player_record import COMMANDS
+
+# Registro delle migrazioni dei profili: (versione, descrizione, funzione)
+# Ogni funzione riceve (user_id, data), modifica il profilo sul posto e
+# restituisce True se ha cambiato qualcosa. Deve essere idempotente.
+MIGRATIONS = []
+
+# Chiave del profilo con la versione dello schema già applicata
+SCHEMA_VERSION_KEY = "schema_version"
+
+# Stato globale delle migrazioni (versione a cui è stato portato l'intero archivio)
+MIGRATIONS_STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'migrations.json')
+
+
+def migration(version, description):
+    """Decoratore che registra una migrazione dei profili."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda step: step[0])
+        return func
+    return decorator
+
+
+def current_schema_version():
+    """Versione dello schema dei profili dopo tutte le migrazioni registrate."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def load_store_version(path=MIGRATIONS_STATE_PATH):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get("schema_version", 0)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        print(f"Errore nel caricamento dello stato delle migrazioni: {e}")
+        return 0
+
+
+def save_store_version(version, report, path=MIGRATIONS_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({"schema_version": version, "migrated_at": int(time.time()), "last_report": report}, f, indent=2)
+
+
+def migrate_profile(user_id, data, report=None):
+    """Applica a un profilo i passi con versione maggiore della sua.
+
+    Returns:
+        True se il profilo è stato portato a una nuova versione (va salvato).
+    """
+    target = current_schema_version()
+    record_version = data.get(SCHEMA_VERSION_KEY, 0)
+    if record_version >= target:
+        return False
+    for version, _, func in MIGRATIONS:
+        if version <= record_version:
+            continue
+        start = time.perf_counter()
+        changed = func(user_id, data)
+        step = report.get(version) if report is not None else None
+        if step is not None:
+            step["seconds"] += time.perf_counter() - start
+            if changed:
+                step["touched"] += 1
+    data[SCHEMA_VERSION_KEY] = target
+    return True
+
+
+def run_migrations(profiles, save, path=MIGRATIONS_STATE_PATH):
+    """Porta all'ultimo schema tutti i profili sotto la versione corrente.
+
+    Se l'archivio risulta già migrato non legge nessun profilo. Altrimenti
+    applica a ogni profilo solo i passi mancanti e salva soltanto i profili
+    sotto la versione corrente.
+
+    Args:
+        profiles: funzione senza argomenti che restituisce un iteratore di (user_id, dati)
+        save: funzione `save(user_id, dati)` chiamata per i profili migrati
+
+    Returns:
+        Lista di report per passo: versione, descrizione, profili toccati e
+        secondi impiegati (vuota se non c'era nulla da migrare).
+    """
+    target = current_schema_version()
+    store_version = load_store_version(path)
+    if store_version >= target:
+        return []
+
+    report = {
+        version: {"version": version, "description": description, "touched": 0, "seconds": 0.0}
+        for version, description, _ in MIGRATIONS if version > store_version
+    }
+    for user_id, data in profiles():
+        if migrate_profile(user_id, data, report):
+            save(user_id, data)
+
+    steps = list(report.values())
+    save_store_version(target, steps, path)
+    return steps
+
+
+@migration(1, "completa la struttura del profilo (notifiche, statistiche, timer, chat preferita)")
+def _complete_structure(user_id, data):
+    changed = False
+    settings = data.setdefault("settings", {})
+    notifications = settings.setdefault("notifications", {})
+    stats = data.setdefault("stats", {})
+    last_timers = data.setdefault("last_timers", {})
+    for command in COMMANDS:
+        if command not in notifications:
+            notifications[command] = True
+            changed = True
+        if command not in stats:
+            stats[command] = {"today": 0, "total": 0}
+            changed = True
+        if command not in last_timers:
+            last_timers[command] = 0
+            changed = True
+    if "preferred_notification_chat" not in settings:
+        settings["preferred_notification_chat"] = None
+        changed = True
+    return changed
+
+
+@migration(2, "aggiunge il giorno di riferimento ai contatori giornalieri")
+def _stamp_stats_day(user_id, data):
+    changed = False
+    last_active = data.get("last_active", 0)
+    # Stesso ordinale usato da player_data.current_day()
+    day = datetime.date.fromtimestamp(last_active).toordinal() if last_active else 0
+    for record in data.get("stats", {}).values():
+        if "day" not in record:
+            record["day"] = day
+            changed = True
+    return changed
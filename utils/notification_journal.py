@@ -0,0 +1,117 @@
+import os
+import json
+
+# Operazioni registrate nel journal
+SCHEDULED = "s"
+REMOVED = "r"
+
+
+class NotificationJournal:
+    """Journal append-only delle notifiche pianificate.
+
+    Ogni pianificazione aggiunge una riga `s` (due_at, user_id, command,
+    chat, ...) e ogni cancellazione o consegna una riga `r`. Al riavvio si
+    rileggono solo le notifiche ancora vive, senza scorrere tutti i profili.
+    Quando le righe morte superano quelle vive il file viene compattato.
+
+    Le notifiche sono identificate da (user_id, command): per ogni utente e
+    comando esiste al più una notifica in attesa.
+    """
+
+    def __init__(self, path, compact_min_lines=1000):
+        self.path = path
+        self.compact_min_lines = compact_min_lines
+        # (user_id, command) -> record della notifica in attesa
+        self._live = {}
+        self._lines = 0
+        self._file = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Legge il journal e restituisce i record delle notifiche ancora vive.
+
+        Lo stato in memoria riparte vuoto: il chiamante ripianifica i record
+        che servono (registrandoli di nuovo) e poi chiama `compact()`.
+        """
+        live = {}
+        self._lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Riga troncata da un arresto improvviso: si ignora
+                        continue
+                    self._lines += 1
+                    key = (record["uid"], record["cmd"])
+                    if record["op"] == SCHEDULED:
+                        live[key] = record
+                    elif key in live and live[key]["seq"] == record["seq"]:
+                        del live[key]
+        except FileNotFoundError:
+            pass
+        self._live = {}
+        return list(live.values())
+
+    def _append(self, record):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._lines += 1
+
+    def record_scheduled(self, seq, user_id, command, due_at, username="", reduced=False,
+                         chat_id=None, started_at=None):
+        """Registra una notifica pianificata."""
+        record = {
+            "op": SCHEDULED, "seq": seq, "uid": user_id, "cmd": command, "due": due_at,
+            "user": username, "red": reduced, "chat": chat_id, "start": started_at,
+        }
+        self._live[(user_id, command)] = record
+        self._append(record)
+        self._maybe_compact()
+
+    def record_removed(self, seq, user_id, command):
+        """Registra la cancellazione o la consegna di una notifica."""
+        key = (user_id, command)
+        live = self._live.get(key)
+        if live is None or live["seq"] != seq:
+            return
+        del self._live[key]
+        self._append({"op": REMOVED, "seq": seq, "uid": user_id, "cmd": command})
+        self._maybe_compact()
+
+    def live_count(self):
+        return len(self._live)
+
+    def live_records(self):
+        """Copia dei record delle notifiche in attesa (per lo snapshot dello stato)."""
+        return [dict(record) for record in self._live.values()]
+
+    def _maybe_compact(self):
+        if self._lines > self.compact_min_lines and self._lines > 2 * len(self._live):
+            self.compact()
+
+    def compact(self):
+        """Riscrive il journal con le sole notifiche vive (file temporaneo + rename)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self._live.values():
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._live)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,161 @@
+import sys
+from collections import OrderedDict
+
+
+def estimate_size(obj):
+    """Stima (in byte) la memoria occupata da un profilo fatto di dict, liste e scalari."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + estimate_size(value)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += estimate_size(item)
+    return size
+
+
+class PlayerCache:
+    """Cache dei profili con budget limitato ed eviction LRU segmentata (SLRU).
+
+    I profili appena caricati entrano nel segmento di prova; al secondo
+    accesso passano nel segmento protetto. L'eviction svuota prima il
+    segmento di prova, così una scansione di molti profili (job notturni,
+    comandi admin su tutti gli utenti) non scaccia gli utenti attivi.
+
+    Un profilo non viene mai scartato se `can_evict(user_id)` è falso
+    (timer in attesa, modifiche non ancora scritte): resta in cache e
+    `on_blocked` viene chiamata per chiederne il salvataggio.
+
+    Args:
+        max_entries: numero massimo di profili (0 = illimitato)
+        max_bytes: memoria massima stimata (0 = illimitata)
+        protected_ratio: quota del budget riservata al segmento protetto
+    """
+
+    def __init__(self, max_entries=0, max_bytes=0, protected_ratio=0.8,
+                 can_evict=None, on_blocked=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.protected_ratio = protected_ratio
+        self.can_evict = can_evict
+        self.on_blocked = on_blocked
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.blocked = 0
+
+    def __len__(self):
+        return len(self._probation) + len(self._protected)
+
+    def __contains__(self, user_id):
+        return user_id in self._protected or user_id in self._probation
+
+    def __getitem__(self, user_id):
+        if user_id in self._protected:
+            return self._protected[user_id]
+        return self._probation[user_id]
+
+    def get(self, user_id, default=None):
+        """Legge un profilo senza aggiornare recenza e metriche."""
+        if user_id in self._protected:
+            return self._protected[user_id]
+        return self._probation.get(user_id, default)
+
+    def lookup(self, user_id):
+        """Legge un profilo aggiornando recenza e metriche; None se assente."""
+        if user_id in self._protected:
+            self._protected.move_to_end(user_id)
+            self.hits += 1
+            return self._protected[user_id]
+        data = self._probation.pop(user_id, None)
+        if data is None:
+            self.misses += 1
+            return None
+        # Secondo accesso: promozione nel segmento protetto
+        self.hits += 1
+        self._protected[user_id] = data
+        self._limit_protected()
+        return data
+
+    def __setitem__(self, user_id, data):
+        if user_id in self._protected:
+            self._protected[user_id] = data
+            self._protected.move_to_end(user_id)
+        else:
+            self._probation[user_id] = data
+            self._probation.move_to_end(user_id)
+        if self.max_bytes:
+            size = estimate_size(data)
+            self.bytes += size - self._sizes.get(user_id, 0)
+            self._sizes[user_id] = size
+        # Il profilo appena inserito non viene scartato: il chiamante lo sta per usare
+        self.shrink(keep=user_id)
+
+    def pop(self, user_id, default=None):
+        data = self._protected.pop(user_id, None)
+        if data is None:
+            data = self._probation.pop(user_id, default)
+        self.bytes -= self._sizes.pop(user_id, 0)
+        return data
+
+    def items(self):
+        """Coppie (user_id, profilo) presenti in cache (copia, sicura durante le modifiche)."""
+        return list(self._protected.items()) + list(self._probation.items())
+
+    def _over_budget(self):
+        return ((self.max_entries and len(self) > self.max_entries) or
+                (self.max_bytes and self.bytes > self.max_bytes))
+
+    def _limit_protected(self):
+        # Il segmento protetto in eccesso retrocede nel segmento di prova (come MRU)
+        if not self.max_entries:
+            return
+        limit = max(1, int(self.max_entries * self.protected_ratio))
+        while len(self._protected) > limit:
+            user_id, data = self._protected.popitem(last=False)
+            self._probation[user_id] = data
+
+    def shrink(self, keep=None):
+        """Scarta profili finché la cache rientra nel budget; restituisce quanti."""
+        evicted = 0
+        for segment in (self._probation, self._protected):
+            # Ogni profilo viene esaminato al più una volta per segmento
+            attempts = len(segment)
+            while self._over_budget() and segment and attempts > 0:
+                attempts -= 1
+                user_id = next(iter(segment))
+                if user_id == keep:
+                    segment.move_to_end(user_id)
+                    continue
+                if self.can_evict is not None and not self.can_evict(user_id):
+                    segment.move_to_end(user_id)
+                    self.blocked += 1
+                    if self.on_blocked is not None:
+                        self.on_blocked(user_id)
+                    continue
+                del segment[user_id]
+                self.bytes -= self._sizes.pop(user_id, 0)
+                self.evictions += 1
+                evicted += 1
+        return evicted
+
+    def stats(self):
+        """Metriche della cache per dimensionarne il budget."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "protected": len(self._protected),
+            "probation": len(self._probation),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "blocked": self.blocked,
+        }
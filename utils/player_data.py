@@ -1,149 +1,257 @@
 import os
-import json
 import time
+import atexit
 import asyncio  # Aggiunto import asyncio
+import base64
+import datetime
 from pathlib import Path
 
+from utils.timer_data import config
+from utils.write_behind import WriteBehindFlusher
+from utils.async_store import AsyncPlayerStorage
+from utils.json_store import JsonPlayerStore
+from utils.state_snapshot import StateSnapshotStore
+from utils.hyperloglog import HyperLogLog
+from utils.serialization import CodecUnavailableError, get_codec
+from utils.sqlite_store import SQLitePlayerStore
+from utils.player_index import PlayerIndex
+from utils.player_cache import PlayerCache
+from utils.player_record import PlayerRecord, COMMAND_INDEX
+from utils.migrations import (
+    run_migrations, migrate_profile, current_schema_version
+)
+
 # Crea la cartella players se non esiste
 players_dir = Path("/home/pi/Desktop/InventoryHelpBot/players")
 players_dir.mkdir(exist_ok=True)
 
-# Struttura di default per i dati del giocatore
-DEFAULT_PLAYER_DATA = {
-    "settings": {
-        "notifications": {
-            "avventura": True,
-            "slot": True,
-            "borsellino": True,
-            "nanoc": True,
-            "nanor": True,
-            "gica": True,
-            "pozzo": True,
-            "sonda": True,
-            "forno": True,
-            "compattatore": True  # Aggiunto compattatore
-        },
-        "startup_notifications": False,  # Cambiato da True a False
-        "daily_stats": False
-    },
-    "stats": {
-        "avventura": {"today": 0, "total": 0},
-        "slot": {"today": 0, "total": 0},
-        "borsellino": {"today": 0, "total": 0},
-        "nanoc": {"today": 0, "total": 0},
-        "nanor": {"today": 0, "total": 0},
-        "gica": {"today": 0, "total": 0},
-        "pozzo": {"today": 0, "total": 0},
-        "sonda": {"today": 0, "total": 0},
-        "forno": {"today": 0, "total": 0},
-        "compattatore": {"today": 0, "total": 0}  # Aggiunto compattatore
-    },
-    "last_timers": {
-        "avventura": 0,
-        "slot": 0,
-        "borsellino": 0,
-        "nanoc": 0,
-        "nanor": 0,
-        "gica": 0,
-        "pozzo": 0,
-        "sonda": 0,
-        "forno": 0,
-        "compattatore": 0  # Aggiunto compattatore
-    },
-    "username": "",
-    "register_date": 0,
-    "last_active": 0
-}
-
-# Cache dei dati dei giocatori in memoria
-player_cache = {}
+# Budget della cache dei profili: numero di profili e memoria stimata in byte (0 = nessun limite)
+CACHE_MAX_ENTRIES = config.getint('cache', 'max_entries', fallback=5000)
+CACHE_MAX_BYTES = config.getint('cache', 'max_bytes', fallback=0)
+
+def _can_evict_player(user_id):
+    """Un profilo resta in cache se ha timer in attesa o modifiche non ancora scritte."""
+    from utils.timer_data import TIMER_DATA
+    
+    if player_writer.is_dirty(user_id):
+        return False
+    return not any(user_id in data["active"] for data in TIMER_DATA.values())
+
+# Cache dei dati dei giocatori in memoria (LRU segmentata con budget)
+player_cache = PlayerCache(
+    max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+    can_evict=_can_evict_player,
+    # I profili modificati vengono scritti al più presto e scartati al flush successivo
+    on_blocked=lambda user_id: player_writer.request_flush()
+)
+
+# Backend di archiviazione dei profili: "json" (un file per utente) o "sqlite" (WAL)
+STORAGE_BACKEND = config.get('storage', 'backend', fallback='json')
+SQLITE_PATH = Path(config.get('storage', 'sqlite_path', fallback=str(players_dir.parent / "players.db")))
+
+# Formato dei file dei profili: "auto" (JSON compatto, con orjson se installato),
+# "json", "orjson" o "msgpack". In lettura sono accettati tutti.
+PLAYER_CODEC = get_codec(config.get('storage', 'codec', fallback='auto'))
+
+# Archivio della directory players (anche sorgente per l'import in SQLite)
+json_player_store = JsonPlayerStore(players_dir, PLAYER_CODEC)
+
+def _create_player_store():
+    """Crea l'archivio dei profili configurato."""
+    if STORAGE_BACKEND != "sqlite":
+        return json_player_store
+
+    store = SQLitePlayerStore(SQLITE_PATH)
+    # Primo avvio con SQLite: importa una sola volta i profili JSON esistenti
+    if store.count() == 0:
+        imported = store.import_profiles(json_player_store.iter_profiles())
+        if imported:
+            print(f"Importati {imported} profili JSON nel database SQLite {SQLITE_PATH}.")
+    return store
+
+player_store = _create_player_store()
+
+# Parametri della scrittura differita: intervallo massimo tra due flush (secondi)
+# e numero di record sporchi che anticipa il flush
+FLUSH_INTERVAL = config.getfloat('storage', 'flush_interval', fallback=5.0)
+FLUSH_BATCH_SIZE = config.getint('storage', 'flush_batch_size', fallback=200)
+
+def current_day():
+    """Numero del giorno corrente (ordinale del calendario locale)."""
+    return datetime.date.today().toordinal()
+
+def roll_daily_stats(record, today=None):
+    """Azzera in modo lazy i contatori `today` appartenenti a un giorno passato.
+
+    Ogni contatore giornaliero porta il giorno a cui si riferisce: se non è
+    quello corrente, riparte da zero.
+    """
+    record.roll_day(current_day() if today is None else today)
 
 def get_player_file_path(user_id):
     """Restituisce il percorso del file per un utente specifico."""
-    return players_dir / f"{user_id}.json"
+    return json_player_store.get_player_file_path(user_id)
 
 def load_player_data(user_id):
-    """Carica i dati di un giocatore dal file o crea un nuovo profilo."""
-    if user_id in player_cache:
-        return player_cache[user_id]
-        
-    file_path = get_player_file_path(user_id)
+    """Carica il profilo (PlayerRecord) di un giocatore o ne crea uno nuovo.
+
+    Versione sincrona: se il profilo non è in cache lo legge dal disco sul
+    thread corrente. Nei gestori asincroni usare `player_storage.get`.
+    """
+    record = player_cache.lookup(user_id)
+    if record is not None:
+        roll_daily_stats(record)
+        return record
+    
+    try:
+        data = player_store.read(user_id)
+    except CodecUnavailableError:
+        raise
+    except Exception as e:
+        print(f"Errore nel caricamento dei dati per l'utente {user_id}: {e}")
+        data = None
+    return _install_player(user_id, data)
+
+def _install_player(user_id, data):
+    """Converte i dati letti dall'archivio in un PlayerRecord e lo mette in cache.
+
+    Chiamata sul thread del loop. Se il profilo è già in cache (caricato nel
+    frattempo) i dati letti vengono ignorati; con `data` None crea un profilo nuovo.
+    """
+    record = player_cache.get(user_id)
+    if record is not None:
+        roll_daily_stats(record)
+        return record
     
-    if file_path.exists():
+    if data is not None:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                # Assicurati che i dati hanno tutti i campi necessari
-                for key, value in DEFAULT_PLAYER_DATA.items():
-                    if key not in data:
-                        data[key] = value
-                    elif isinstance(value, dict):
-                        for subkey, subvalue in value.items():
-                            if subkey not in data[key]:
-                                data[key][subkey] = subvalue
-                            elif isinstance(subvalue, dict) and isinstance(data[key][subkey], dict):
-                                for sub_subkey, sub_subvalue in subvalue.items():
-                                    if sub_subkey not in data[key][subkey]:
-                                        data[key][subkey][sub_subkey] = sub_subvalue
-                
-                player_cache[user_id] = data
-                return data
+            # Le migrazioni lavorano sul formato su disco, prima della conversione
+            migrated = migrate_profile(user_id, data)
+            record = PlayerRecord.from_dict(data)
+            # I campi mancanti prendono i valori di default del record
+            player_cache[user_id] = record
+            if migrated:
+                save_player_data(user_id)
+            roll_daily_stats(record)
+            return record
         except Exception as e:
             print(f"Errore nel caricamento dei dati per l'utente {user_id}: {e}")
+            # Il profilo nuovo non deve cancellare i dati originali
+            player_store.quarantine(user_id, reason=str(e))
     
     # Se il file non esiste o c'è stato un errore, crea un nuovo profilo
-    player_cache[user_id] = DEFAULT_PLAYER_DATA.copy()
-    player_cache[user_id]["register_date"] = int(time.time())
-    player_cache[user_id]["last_active"] = int(time.time())
-    save_player_data(user_id)
+    now = int(time.time())
+    record = PlayerRecord(register_date=now, last_active=now, schema_version=current_schema_version())
+    roll_daily_stats(record)
+    save_player_data(user_id, record)
     
-    return player_cache[user_id]
+    return record
 
-def save_player_data(user_id, data=None):
-    """Salva i dati di un giocatore nel file."""
-    if data is None:
-        if user_id not in player_cache:
+def save_player_data(user_id, record=None):
+    """Segna il profilo di un giocatore come da salvare.
+
+    La scrittura su file avviene in differita, a blocchi, tramite `player_writer`.
+    """
+    if record is None:
+        record = player_cache.get(user_id)
+        if record is None:
             return False
-        data = player_cache[user_id]
+        player_writer.mark_dirty(user_id)
     else:
-        player_cache[user_id] = data  # Aggiorna la cache con i dati forniti
-    
-    file_path = get_player_file_path(user_id)
+        # Segnato prima dell'inserimento, così non può essere scartato prima del salvataggio
+        player_writer.mark_dirty(user_id)
+        player_cache[user_id] = record  # Aggiorna la cache con il profilo fornito
     
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Errore nel salvataggio dei dati per l'utente {user_id}: {e}")
-        return False
+    # Mantiene allineati gli indici secondari (iscritti, chat preferite, notifiche disattivate)
+    if player_index.update(user_id, record):
+        player_index_writer.mark_dirty("index")
+    return True
+
+def _snapshot_player(user_id):
+    """Serializza il profilo in cache sul thread del loop, prima della scrittura."""
+    record = player_cache.get(user_id)
+    if record is None:
+        return None
+    return player_store.encode(user_id, record.to_dict())
+
+def _save_updated_player(user_id, record):
+    record.last_active = int(time.time())
+    save_player_data(user_id)
+
+def _lookup_rolled(user_id):
+    """Profilo in cache con i contatori di oggi riportati al giorno corrente (come `load_player_data`)."""
+    record = player_cache.lookup(user_id)
+    if record is not None:
+        roll_daily_stats(record)
+    return record
+
+# Accesso asincrono ai profili: letture nel pool di I/O, operazioni per utente in ordine FIFO
+player_storage = AsyncPlayerStorage(
+    _lookup_rolled, player_store.read, _install_player, _save_updated_player,
+    max_workers=config.getint('storage', 'io_threads', fallback=2)
+)
+
+# Snapshot dell'intero stato in memoria, per ripartire senza rileggere l'archivio dei profili
+SNAPSHOT_PATH = config.get(
+    'snapshot', 'path',
+    fallback=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'state_snapshot.bin')
+)
+state_snapshots = StateSnapshotStore(SNAPSHOT_PATH, get_codec(config.get('snapshot', 'codec', fallback='auto')))
+
+def _write_profiles(batch):
+    """Scrive un blocco di profili: da qui in poi l'ultimo snapshot non coincide più con il disco."""
+    state_snapshots.invalidate()
+    player_store.write_batch(batch)
+
+# Scrittura differita dei profili: limita a FLUSH_INTERVAL secondi le modifiche perse in caso di crash
+player_writer = WriteBehindFlusher(
+    _snapshot_player, _write_profiles,
+    interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE,
+    # Dopo ogni flush i profili appena scritti tornano scartabili
+    after_flush=player_cache.shrink,
+    # Le scritture usano lo stesso pool di I/O delle letture
+    executor=player_storage.executor
+)
+
+# Indici secondari sulle impostazioni dei profili, salvati nella directory data
+PLAYER_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'player_index.json')
+
+def _load_player_index():
+    """Carica gli indici salvati o li ricostruisce con un'unica scansione dell'archivio."""
+    index = PlayerIndex(PLAYER_INDEX_PATH)
+    if not index.load(backend=player_store.name):
+        count = index.rebuild(player_store.iter_profiles())
+        index.write(index.encode(backend=player_store.name))
+        print(f"Indici dei profili ricostruiti da {count} profili.")
+    return index
+
+player_index = _load_player_index()
+
+# Gli indici vengono salvati con la stessa cadenza dei profili
+player_index_writer = WriteBehindFlusher(
+    lambda key: player_index.encode(backend=player_store.name),
+    lambda batch: player_index.write(batch[-1][1]),
+    interval=FLUSH_INTERVAL
+)
+
+# In caso di uscita pulita salva tutto ciò che è ancora in sospeso
+atexit.register(player_writer.flush)
+atexit.register(player_index_writer.flush)
 
 def update_player_notification_setting(user_id, command, enabled):
     """Aggiorna le impostazioni di notifica di un giocatore per un comando specifico."""
-    data = load_player_data(user_id)
-    data["settings"]["notifications"][command] = enabled
-    data["last_active"] = int(time.time())
+    record = load_player_data(user_id)
+    record.set_notification(command, enabled)
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
 def update_player_stats(user_id, command_name):
     """Aggiorna le statistiche di utilizzo di un comando per un utente."""
     try:
-        data = load_player_data(user_id)
-        
-        # Assicurati che esistano le strutture necessarie
-        if "stats" not in data:
-            data["stats"] = {}
-        if command_name not in data["stats"]:
-            data["stats"][command_name] = {"today": 0, "total": 0}
+        record = load_player_data(user_id)
         
-        # Incrementa i contatori giornaliero e totale
-        data["stats"][command_name]["today"] = data["stats"][command_name].get("today", 0) + 1
-        data["stats"][command_name]["total"] = data["stats"][command_name].get("total", 0) + 1
-        
-        # Verifica che total sia sempre >= today
-        if data["stats"][command_name]["total"] < data["stats"][command_name]["today"]:
-            data["stats"][command_name]["total"] = data["stats"][command_name]["today"]
+        # Incrementa i contatori giornaliero e totale (total resta sempre >= today)
+        record.increment(command_name, current_day())
         
         save_player_data(user_id)
         return True
@@ -153,244 +261,413 @@ def update_player_stats(user_id, command_name):
 
 def update_username(user_id, username):
     """Aggiorna l'username del giocatore."""
-    data = load_player_data(user_id)
+    record = load_player_data(user_id)
     if username and username != f"utente_{user_id}":  # Aggiorna solo se l'username è valido
-        data["username"] = username
-    data["last_active"] = int(time.time())
+        record.username = username
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
 def update_daily_stats_subscription(user_id, subscribed):
     """Aggiorna l'iscrizione alle statistiche giornaliere."""
-    data = load_player_data(user_id)
-    data["settings"]["daily_stats"] = subscribed
-    data["last_active"] = int(time.time())
+    record = load_player_data(user_id)
+    record.daily_stats = subscribed
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
 def update_startup_notification_setting(user_id, enabled):
     """Aggiorna le impostazioni di notifica all'avvio del bot."""
-    data = load_player_data(user_id)
-    data["settings"]["startup_notifications"] = enabled
-    data["last_active"] = int(time.time())
+    record = load_player_data(user_id)
+    record.startup_notifications = enabled
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
 def update_last_timer(user_id, command, timestamp):
     """Aggiorna il timestamp dell'ultimo utilizzo di un timer."""
-    data = load_player_data(user_id)
-    data["last_timers"][command] = timestamp
-    data["last_active"] = int(time.time())
+    record = load_player_data(user_id)
+    record.set_last_timer(command, timestamp)
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
-def reset_daily_stats():
-    """Resetta le statistiche giornaliere e aggiorna i totali."""
-    print("Resetting daily stats...")
+def get_timer_start(user_id, command):
+    """Restituisce l'istante di avvio dell'ultimo timer di un utente (0 se mai usato).
+
+    I dizionari `times` di TIMER_DATA vengono popolati in modo lazy dal profilo,
+    così all'avvio non serve leggere i timer di tutti gli utenti.
+    """
+    from utils.timer_data import TIMER_DATA, registered_users
+    
+    times_dict = TIMER_DATA[command]["times"]
+    if user_id not in times_dict:
+        timestamp = 0
+        if user_id in player_cache or user_id in registered_users:
+            timestamp = load_player_data(user_id).last_timer(command)
+        times_dict[user_id] = timestamp
+    return times_dict[user_id]
+
+def reset_daily_stats(snapshot):
+    """Salva nei totali persistenti la giornata chiusa da `daily_stats.swap()`.
+
+    L'azzeramento è già avvenuto con lo scambio dei buffer: qui si lavora
+    solo sulla fotografia congelata, quindi può girare in un thread.
+    """
+    print(f"Saving daily stats for {snapshot.day}...")
     
-    # Prima di resettare, salva le statistiche giornaliere nel file persistente
     from utils.stats_manager import update_global_stats
-    from utils.timer_data import daily_stats, registered_users
     
     # Aggiorna il file delle statistiche globali
-    update_global_stats(daily_stats)
+    update_global_stats(snapshot)
     
-    # Ora resetta le statistiche giornaliere
-    for key in daily_stats:
-        if key == "unique_users":
-            daily_stats[key] = set()
-        else:
-            daily_stats[key] = 0
+    # I contatori giornalieri dei profili non vengono toccati: ogni record porta
+    # il proprio giorno e viene azzerato in modo lazy alla prossima lettura/scrittura
     
-    # Resetta anche i contatori giornalieri nei dati utente
-    for user_id in registered_users:
-        try:
-            data = load_player_data(user_id)
-            if "stats" in data:
-                for cmd in data["stats"]:
-                    if "today" in data["stats"][cmd]:
-                        data["stats"][cmd]["today"] = 0
-                    # Assicuriamoci che total sia sempre maggiore o uguale a today
-                    if "total" in data["stats"][cmd] and data["stats"][cmd].get("today", 0) > data["stats"][cmd].get("total", 0):
-                        data["stats"][cmd]["total"] = data["stats"][cmd]["today"]
-                save_player_data(user_id)
-        except Exception as e:
-            print(f"Errore nel reset delle statistiche per l'utente {user_id}: {e}")
-    
-    print("Daily stats reset complete")
+    print("Daily stats saved")
 
 def get_all_subscribes_users():
     """Ottiene tutti gli utenti iscritti alle statistiche giornaliere."""
-    subscribed_users = []
-    
-    # Controlla prima la cache
-    for user_id, data in player_cache.items():
-        if data["settings"].get("daily_stats", False):
-            subscribed_users.append(user_id)
-    
-    # Poi controlla i file per gli utenti non in cache
-    for file in players_dir.glob("*.json"):
-        try:
-            user_id = int(file.stem)
-            if user_id not in player_cache:
-                with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if "settings" in data and "daily_stats" in data["settings"] and data["settings"]["daily_stats"]:
-                        subscribed_users.append(user_id)
-        except Exception as e:
-            print(f"Errore nella lettura delle impostazioni per {file}: {e}")
-    
-    return subscribed_users
+    # L'indice è aggiornato a ogni salvataggio, comprese le modifiche non ancora scritte
+    return list(player_index.subscribers)
+
+def get_users_for_notification_chat(chat_id):
+    """Ottiene gli utenti che ricevono le notifiche nella chat indicata."""
+    return list(player_index.users_in_chat(chat_id))
+
+def get_users_with_notifications_disabled(command):
+    """Ottiene gli utenti con le notifiche disattivate per un comando."""
+    return list(player_index.users_with_disabled(command))
 
 def get_notification_status(user_id, command):
     """Verifica se le notifiche sono attive per un comando specifico."""
-    data = load_player_data(user_id)
-    return data["settings"]["notifications"].get(command, True)  # Default a True se non specificato
+    return load_player_data(user_id).notification_enabled(command)  # Default a True se non specificato
 
 def get_startup_notification_status(user_id):
     """Verifica se le notifiche di avvio sono attive per un utente."""
-    data = load_player_data(user_id)
-    return data["settings"].get("startup_notifications", False)  # Cambiato da True a False
+    return load_player_data(user_id).startup_notifications
 
 async def recreate_active_timers():
-    """Ricrea i task di notifica per i timer che erano attivi prima del riavvio."""
-    print("Ricreazione task di notifica per timer attivi...")
+    """Ripianifica le notifiche per i timer che erano attivi prima del riavvio."""
+    print("Ricreazione notifiche per timer attivi...")
     
-    from utils.timer_data import TIMER_DATA, TOKEN
-    from utils.messaging import send_direct_message
+    from utils.timer_data import TIMER_DATA, timer_table
+    from utils.scheduler import notification_scheduler
+    from utils.messaging import get_shared_bot
     
     now = time.time()
     recreated_tasks = 0
     
     for command_name, data in TIMER_DATA.items():
-        times_dict = data["times"]
         active_tasks_dict = data["active"]
         max_cooldown = data["cooldown"]
         
-        for user_id, timestamp in times_dict.items():
-            # Calcola quanto tempo è passato dall'avvio del timer
-            elapsed = now - timestamp
+        # Solo i timer ancora in cooldown, selezionati dalla tabella in un'unica passata
+        # (lista: durante le attese i gestori dei comandi possono aggiungere timer)
+        for user_id, timestamp in timer_table.on_cooldown(command_name, now):
+            # Calcola quanto tempo manca alla fine del cooldown
+            remaining_seconds = max_cooldown - (now - timestamp)
             
-            # Se il timer è ancora attivo (non è passato tutto il cooldown)
-            if 0 < elapsed < max_cooldown:
-                # Calcola quanto tempo manca alla fine del cooldown
-                remaining_seconds = max_cooldown - elapsed
-                
-                # Verifica se l'utente ha le notifiche attive
-                from utils.player_data import get_notification_status
-                notifications_enabled = get_notification_status(user_id, command_name)
+            # Verifica se l'utente ha le notifiche attive
+            from utils.player_data import get_notification_status
+            notifications_enabled = get_notification_status(user_id, command_name)
+            
+            disabled_set = data["disabled"]
+            # Un timer avviato nel frattempo dall'utente ha già la sua notifica
+            if user_id in active_tasks_dict:
+                continue
+            if user_id not in disabled_set and notifications_enabled:
+                print(f"[{command_name}] Ricreando notifica per utente {user_id}, tempo rimanente: {remaining_seconds:.2f}s")
                 
-                disabled_set = data["disabled"]
-                if user_id not in disabled_set and notifications_enabled:
-                    # Crea un nuovo task per la notifica
-                    print(f"[{command_name}] Ricreando task di notifica per utente {user_id}, tempo rimanente: {remaining_seconds:.2f}s")
-                    
-                    # Ottieni l'username se possibile
+                # Usa l'username salvato; chiedi a Telegram solo se manca
+                username = load_player_data(user_id).username
+                if not username:
                     try:
-                        from telegram.ext import ApplicationBuilder
-                        temp_app = ApplicationBuilder().token(TOKEN).build()
-                        chat = await temp_app.bot.get_chat(user_id)
+                        bot = await get_shared_bot()
+                        chat = await bot.get_chat(user_id)
                         username = chat.username or f"utente_{user_id}"
-                    except:
+                    except Exception:
                         username = f"utente_{user_id}"
-                    
-                    async def notify_after_restart(user_id, username, command, remaining):
-                        try:
-                            await asyncio.sleep(remaining)
-                            message = ""
-                            if command == "avventura":
-                                message = f"@{username}, puoi tornare ad avventurare!\n/avventura@InventoryBot"
-                            else:
-                                message = f"@{username}, puoi usare di nuovo {command}!\n/usa {command}"
-                                
-                            await send_direct_message(user_id, message, command.capitalize())
-                            
-                            # Rimuovi il task attivo dopo averlo completato
-                            if user_id in TIMER_DATA[command]["active"]:
-                                TIMER_DATA[command]["active"].pop(user_id, None)
-                        except asyncio.CancelledError:
-                            print(f"[{command.capitalize()}] Task riavviato cancellato per utente {user_id}")
-                    
-                    # Crea e registra il nuovo task
-                    task = asyncio.create_task(notify_after_restart(user_id, username, command_name, remaining_seconds))
-                    active_tasks_dict[user_id] = task
-                    recreated_tasks += 1
+                
+                # Pianifica la notifica nello scheduler centrale (nessun task dedicato)
+                entry = notification_scheduler.schedule(
+                    user_id, command_name, timestamp + max_cooldown, username, started_at=timestamp
+                )
+                active_tasks_dict[user_id] = entry
+                recreated_tasks += 1
     
-    print(f"Ricreati {recreated_tasks} task di notifica per timer attivi.")
+    print(f"Ripianificate {recreated_tasks} notifiche per timer attivi.")
     return recreated_tasks
 
 def sync_timers_from_files():
-    """Sincronizza i timer dalle informazioni nei file JSON."""
-    print("Sincronizzazione timer dai file JSON...")
+    """Sincronizza i timer dalle informazioni salvate nell'archivio dei profili."""
+    print("Sincronizzazione timer dall'archivio dei profili...")
     updated_timers = 0
     
     from utils.timer_data import TIMER_DATA, registered_users
     
-    # Itera attraverso tutti gli utenti registrati
-    for user_id in registered_users:
-        try:
-            data = load_player_data(user_id)
-            last_timers = data.get("last_timers", {})
-            
-            # Itera attraverso tutti i tipi di timer
-            for command, timestamp in last_timers.items():
-                if command in TIMER_DATA and timestamp > 0:
-                    # Aggiorna il timestamp in memoria
-                    TIMER_DATA[command]["times"][user_id] = timestamp
-                    updated_timers += 1
-            
-        except Exception as e:
-            print(f"Errore nella sincronizzazione timer per l'utente {user_id}: {e}")
+    # Un'unica lettura dall'archivio per tutti i timer avviati
+    try:
+        for user_id, command, timestamp in player_store.last_timers():
+            if user_id in registered_users and user_id not in player_cache and command in TIMER_DATA:
+                TIMER_DATA[command]["times"][user_id] = timestamp
+                updated_timers += 1
+    except Exception as e:
+        print(f"Errore nella sincronizzazione dei timer dall'archivio: {e}")
+    
+    # I profili in cache possono avere timer più recenti non ancora scritti
+    for user_id, record in player_cache.items():
+        if user_id not in registered_users:
+            continue
+        for command, timestamp in record.iter_last_timers():
+            if command in TIMER_DATA:
+                TIMER_DATA[command]["times"][user_id] = timestamp
+                updated_timers += 1
     
     print(f"Sincronizzati {updated_timers} timer.")
     return updated_timers
 
-async def migrate_existing_data(registered_users, disabled_commands, user_stats, timer_data):
-    """Migra i dati esistenti al nuovo sistema di file."""
+def restore_pending_notifications(snapshot_records=None):
+    """Ripianifica le notifiche in attesa lette dal journal dello scheduler.
+
+    Il costo dipende solo dai timer attivi, non dal numero totale di utenti.
+    Il journal è sempre più recente di qualsiasi snapshot; le notifiche dello
+    snapshot (`snapshot_records`) si usano solo se il journal manca.
+    Restituisce il numero di notifiche ripristinate, o None se non c'è né
+    l'uno né l'altro (primo avvio: i timer vanno ricostruiti dall'archivio).
+    """
+    from utils.timer_data import TIMER_DATA
+    from utils.scheduler import notification_scheduler
+    
+    journal = notification_scheduler.journal
+    if journal is None:
+        return None
+    if journal.exists():
+        records = None
+    elif snapshot_records is not None:
+        records = snapshot_records
+    else:
+        return None
+    
+    restored = 0
+    for entry, record in notification_scheduler.restore(records=records):
+        data = TIMER_DATA.get(record["cmd"])
+        if data is None:
+            notification_scheduler.cancel(entry)
+            continue
+        user_id = record["uid"]
+        data["active"][user_id] = entry
+        if record.get("start"):
+            data["times"][user_id] = record["start"]
+        restored += 1
+    return restored
+
+# Migrazione in background della directory players al layout a cartelle:
+# profili spostati per blocco e pausa tra un blocco e l'altro (secondi)
+LAYOUT_MIGRATION_BATCH = config.getint('storage', 'layout_migration_batch', fallback=200)
+LAYOUT_MIGRATION_PAUSE = config.getfloat('storage', 'layout_migration_pause', fallback=1.0)
+
+async def migrate_players_layout():
+    """Sposta i profili del layout piatto nelle sottocartelle, a blocchi e senza fretta.
+
+    Il bot resta operativo durante lo spostamento (i profili sono letti in
+    entrambi i layout); se viene interrotta, la migrazione riprende al
+    successivo avvio dai file rimasti.
+    """
+    if json_player_store.flat_migrated:
+        return 0
+    total = 0
+    start = time.perf_counter()
+    while True:
+        # Fuori dal pool di I/O dei profili, che resta libero per le letture degli handler
+        moved = await asyncio.to_thread(json_player_store.migrate_flat_batch, LAYOUT_MIGRATION_BATCH)
+        if not moved:
+            break
+        total += moved
+        await asyncio.sleep(LAYOUT_MIGRATION_PAUSE)
+    if total:
+        print(f"Layout players: {total} profili spostati nelle sottocartelle in {time.perf_counter() - start:.1f}s")
+    return total
+
+def capture_state():
+    """Copia coerente dello stato in memoria, presa sul thread del loop.
+
+    Contiene: timer avviati e notifiche disattivate di TIMER_DATA, contatori
+    della giornata, profili in cache (con l'indicazione di quelli non ancora
+    scritti) e notifiche in attesa. La serializzazione avviene poi in un thread.
+    """
+    from utils.timer_data import TIMER_DATA, daily_stats
+    from utils.scheduler import notification_scheduler
+    
+    today = daily_stats.current()
+    journal = notification_scheduler.journal
+    return {
+        "taken_at": time.time(),
+        "schema_version": current_schema_version(),
+        "backend": player_store.name,
+        "timers": {
+            command: [[user_id, timestamp] for user_id, timestamp in data["times"].items() if timestamp]
+            for command, data in TIMER_DATA.items()
+        },
+        "disabled": {command: sorted(data["disabled"]) for command, data in TIMER_DATA.items()},
+        "daily": {
+            "day": today.day.isoformat(),
+            "counts": dict(today.counts),
+            "users": base64.b64encode(today.users.to_bytes()).decode("ascii"),
+        },
+        "players": [
+            [user_id, record.to_dict(), player_writer.is_dirty(user_id)]
+            for user_id, record in player_cache.items()
+        ],
+        "notifications": journal.live_records() if journal is not None else [],
+    }
+
+async def take_state_snapshot():
+    """Cattura lo stato sul loop e lo scrive su disco in un thread. Restituisce True se è fresco."""
+    # La generazione va letta prima della cattura: una scrittura concorrente rende lo snapshot non fresco
+    generation = state_snapshots.generation()
+    state = capture_state()
+    try:
+        return await asyncio.to_thread(state_snapshots.write, state, generation)
+    except Exception as e:
+        print(f"Errore nella scrittura dello snapshot dello stato: {e}")
+        return False
+
+def restore_state_snapshot():
+    """Ripristina lo stato dall'ultimo snapshot valido, prima di avviare il bot.
+
+    I contatori della giornata vengono sempre ripresi. Cache dei profili,
+    timer e notifiche disattivate solo se lo snapshot è fresco (nessun profilo
+    scritto dopo la cattura) e compatibile con schema e archivio correnti:
+    in quel caso non serve alcuna scansione dei profili all'avvio.
+    Restituisce (stato, fresco); stato è None se non esiste uno snapshot valido.
+    """
+    from utils.timer_data import TIMER_DATA, daily_stats
+    
+    state, fresh = state_snapshots.load()
+    if state is None:
+        return None, False
+    
+    daily = state["daily"]
+    sketch = HyperLogLog.from_bytes(base64.b64decode(daily["users"]))
+    closed = daily_stats.restore(datetime.date.fromisoformat(daily["day"]), daily["counts"], sketch)
+    if closed is not None:
+        # Giornata non chiusa prima dell'arresto: la si salva ora, come a mezzanotte
+        reset_daily_stats(closed)
+    
+    if state["schema_version"] != current_schema_version() or state["backend"] != player_store.name:
+        fresh = False
+    if not fresh:
+        return state, False
+    
+    for user_id, data, dirty in state["players"]:
+        record = PlayerRecord.from_dict(data)
+        if dirty:
+            # Modifiche non ancora scritte al momento dello snapshot
+            save_player_data(user_id, record)
+        else:
+            player_cache[user_id] = record
+    for command, pairs in state["timers"].items():
+        if command in TIMER_DATA:
+            times = TIMER_DATA[command]["times"]
+            for user_id, timestamp in pairs:
+                times[user_id] = timestamp
+    for command, users in state["disabled"].items():
+        if command in TIMER_DATA:
+            TIMER_DATA[command]["disabled"].update(users)
+    return state, True
+
+def _profiles_for_migration():
+    """Profili dell'archivio non in cache (quelli in cache sono già migrati al caricamento)."""
+    for user_id, data in player_store.iter_profiles():
+        if user_id not in player_cache:
+            yield user_id, data
+
+async def migrate_existing_data(registered_users, disabled_commands, user_stats, timer_data, rebuild_timers=True):
+    """Migra i dati esistenti allo schema corrente e allinea lo stato in memoria.
+
+    I profili vengono riscritti solo se sono sotto la versione corrente dello
+    schema o se differiscono dallo stato in memoria: un riavvio senza nulla da
+    migrare non scrive alcun profilo.
+    Con `rebuild_timers` ricostruisce anche i timer attivi dall'archivio dei
+    profili (necessario solo se le notifiche non sono state ripristinate dal journal).
+    """
     print("Iniziando migrazione dei dati esistenti...")
     
     try:
-        # Migra utenti registrati
-        for user_id in registered_users:
-            data = load_player_data(user_id)
-            data["last_active"] = int(time.time())
-            save_player_data(user_id)
+        # Migrazioni di schema: solo i profili sotto la versione corrente
+        pending_writes = []
+        
+        def save_migrated(user_id, data):
+            if user_id in player_cache:
+                player_writer.mark_dirty(user_id)
+                return
+            pending_writes.append((user_id, player_store.encode(user_id, data)))
+            if len(pending_writes) >= FLUSH_BATCH_SIZE:
+                _write_profiles(pending_writes)
+                pending_writes.clear()
+        
+        steps = run_migrations(_profiles_for_migration, save_migrated)
+        if pending_writes:
+            _write_profiles(pending_writes)
+        for step in steps:
+            print(f"Migrazione v{step['version']} ({step['description']}): "
+                  f"{step['touched']} profili modificati in {step['seconds']:.3f}s")
+        if not steps:
+            print(f"Profili già alla versione {current_schema_version()} dello schema.")
         
-        # Migra impostazioni di notifica disattivate E sincronizza le impostazioni da persistente a memoria
+        # Stato in memoria -> profili: solo dove i dati differiscono
+        start = time.perf_counter()
+        touched = 0
         for cmd_name, disabled_set in disabled_commands.items():
-            # Primo passaggio: salva lo stato in memoria nel sistema persistente
-            for user_id in disabled_set:
-                if user_id:  # Verifica che l'ID utente sia valido
-                    update_player_notification_setting(user_id, cmd_name, False)
+            disabled_in_profiles = player_index.users_with_disabled(cmd_name)
+            for user_id in [u for u in disabled_set if u and u not in disabled_in_profiles]:
+                update_player_notification_setting(user_id, cmd_name, False)
+                touched += 1
             
-            # Secondo passaggio: sincronizza da persistente alla memoria per assicurare coerenza
-            for user_id in registered_users:
-                if user_id:  # Verifica che l'ID utente sia valido
-                    notifications_enabled = get_notification_status(user_id, cmd_name)
-                    if not notifications_enabled and user_id not in disabled_set:
-                        print(f"Sincronizzando impostazioni per {user_id}, disattivando notifiche {cmd_name}")
-                        disabled_set.add(user_id)
-                    elif notifications_enabled and user_id in disabled_set:
-                        print(f"Sincronizzando impostazioni per {user_id}, attivando notifiche {cmd_name}")
-                        disabled_set.remove(user_id)
+            # Profili -> memoria, usando l'indice delle notifiche disattivate
+            for user_id in disabled_in_profiles:
+                if user_id in registered_users and user_id not in disabled_set:
+                    print(f"Sincronizzando impostazioni per {user_id}, disattivando notifiche {cmd_name}")
+                    disabled_set.add(user_id)
+        print(f"Sincronizzazione notifiche disattivate: {touched} profili modificati in {time.perf_counter() - start:.3f}s")
         
-        # Migra statistiche di utilizzo
+        # Statistiche di utilizzo in memoria (formato precedente ai profili)
+        start = time.perf_counter()
+        touched = 0
         for user_id, stats in user_stats.items():
-            if user_id:  # Verifica che l'ID utente sia valido
-                data = load_player_data(user_id)
-                for cmd_name, cmd_stats in stats.items():
-                    if cmd_name in data["stats"]:
-                        data["stats"][cmd_name].update(cmd_stats)
+            if not user_id:  # Verifica che l'ID utente sia valido
+                continue
+            record = load_player_data(user_id)
+            changed = False
+            for cmd_name, cmd_stats in stats.items():
+                if cmd_name not in COMMAND_INDEX:
+                    continue
+                today, total = record.get_stat(cmd_name)
+                current = {"today": today, "total": total}
+                for stat_type, value in cmd_stats.items():
+                    if stat_type in current and current[stat_type] != value:
+                        record.set_stat(cmd_name, stat_type, value)
+                        changed = True
+            if changed:
                 save_player_data(user_id)
+                touched += 1
+        print(f"Sincronizzazione statistiche: {touched} profili modificati in {time.perf_counter() - start:.3f}s")
         
-        # Migra timestamp dei timer
+        # Timestamp dei timer in memoria
+        start = time.perf_counter()
+        touched = 0
         for cmd_name, cmd_data in timer_data.items():
-            times_dict = cmd_data.get("times", {})
-            for user_id, timestamp in times_dict.items():
-                if user_id:  # Verifica che l'ID utente sia valido
+            for user_id, timestamp in list(cmd_data.get("times", {}).items()):
+                if not user_id or not timestamp:
+                    continue
+                if load_player_data(user_id).last_timer(cmd_name) != timestamp:
                     update_last_timer(user_id, cmd_name, timestamp)
+                    touched += 1
+        print(f"Sincronizzazione timer: {touched} profili modificati in {time.perf_counter() - start:.3f}s")
         
-        # Sincronizza i timer dai file JSON alle strutture in memoria
-        sync_timers_from_files()
-        
-        # Ricrea i task di notifica per i timer attivi
-        await recreate_active_timers()
+        if rebuild_timers:
+            # Sincronizza i timer dall'archivio alle strutture in memoria
+            sync_timers_from_files()
+            
+            # Ripianifica le notifiche per i timer attivi
+            await recreate_active_timers()
         
         print("Migrazione dati completata con successo!")
         return True
@@ -398,98 +675,13 @@ async def migrate_existing_data(registered_users, disabled_commands, user_stats,
         print(f"Errore durante la migrazione dei dati: {e}")
         return False
 
-def ensure_complete_data_structure(data):
-    """Assicura che i dati utente abbiano tutte le sezioni necessarie."""
-    if "settings" not in data:
-        data["settings"] = {}
-    
-    if "notifications" not in data["settings"]:
-        data["settings"]["notifications"] = {}
-    
-    # Assicurati che ci siano tutti i comandi incluso compattatore
-    for cmd in ["avventura", "slot", "borsellino", "nanoc", "nanor", 
-               "gica", "pozzo", "sonda", "forno", "compattatore"]:
-        if cmd not in data["settings"]["notifications"]:
-            data["settings"]["notifications"][cmd] = True
-    
-    # Aggiungi preferred_notification_chat se non esiste
-    if "preferred_notification_chat" not in data["settings"]:
-        data["settings"]["preferred_notification_chat"] = None
-    
-    if "stats" not in data:
-        data["stats"] = {}
-    
-    # Assicurati che ci siano tutte le statistiche
-    for cmd in ["avventura", "slot", "borsellino", "nanoc", "nanor", 
-               "gica", "pozzo", "sonda", "forno", "compattatore"]:
-        if cmd not in data["stats"]:
-            data["stats"][cmd] = {"today": 0, "total": 0}
-    
-    if "last_timers" not in data:
-        data["last_timers"] = {}
-    
-    # Assicurati che ci siano tutti i timer
-    for cmd in ["avventura", "slot", "borsellino", "nanoc", "nanor", 
-               "gica", "pozzo", "sonda", "forno", "compattatore"]:
-        if cmd not in data["last_timers"]:
-            data["last_timers"][cmd] = 0
-
-def create_default_player_data():
-    """Crea una struttura dati di default per un nuovo utente."""
-    return {
-        "settings": {
-            "notifications": {
-                "avventura": True,
-                "slot": True,
-                "borsellino": True,
-                "nanoc": True,
-                "nanor": True,
-                "gica": True,
-                "pozzo": True,
-                "sonda": True,
-                "forno": True,
-                "compattatore": True  # Aggiunto compattatore
-            },
-            "daily_stats": False,
-            "startup_notifications": True
-        },
-        "stats": {
-            "avventura": {"today": 0, "total": 0},
-            "slot": {"today": 0, "total": 0},
-            "borsellino": {"today": 0, "total": 0},
-            "nanoc": {"today": 0, "total": 0},
-            "nanor": {"today": 0, "total": 0},
-            "gica": {"today": 0, "total": 0},
-            "pozzo": {"today": 0, "total": 0},
-            "sonda": {"today": 0, "total": 0},
-            "forno": {"today": 0, "total": 0},
-            "compattatore": {"today": 0, "total": 0}  # Aggiunto compattatore
-        },
-        "last_timers": {
-            "avventura": 0,
-            "slot": 0,
-            "borsellino": 0,
-            "nanoc": 0,
-            "nanor": 0,
-            "gica": 0,
-            "pozzo": 0,
-            "sonda": 0,
-            "forno": 0,
-            "compattatore": 0  # Aggiunto compattatore
-        },
-        "username": "",
-        "register_date": int(time.time()),
-        "last_active": int(time.time())
-    }
-
 def update_preferred_notification_chat(user_id, chat_id):
     """Aggiorna il gruppo/chat preferito per ricevere notifiche"""
-    data = load_player_data(user_id)
-    data.setdefault("settings", {})["preferred_notification_chat"] = chat_id
-    data["last_active"] = int(time.time())
+    record = load_player_data(user_id)
+    record.preferred_notification_chat = chat_id
+    record.last_active = int(time.time())
     return save_player_data(user_id)
 
 def get_preferred_notification_chat(user_id):
     """Ottiene il gruppo/chat preferito per ricevere notifiche"""
-    data = load_player_data(user_id)
-    return data.get("settings", {}).get("preferred_notification_chat", user_id)
+    return load_player_data(user_id).preferred_notification_chat
@@ -0,0 +1,135 @@
+import os
+import json
+
+from utils.player_record import PlayerRecord, COMMANDS
+
+
+class PlayerIndex:
+    """Indici secondari sulle impostazioni dei profili.
+
+    Mantiene, aggiornati a ogni salvataggio di un profilo:
+      - gli iscritti alle statistiche giornaliere;
+      - gli utenti per ogni `preferred_notification_chat`;
+      - gli utenti con le notifiche disattivate per ogni comando.
+
+    Così i job notturni e le viste admin leggono solo gli utenti interessati
+    invece di aprire tutti i profili dell'archivio.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.subscribers = set()
+        self.chat_users = {}
+        self.disabled = {}
+        # user_id -> chat preferita, per spostare l'utente quando cambia
+        self._chat_of = {}
+
+    def update(self, user_id, record):
+        """Aggiorna gli indici con un PlayerRecord; True se qualcosa è cambiato."""
+        changed = False
+
+        if record.daily_stats:
+            if user_id not in self.subscribers:
+                self.subscribers.add(user_id)
+                changed = True
+        elif user_id in self.subscribers:
+            self.subscribers.discard(user_id)
+            changed = True
+
+        chat_id = record.preferred_notification_chat
+        old_chat = self._chat_of.get(user_id)
+        if chat_id != old_chat:
+            if old_chat is not None:
+                users = self.chat_users.get(old_chat)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self.chat_users[old_chat]
+            if chat_id is None:
+                del self._chat_of[user_id]
+            else:
+                self._chat_of[user_id] = chat_id
+                self.chat_users.setdefault(chat_id, set()).add(user_id)
+            changed = True
+
+        mask = record.notifications_mask
+        for index, command in enumerate(COMMANDS):
+            users = self.disabled.get(command)
+            if not mask >> index & 1:
+                if users is None:
+                    users = self.disabled[command] = set()
+                if user_id not in users:
+                    users.add(user_id)
+                    changed = True
+            elif users is not None and user_id in users:
+                users.discard(user_id)
+                changed = True
+
+        return changed
+
+    def remove(self, user_id):
+        """Rimuove un utente da tutti gli indici."""
+        self.subscribers.discard(user_id)
+        old_chat = self._chat_of.pop(user_id, None)
+        if old_chat is not None and old_chat in self.chat_users:
+            self.chat_users[old_chat].discard(user_id)
+            if not self.chat_users[old_chat]:
+                del self.chat_users[old_chat]
+        for users in self.disabled.values():
+            users.discard(user_id)
+
+    def rebuild(self, profiles):
+        """Ricostruisce gli indici da un iteratore di (user_id, dati) nel formato su disco."""
+        self.subscribers.clear()
+        self.chat_users.clear()
+        self.disabled.clear()
+        self._chat_of.clear()
+        count = 0
+        for user_id, data in profiles:
+            self.update(user_id, PlayerRecord.from_dict(data))
+            count += 1
+        return count
+
+    def users_in_chat(self, chat_id):
+        return self.chat_users.get(chat_id, set())
+
+    def users_with_disabled(self, command):
+        return self.disabled.get(command, set())
+
+    def encode(self, backend=None):
+        """Serializza gli indici (chiamata sul thread del loop)."""
+        return json.dumps({
+            "backend": backend,
+            "subscribers": sorted(self.subscribers),
+            "preferred_chats": {str(user_id): chat_id for user_id, chat_id in self._chat_of.items()},
+            "disabled": {command: sorted(users) for command, users in self.disabled.items() if users},
+        })
+
+    def write(self, payload):
+        """Scrive gli indici su file passando da un file temporaneo."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def load(self, backend=None):
+        """Carica gli indici salvati; False se mancano o appartengono a un altro archivio."""
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Errore nel caricamento degli indici dei profili: {e}")
+            return False
+        if saved.get("backend") != backend:
+            return False
+
+        self.subscribers = set(saved.get("subscribers", []))
+        self._chat_of = {int(user_id): chat_id for user_id, chat_id in saved.get("preferred_chats", {}).items()}
+        self.chat_users = {}
+        for user_id, chat_id in self._chat_of.items():
+            self.chat_users.setdefault(chat_id, set()).add(user_id)
+        self.disabled = {command: set(users) for command, users in saved.get("disabled", {}).items()}
+        return True
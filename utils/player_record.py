@@ -0,0 +1,226 @@
+from array import array
+
+# Comandi con timer, nell'ordine degli indici usati dai contatori del profilo
+COMMANDS = ("avventura", "slot", "borsellino", "nanoc", "nanor",
+            "gica", "pozzo", "sonda", "forno", "compattatore")
+COMMAND_INDEX = {command: index for index, command in enumerate(COMMANDS)}
+
+# Tutte le notifiche attive (un bit per comando)
+ALL_NOTIFICATIONS = (1 << len(COMMANDS)) - 1
+
+# Campi di primo livello del formato su disco gestiti dal record
+_KNOWN_KEYS = ("settings", "stats", "last_timers", "username", "register_date",
+               "last_active", "schema_version")
+_KNOWN_SETTINGS = ("notifications", "startup_notifications", "daily_stats",
+                   "preferred_notification_chat")
+
+_COUNTER_LIMIT = 0xFFFFFFFF
+
+# Array azzerati da copiare nei nuovi record (la copia di un array è una memcpy)
+_ZERO_COUNTERS = array('I', [0] * len(COMMANDS))
+_ZERO_TIMESTAMPS = array('d', [0.0] * len(COMMANDS))
+
+
+def _counter(value):
+    return min(max(int(value or 0), 0), _COUNTER_LIMIT)
+
+
+def _timestamp(value):
+    # Su disco i timestamp interi restano interi (0 invece di 0.0)
+    return int(value) if float(value).is_integer() else value
+
+
+class PlayerRecord:
+    """Profilo di un giocatore in memoria, in forma compatta.
+
+    Al posto dei dizionari annidati del formato su disco usa:
+      - una bitmask con le notifiche attive (bit i = COMMANDS[i]);
+      - array('I') di lunghezza fissa per i contatori di oggi e totali,
+        più il giorno a cui si riferisce ogni contatore di oggi;
+      - un array('d') con l'ultimo avvio di ogni timer.
+
+    `from_dict`/`to_dict` convertono da/verso il formato JSON dei profili,
+    che resta invariato su disco (e per le migrazioni). Le chiavi che il
+    record non conosce sono conservate in `extra`.
+    """
+
+    __slots__ = ("notifications_mask", "today", "total", "days", "last_timers",
+                 "daily_stats", "startup_notifications", "preferred_notification_chat",
+                 "username", "register_date", "last_active", "schema_version",
+                 "extra", "__weakref__")
+
+    def __init__(self, register_date=0, last_active=0, schema_version=0):
+        self.notifications_mask = ALL_NOTIFICATIONS
+        self.today = _ZERO_COUNTERS[:]
+        self.total = _ZERO_COUNTERS[:]
+        self.days = _ZERO_COUNTERS[:]
+        self.last_timers = _ZERO_TIMESTAMPS[:]
+        self.daily_stats = False
+        self.startup_notifications = False
+        self.preferred_notification_chat = None
+        self.username = ""
+        self.register_date = register_date
+        self.last_active = last_active
+        self.schema_version = schema_version
+        self.extra = None
+
+    # --- Notifiche ---
+
+    def notification_enabled(self, command):
+        """True se le notifiche del comando sono attive (comandi sconosciuti: attive)."""
+        index = COMMAND_INDEX.get(command)
+        if index is None:
+            return True
+        return bool(self.notifications_mask >> index & 1)
+
+    def set_notification(self, command, enabled):
+        index = COMMAND_INDEX[command]
+        if enabled:
+            self.notifications_mask |= 1 << index
+        else:
+            self.notifications_mask &= ~(1 << index)
+
+    def toggle_notification(self, command):
+        """Inverte le notifiche del comando e restituisce il nuovo stato."""
+        self.notifications_mask ^= 1 << COMMAND_INDEX[command]
+        return self.notification_enabled(command)
+
+    def toggle_daily_stats(self):
+        """Inverte l'iscrizione alle statistiche giornaliere e restituisce il nuovo stato."""
+        self.daily_stats = not self.daily_stats
+        return self.daily_stats
+
+    def set_preferred_chat(self, chat_id):
+        self.preferred_notification_chat = chat_id
+
+    def notifications(self):
+        """Dizionario comando -> notifiche attive, nell'ordine di COMMANDS."""
+        mask = self.notifications_mask
+        return {command: bool(mask >> index & 1) for index, command in enumerate(COMMANDS)}
+
+    def disabled_commands(self):
+        mask = self.notifications_mask
+        return [command for index, command in enumerate(COMMANDS) if not mask >> index & 1]
+
+    # --- Statistiche ---
+
+    def roll_day(self, today):
+        """Azzera i contatori di oggi che appartengono a un giorno passato."""
+        days = self.days
+        for index in range(len(days)):
+            if days[index] != today:
+                self.today[index] = 0
+                days[index] = today
+
+    def increment(self, command, today):
+        """Conta un utilizzo del comando nel giorno `today`."""
+        index = COMMAND_INDEX[command]
+        if self.days[index] != today:
+            self.today[index] = 0
+            self.days[index] = today
+        self.today[index] = min(self.today[index] + 1, _COUNTER_LIMIT)
+        self.total[index] = max(min(self.total[index] + 1, _COUNTER_LIMIT), self.today[index])
+
+    def get_stat(self, command):
+        """Coppia (oggi, totale) per un comando; il totale non è mai inferiore a oggi."""
+        index = COMMAND_INDEX[command]
+        today = self.today[index]
+        return today, max(self.total[index], today)
+
+    def set_stat(self, command, stat_type, value):
+        """Imposta il contatore `today` o `total` di un comando."""
+        counters = self.today if stat_type == "today" else self.total
+        counters[COMMAND_INDEX[command]] = _counter(value)
+
+    # --- Timer ---
+
+    def last_timer(self, command):
+        index = COMMAND_INDEX.get(command)
+        return self.last_timers[index] if index is not None else 0
+
+    def set_last_timer(self, command, timestamp):
+        self.last_timers[COMMAND_INDEX[command]] = timestamp or 0
+
+    def iter_last_timers(self):
+        """Itera su (comando, timestamp) dei timer avviati almeno una volta."""
+        for index, timestamp in enumerate(self.last_timers):
+            if timestamp > 0:
+                yield COMMANDS[index], timestamp
+
+    # --- Conversioni dal/verso il formato su disco ---
+
+    @classmethod
+    def from_dict(cls, data):
+        """Costruisce il record da un profilo nel formato JSON su disco."""
+        record = cls(
+            register_date=data.get("register_date", 0) or 0,
+            last_active=data.get("last_active", 0) or 0,
+            schema_version=data.get("schema_version", 0) or 0,
+        )
+        record.username = data.get("username", "") or ""
+
+        settings = data.get("settings", {})
+        for command, enabled in settings.get("notifications", {}).items():
+            if command in COMMAND_INDEX and not enabled:
+                record.set_notification(command, False)
+        record.startup_notifications = bool(settings.get("startup_notifications", False))
+        record.daily_stats = bool(settings.get("daily_stats", False))
+        record.preferred_notification_chat = settings.get("preferred_notification_chat")
+
+        for command, stats in data.get("stats", {}).items():
+            index = COMMAND_INDEX.get(command)
+            if index is None:
+                continue
+            record.today[index] = _counter(stats.get("today", 0))
+            record.total[index] = _counter(stats.get("total", 0))
+            record.days[index] = _counter(stats.get("day", 0))
+
+        for command, timestamp in data.get("last_timers", {}).items():
+            index = COMMAND_INDEX.get(command)
+            if index is not None:
+                record.last_timers[index] = timestamp or 0
+
+        extra = {key: value for key, value in data.items() if key not in _KNOWN_KEYS}
+        extra_settings = {key: value for key, value in settings.items() if key not in _KNOWN_SETTINGS}
+        if extra_settings:
+            extra["settings"] = extra_settings
+        record.extra = extra or None
+        return record
+
+    def to_dict(self):
+        """Converte il record nel formato JSON dei profili su disco."""
+        settings = {
+            "notifications": self.notifications(),
+            "startup_notifications": self.startup_notifications,
+            "daily_stats": self.daily_stats,
+            "preferred_notification_chat": self.preferred_notification_chat,
+        }
+        data = {
+            "settings": settings,
+            "stats": {
+                command: {"today": self.today[index], "total": self.total[index], "day": self.days[index]}
+                for index, command in enumerate(COMMANDS)
+            },
+            "last_timers": {
+                command: _timestamp(self.last_timers[index]) for index, command in enumerate(COMMANDS)
+            },
+            "username": self.username,
+            "register_date": self.register_date,
+            "last_active": self.last_active,
+            "schema_version": self.schema_version,
+        }
+        if self.extra:
+            for key, value in self.extra.items():
+                if key == "settings":
+                    settings.update(value)
+                else:
+                    data[key] = value
+        return data
+
+    def __sizeof__(self):
+        # Memoria del record più quella degli array (usata dal budget della cache)
+        return (object.__sizeof__(self) + self.today.__sizeof__() + self.total.__sizeof__() +
+                self.days.__sizeof__() + self.last_timers.__sizeof__() + self.username.__sizeof__())
+
+    def __repr__(self):
+        return f"PlayerRecord(username={self.username!r}, schema_version={self.schema_version})"
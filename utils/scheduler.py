@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import os
+import time
+
+from utils.logger import logger
+from utils.timer_data import config
+from utils.timer_queues import (
+    TIMER_QUEUES, DUE_AT, SEQ, USER_ID, COMMAND, USERNAME, REDUCED
+)
+from utils.notification_journal import NotificationJournal
+
+# Modalità della coda: "heap" (ordinamento preciso) o "wheel" (ruote gerarchiche, O(1))
+SCHEDULER_MODE = config.get('scheduler', 'mode', fallback='heap')
+
+# Journal delle notifiche pianificate, riletto al riavvio
+JOURNAL_PATH = config.get(
+    'scheduler', 'journal_path',
+    fallback=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'notification_journal.jsonl')
+)
+
+
+class NotificationScheduler:
+    """Scheduler centrale per le notifiche dei timer.
+
+    Mantiene un'unica coda di entry (due_at, seq, user_id, command, ...)
+    e un solo loop di risveglio, al posto di un task `asyncio.sleep` per ogni
+    utente e comando.
+    """
+
+    def __init__(self, mode="heap", journal=None):
+        if mode not in TIMER_QUEUES:
+            print(f"Warning: modalità scheduler '{mode}' non valida, uso 'heap'.")
+            mode = "heap"
+        self.mode = mode
+        self._queue = TIMER_QUEUES[mode]()
+        self.journal = journal
+        self._counter = itertools.count()
+        self._handlers = {}
+        self._wakeup = None
+        self._loop_task = None
+        self._bot = None
+
+    def register_handler(self, command, handler):
+        """Registra la coroutine da eseguire alla scadenza di un timer del comando.
+
+        L'handler viene chiamato come `handler(bot, entry)`.
+        """
+        self._handlers[command] = handler
+
+    def schedule(self, user_id, command, due_at, username="", reduced=False, chat_id=None, started_at=None):
+        """Pianifica una notifica e restituisce la entry creata.
+
+        `chat_id` e `started_at` vengono solo registrati nel journal, per il ripristino.
+        """
+        entry = [due_at, next(self._counter), user_id, command, username, reduced]
+        if self.journal is not None:
+            self.journal.record_scheduled(
+                entry[SEQ], user_id, command, due_at, username, reduced, chat_id, started_at
+            )
+        was_empty = not self._queue
+        # Se la nuova entry è la prima in scadenza, sveglia il loop per ricalcolare l'attesa
+        if (self._queue.push(entry) or was_empty) and self._wakeup is not None:
+            self._wakeup.set()
+        return entry
+
+    def cancel(self, entry):
+        """Cancella una entry pianificata."""
+        # SEQ a None indica una entry già estratta dalla coda (scaduta)
+        if entry is None or entry[SEQ] is None or entry[COMMAND] is None:
+            return False
+        if self.journal is not None:
+            self.journal.record_removed(entry[SEQ], entry[USER_ID], entry[COMMAND])
+        self._queue.cancel(entry)
+        return True
+
+    def restore(self, now=None, records=None):
+        """Ripianifica le notifiche ancora in attesa lette dal journal.
+
+        Con `records` (es. dallo snapshot dello stato) si usano quei record
+        invece di rileggere il journal.
+        Le notifiche già scadute durante il fermo vengono scartate.
+        Restituisce le entry create, insieme al record del journal.
+        """
+        if self.journal is None:
+            return []
+        if now is None:
+            now = time.time()
+        if records is None:
+            records = self.journal.load()
+        restored = []
+        for record in records:
+            if record["due"] <= now:
+                continue
+            entry = self.schedule(
+                record["uid"], record["cmd"], record["due"], record.get("user", ""),
+                record.get("red", False), record.get("chat"), record.get("start")
+            )
+            restored.append((entry, record))
+        # Il journal riparte con le sole entry appena ripianificate
+        self.journal.compact()
+        return restored
+
+    def pending_count(self):
+        """Numero di notifiche ancora in attesa."""
+        return len(self._queue)
+
+    def start(self, bot):
+        """Avvia il loop di risveglio usando il bot fornito per l'invio."""
+        self._bot = bot
+        if self._loop_task is None or self._loop_task.done():
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"[Scheduler] Started ({self.mode}) with {self.pending_count()} pending notifications")
+
+    async def stop(self):
+        """Ferma il loop di risveglio (le entry in attesa restano in coda)."""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        if self.journal is not None:
+            self.journal.close()
+
+    async def _run(self):
+        while True:
+            for entry in self._queue.pop_due(time.time()):
+                if self.journal is not None:
+                    self.journal.record_removed(entry[SEQ], entry[USER_ID], entry[COMMAND])
+                entry[SEQ] = None
+                self._dispatch(entry)
+
+            next_due = self._queue.next_due()
+            timeout = None if next_due is None else max(0, next_due - time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, entry):
+        command = entry[COMMAND]
+        handler = self._handlers.get(command)
+        if handler is None:
+            logger.error(f"[Scheduler] No handler registered for command '{command}'")
+            return
+        # Il task vive solo per la durata dell'invio, non per tutto il cooldown
+        asyncio.create_task(self._run_handler(handler, entry))
+
+    async def _run_handler(self, handler, entry):
+        try:
+            await handler(self._bot, entry)
+        except Exception as e:
+            logger.error(f"[Scheduler] Error in notification handler for user {entry[USER_ID]}: {e}")
+
+
+# Istanza condivisa da tutto il bot
+notification_scheduler = NotificationScheduler(SCHEDULER_MODE, NotificationJournal(JOURNAL_PATH))
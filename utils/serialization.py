@@ -0,0 +1,120 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson è opzionale: senza, si usa il modulo json della libreria standard
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack è opzionale
+    msgpack = None
+
+
+class CodecUnavailableError(Exception):
+    """Il contenuto è in un formato valido la cui libreria non è installata.
+
+    Non deriva da ValueError: il file non è corrotto e non va messo in
+    quarantena né sostituito, va installata la libreria mancante.
+    """
+
+
+class JsonCodec:
+    """JSON compatto della libreria standard (nessuna indentazione né spazi)."""
+
+    name = "json"
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+
+class OrjsonCodec:
+    """JSON compatto prodotto da orjson (stesso formato di JsonCodec, più veloce)."""
+
+    name = "orjson"
+
+    def dumps(self, data):
+        # Le chiavi non stringa (es. ID numerici) vengono convertite come farebbe json
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, payload):
+        return orjson.loads(payload)
+
+
+class MsgpackCodec:
+    """MessagePack binario: file più piccoli, non leggibili a mano."""
+
+    name = "msgpack"
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload):
+        # strict_map_key=False: ammette chiavi intere come quelle scritte da JSON convertito
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+_CODECS = {"json": JsonCodec, "orjson": OrjsonCodec, "msgpack": MsgpackCodec}
+_AVAILABLE = {"json": True, "orjson": orjson is not None, "msgpack": msgpack is not None}
+
+
+def available_codecs():
+    """Nomi dei codec utilizzabili con le librerie installate."""
+    return [name for name, available in _AVAILABLE.items() if available]
+
+
+def get_codec(name):
+    """Codec per nome; se la libreria necessaria manca si ripiega sul JSON compatto.
+
+    "auto" sceglie il JSON compatto, prodotto con orjson se è installato.
+    """
+    name = (name or "auto").lower()
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name not in _CODECS:
+        raise ValueError(f"Codec sconosciuto: {name} (disponibili: {', '.join(_CODECS)})")
+    if not _AVAILABLE[name]:
+        print(f"Codec {name} non disponibile (libreria non installata): uso json")
+        name = "json"
+    return _CODECS[name]()
+
+
+def detect_format(payload):
+    """Formato di un contenuto letto da disco: "json", "msgpack" o None se non riconosciuto.
+
+    Tutti i file salvati contengono un oggetto: in JSON inizia con `{` o `[`,
+    in msgpack con il byte di una mappa (fixmap, map16 o map32). Un file
+    vuoto, troncato o con altri byte iniziali non è in nessuno dei due.
+    """
+    stripped = payload.lstrip()
+    if stripped[:1] in (b"{", b"["):
+        return "json"
+    if payload and (0x80 <= payload[0] <= 0x8f or payload[0] in (0xde, 0xdf)):
+        return "msgpack"
+    return None
+
+
+def decode(payload):
+    """Decodifica un contenuto in qualsiasi formato supportato, riconoscendolo dai primi byte.
+
+    Così una directory con file in formati diversi (ad esempio durante una
+    ricodifica) resta leggibile. Solleva ValueError se il contenuto non è valido
+    e CodecUnavailableError se è msgpack ma la libreria non è installata.
+    """
+    payload_format = detect_format(payload)
+    if payload_format == "json":
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload)
+    if payload_format is None:
+        raise ValueError(f"Contenuto non riconosciuto ({len(payload)} byte, inizio {payload[:4]!r})")
+    if msgpack is None:
+        raise CodecUnavailableError("Contenuto in formato msgpack ma la libreria msgpack non è installata")
+    try:
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    except Exception as e:
+        # Le eccezioni di msgpack non derivano tutte da ValueError
+        raise ValueError(f"Contenuto msgpack non valido: {e}") from e
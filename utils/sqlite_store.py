@@ -0,0 +1,243 @@
+import json
+import time
+import sqlite3
+import threading
+
+# Colonne della tabella players che corrispondono a chiavi di primo livello del profilo
+_PLAYER_COLUMNS = ("username", "register_date", "last_active")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL DEFAULT '',
+    register_date INTEGER NOT NULL DEFAULT 0,
+    last_active INTEGER NOT NULL DEFAULT 0,
+    daily_stats INTEGER NOT NULL DEFAULT 0,
+    startup_notifications INTEGER NOT NULL DEFAULT 0,
+    preferred_notification_chat INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS notification_settings (
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    enabled INTEGER NOT NULL,
+    PRIMARY KEY (user_id, command)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS command_stats (
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    today INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    day INTEGER,
+    PRIMARY KEY (user_id, command)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS last_timers (
+    user_id INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (user_id, command)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quarantined_players (
+    user_id INTEGER NOT NULL,
+    quarantined_at INTEGER NOT NULL,
+    reason TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_players_daily_stats ON players(user_id) WHERE daily_stats = 1;
+CREATE INDEX IF NOT EXISTS idx_last_timers_started_at ON last_timers(started_at);
+"""
+
+
+class SQLitePlayerStore:
+    """Archivio dei profili su SQLite in modalità WAL.
+
+    Impostazioni, statistiche per comando e ultimi timer sono in tabelle
+    normalizzate, così le operazioni sull'intera popolazione diventano
+    singole query indicizzate invece di N aperture di file.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # La connessione è condivisa tra il loop e i thread del flusher, protetta da un lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL in WAL: un fsync del log per ogni commit, cioè uno per blocco di scritture
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+        self._ensure_column("command_stats", "day", "INTEGER")
+        self._conn.commit()
+
+    def _ensure_column(self, table, column, definition):
+        """Aggiunge una colonna ai database creati con uno schema precedente."""
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def read(self, user_id):
+        """Legge il profilo di un utente; None se non esiste."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT username, register_date, last_active, daily_stats, startup_notifications, "
+                "preferred_notification_chat, extra FROM players WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            notifications = self._conn.execute(
+                "SELECT command, enabled FROM notification_settings WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            stats = self._conn.execute(
+                "SELECT command, today, total, day FROM command_stats WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            timers = self._conn.execute(
+                "SELECT command, started_at FROM last_timers WHERE user_id = ?", (user_id,)
+            ).fetchall()
+
+        username, register_date, last_active, daily_stats, startup, preferred_chat, extra = row
+        data = json.loads(extra) if extra else {}
+        data.update({
+            "settings": {
+                "notifications": {command: bool(enabled) for command, enabled in notifications},
+                "startup_notifications": bool(startup),
+                "daily_stats": bool(daily_stats),
+                "preferred_notification_chat": preferred_chat,
+            },
+            "stats": {
+                command: {"today": today, "total": total, "day": day} if day is not None
+                else {"today": today, "total": total}
+                for command, today, total, day in stats
+            },
+            "last_timers": {command: started_at for command, started_at in timers},
+            "username": username,
+            "register_date": register_date,
+            "last_active": last_active,
+        })
+        return data
+
+    def encode(self, user_id, data):
+        """Converte il profilo nelle righe delle tabelle (chiamata sul thread del loop)."""
+        settings = data.get("settings", {})
+        extra = {
+            key: value for key, value in data.items()
+            if key not in ("settings", "stats", "last_timers") + _PLAYER_COLUMNS
+        }
+        player_row = (
+            user_id,
+            data.get("username", "") or "",
+            int(data.get("register_date", 0) or 0),
+            int(data.get("last_active", 0) or 0),
+            int(bool(settings.get("daily_stats", False))),
+            int(bool(settings.get("startup_notifications", False))),
+            settings.get("preferred_notification_chat"),
+            json.dumps(extra) if extra else None,
+        )
+        notification_rows = [
+            (user_id, command, int(bool(enabled)))
+            for command, enabled in settings.get("notifications", {}).items()
+        ]
+        stats_rows = [
+            (user_id, command, stats.get("today", 0), stats.get("total", 0), stats.get("day"))
+            for command, stats in data.get("stats", {}).items()
+        ]
+        timer_rows = [
+            (user_id, command, timestamp)
+            for command, timestamp in data.get("last_timers", {}).items()
+            if timestamp
+        ]
+        return player_row, notification_rows, stats_rows, timer_rows
+
+    def write_batch(self, batch):
+        """Scrive un blocco di profili in un'unica transazione (group commit)."""
+        with self._lock, self._conn:
+            for user_id, (player_row, notification_rows, stats_rows, timer_rows) in batch:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO players (user_id, username, register_date, last_active, "
+                    "daily_stats, startup_notifications, preferred_notification_chat, extra) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    player_row
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO notification_settings (user_id, command, enabled) VALUES (?, ?, ?)",
+                    notification_rows
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO command_stats (user_id, command, today, total, day) VALUES (?, ?, ?, ?, ?)",
+                    stats_rows
+                )
+                self._conn.execute("DELETE FROM last_timers WHERE user_id = ?", (user_id,))
+                self._conn.executemany(
+                    "INSERT INTO last_timers (user_id, command, started_at) VALUES (?, ?, ?)",
+                    timer_rows
+                )
+
+    def iter_user_ids(self):
+        """Restituisce gli ID di tutti i profili salvati."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM players")]
+
+    def iter_profiles(self):
+        """Itera su (user_id, dati) per tutti i profili salvati."""
+        for user_id in self.iter_user_ids():
+            data = self.read(user_id)
+            if data is not None:
+                yield user_id, data
+
+    def subscribed_users(self):
+        """Utenti iscritti alle statistiche giornaliere (indice parziale)."""
+        with self._lock:
+            return [
+                row[0] for row in
+                self._conn.execute("SELECT user_id FROM players WHERE daily_stats = 1")
+            ]
+
+    def last_timers(self):
+        """Restituisce (user_id, comando, timestamp) per tutti i timer avviati."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, command, started_at FROM last_timers WHERE started_at > 0"
+            ).fetchall()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+    def import_profiles(self, profiles, batch_size=500):
+        """Importa profili (user_id, dati) da un altro archivio, a blocchi."""
+        imported = 0
+        batch = []
+        for user_id, data in profiles:
+            batch.append((user_id, self.encode(user_id, data)))
+            if len(batch) >= batch_size:
+                self.write_batch(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+            imported += len(batch)
+        return imported
+
+    def quarantine(self, user_id, file_path=None, reason=""):
+        """Conserva una copia del profilo che non è stato possibile caricare.
+
+        Le righe vengono sostituite in una transazione, quindi non esistono
+        profili troncati: la copia serve solo a non perdere dati che il
+        profilo nuovo sovrascriverebbe.
+        """
+        try:
+            data = self.read(user_id)
+        except Exception as e:
+            data = None
+            reason = f"{reason}; lettura fallita: {e}"
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO quarantined_players (user_id, quarantined_at, reason, data) VALUES (?, ?, ?, ?)",
+                (user_id, int(time.time()), reason, json.dumps(data) if data is not None else None)
+            )
+        print(f"Profilo {user_id} non caricabile ({reason}): copia conservata in quarantined_players")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
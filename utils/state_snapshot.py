@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+from utils.json_store import fsync_directory
+from utils.serialization import decode
+
+# Versione del formato dello snapshot (non dello schema dei profili)
+SNAPSHOT_FORMAT = 1
+
+
+class StateSnapshotStore:
+    """Snapshot dello stato in memoria del bot in un unico file compatto.
+
+    Il file è formato da una riga JSON di intestazione (formato, istante,
+    lunghezza e CRC32 del contenuto) seguita dal contenuto serializzato con
+    il codec configurato. Ogni scrittura passa da un file temporaneo e il
+    precedente snapshot resta come `.prev`: all'avvio si usa il più recente
+    che supera il controllo del CRC.
+
+    Lo snapshot è "fresco" (identico a ciò che c'è su disco) finché nessun
+    profilo viene scritto dopo la sua cattura: `invalidate()` va chiamata
+    prima di ogni scrittura di profili e rimuove il file marcatore. Solo uno
+    snapshot fresco può ripopolare cache e timer senza rileggere l'archivio;
+    da uno non fresco si riprendono solo i contatori giornalieri.
+    """
+
+    def __init__(self, path, codec):
+        self.path = path
+        self.prev_path = path + ".prev"
+        self.marker_path = path + ".fresh"
+        self.codec = codec
+        # Numero di scritture di profili dall'avvio: una cattura è fresca se non è cambiato
+        self._generation = 0
+        self._marker = os.path.exists(self.marker_path)
+        self._lock = threading.Lock()
+        self.last_taken_at = None
+        self.last_seconds = None
+        self.last_size = None
+
+    def generation(self):
+        return self._generation
+
+    def invalidate(self):
+        """Segnala che i profili su disco stanno per cambiare (chiamata da qualsiasi thread)."""
+        with self._lock:
+            self._generation += 1
+            if self._marker:
+                try:
+                    os.unlink(self.marker_path)
+                except FileNotFoundError:
+                    pass
+                # La rimozione deve arrivare su disco prima dei profili nuovi
+                fsync_directory(os.path.dirname(self.marker_path))
+                self._marker = False
+
+    def write(self, state, generation):
+        """Scrive lo snapshot (bloccante: da eseguire in un thread).
+
+        `generation` è il valore di `generation()` al momento della cattura:
+        se nel frattempo sono stati scritti profili, lo snapshot non viene
+        marcato come fresco.
+        """
+        start = time.perf_counter()
+        payload = self.codec.dumps(state)
+        header = {
+            "format": SNAPSHOT_FORMAT, "codec": self.codec.name, "taken_at": state["taken_at"],
+            "length": len(payload), "crc32": zlib.crc32(payload),
+        }
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            if os.path.exists(self.path):
+                os.replace(self.path, self.prev_path)
+            os.replace(tmp_path, self.path)
+            fresh = generation == self._generation
+            if fresh:
+                with open(self.marker_path, 'w') as f:
+                    f.write(str(state["taken_at"]))
+            elif self._marker:
+                os.unlink(self.marker_path)
+            self._marker = fresh
+        fsync_directory(directory)
+        self.last_taken_at = state["taken_at"]
+        self.last_seconds = time.perf_counter() - start
+        self.last_size = len(payload)
+        return fresh
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            payload = f.read()
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"formato {header.get('format')} non supportato")
+        if len(payload) != header["length"] or zlib.crc32(payload) != header["crc32"]:
+            raise ValueError("contenuto incompleto o corrotto")
+        return decode(payload)
+
+    def load(self):
+        """Restituisce (stato, fresco) dal più recente snapshot valido, o (None, False)."""
+        for path in (self.path, self.prev_path):
+            try:
+                state = self._read(path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Snapshot {path} non valido, ignorato: {e}")
+                continue
+            fresh = False
+            if path == self.path:
+                try:
+                    with open(self.marker_path, 'r') as f:
+                        fresh = float(f.read()) == state["taken_at"]
+                except (OSError, ValueError):
+                    fresh = False
+            return state, fresh
+        return None, False
+
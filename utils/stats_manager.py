@@ -1,11 +1,26 @@
 import os
 import json
 import time
+import threading
+from array import array
 from typing import Dict, Any, Set
 
+from utils.hyperloglog import SketchStore
+from utils.serialization import CodecUnavailableError, decode, get_codec
+from utils.timer_data import config
+
 # Path per le statistiche globali
 STATS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'global_stats.json')
 ADMIN_PREFS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'admin_preferences.json')
+# Sketch HyperLogLog degli utenti unici, uno per giorno più quello cumulativo
+HLL_DIR_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'hll')
+# Serie storica oraria degli utilizzi per comando
+USAGE_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'usage_hourly.bin')
+
+unique_users_store = SketchStore(HLL_DIR_PATH)
+
+# Formato di scrittura di global_stats.json: "auto" (JSON compatto), "json", "orjson" o "msgpack"
+STATS_CODEC = get_codec(config.get('stats', 'codec', fallback='auto'))
 
 def ensure_data_directory():
     """Assicura che la directory data esista."""
@@ -47,8 +62,12 @@ def load_global_stats() -> Dict[str, Any]:
         }
     
     try:
-        with open(STATS_FILE_PATH, 'r') as file:
-            return json.load(file)
+        with open(STATS_FILE_PATH, 'rb') as file:
+            # Il formato (JSON o msgpack) è riconosciuto dal contenuto
+            return decode(file.read())
+    except CodecUnavailableError:
+        # Ripartire da zero sovrascriverebbe le statistiche al prossimo salvataggio
+        raise
     except Exception as e:
         print(f"Errore nel caricamento delle statistiche globali: {e}")
         return {
@@ -88,39 +107,42 @@ def save_global_stats(stats: Dict[str, Any]) -> bool:
         if "unique_users" in stats["daily"] and isinstance(stats["daily"]["unique_users"], set):
             stats["daily"]["unique_users"] = len(stats["daily"]["unique_users"])
         
-        with open(STATS_FILE_PATH, 'w') as file:
-            json.dump(stats, file, indent=2)
+        with open(STATS_FILE_PATH, 'wb') as file:
+            file.write(STATS_CODEC.dumps(stats))
         return True
     except Exception as e:
         print(f"Errore nel salvataggio delle statistiche globali: {e}")
         return False
 
-def update_global_stats(daily_stats):
-    """Aggiorna le statistiche globali con i dati correnti."""
+def update_global_stats(snapshot):
+    """Aggiorna le statistiche globali con la giornata chiusa `snapshot` (un DailyBuffer congelato).
+
+    Una giornata già salvata (ad esempio ripresa da uno snapshot catturato
+    prima della chiusura) non viene sommata una seconda volta.
+    """
     stats = load_global_stats()
     
+    day = snapshot.day.isoformat()
+    if stats.get("closed_day", "") >= day:
+        print(f"Statistiche del {day} già salvate, ignorate")
+        return stats
+    
+    # Salva lo sketch degli utenti unici del giorno e lo unisce a quello di sempre
+    all_time = unique_users_store.save_day(snapshot.day, snapshot.users)
+    
     # Aggiorna le statistiche giornaliere
-    stats["daily"] = {
-        "avventura": daily_stats["avventura"],
-        "slot": daily_stats["slot"],
-        "borsellino": daily_stats["borsellino"],
-        "nanoc": daily_stats["nanoc"],
-        "nanor": daily_stats["nanor"],
-        "gica": daily_stats["gica"],
-        "pozzo": daily_stats["pozzo"],
-        "sonda": daily_stats["sonda"],
-        "forno": daily_stats["forno"],
-        "unique_users": len(daily_stats["unique_users"])
-    }
+    stats["daily"] = dict(snapshot.counts)
+    stats["daily"]["unique_users"] = snapshot.unique_users
     
-    # Aggiorna le statistiche totali
-    for key in stats["daily"]:
-        if key == "unique_users":
-            continue  # Questo è un caso speciale, non sommiamo direttamente
-        stats["total"][key] += daily_stats[key]
+    # Aggiorna le statistiche totali (i comandi aggiunti dopo la creazione del file partono da 0)
+    for key, count in snapshot.items():
+        stats["total"][key] = stats["total"].get(key, 0) + count
+    # Gli utenti unici non si sommano: il totale è la stima dello sketch cumulativo
+    stats["total"]["unique_users"] = all_time.count()
     
-    # Aggiorna il timestamp dell'ultimo aggiornamento
+    # Aggiorna il timestamp dell'ultimo aggiornamento e l'ultima giornata salvata
     stats["last_reset"] = int(time.time())
+    stats["closed_day"] = day
     
     save_global_stats(stats)
     return stats
@@ -165,3 +187,134 @@ def should_send_admin_stats() -> bool:
     """Verifica se l'admin dovrebbe ricevere le statistiche giornaliere."""
     prefs = get_admin_preferences()
     return prefs.get("receive_daily_stats", True)
+
+
+class UsageTimeSeries:
+    """Utilizzi orari per comando in buffer circolari a dimensione fissa.
+
+    Ogni comando ha un `array('I')` di `hours` celle: l'ora assoluta h (ore
+    dall'epoch, UTC) finisce nella cella `h % hours`, che viene azzerata
+    quando il buffer la riusa. La memoria e il file restano costanti (90
+    giorni x 10 comandi = circa 84 KiB) e le ore più vecchie escono da sole.
+
+    `record()` è chiamato dagli handler sul thread del loop e incrementa solo
+    un piccolo dizionario in memoria. Il job periodico prende quel dizionario
+    con `take_pending()` (sempre sul loop) e lo applica ai buffer con
+    `apply()` in un thread, salvando il file.
+
+    Formato del file: una riga JSON di intestazione (`hours`, `head_hour`,
+    `commands`) seguita dagli array dei comandi nello stesso ordine.
+    """
+
+    def __init__(self, path, days=90):
+        self.path = path
+        self.hours = days * 24
+        self.head_hour = None  # Ora più recente presente nei buffer
+        self.series = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def record(self, command, timestamp=None):
+        """Conta un utilizzo nell'ora corrente (solo in memoria fino al prossimo flush)."""
+        key = (int((timestamp or time.time()) // 3600), command)
+        self._pending[key] = self._pending.get(key, 0) + 1
+
+    def take_pending(self):
+        """Restituisce gli utilizzi accumulati e ricomincia con un accumulatore vuoto."""
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as file:
+                header = json.loads(file.readline())
+                if header["hours"] != self.hours:
+                    print(f"Serie oraria con {header['hours']} ore invece di {self.hours}: ricreata")
+                    return
+                for command in header["commands"]:
+                    counts = array('I')
+                    counts.fromfile(file, self.hours)
+                    self.series[command] = counts
+                self.head_hour = header["head_hour"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Errore nel caricamento della serie oraria degli utilizzi: {e}")
+            self.series = {}
+            self.head_hour = None
+
+    def _save(self):
+        ensure_data_directory()
+        header = {"hours": self.hours, "head_hour": self.head_hour, "commands": list(self.series)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            for counts in self.series.values():
+                counts.tofile(file)
+        os.replace(tmp_path, self.path)
+
+    def _advance(self, hour):
+        """Porta la testa del buffer a `hour`, azzerando le celle delle ore che vengono riusate."""
+        if self.head_hour is not None and hour <= self.head_hour:
+            return
+        start = hour - self.hours + 1 if self.head_hour is None else max(self.head_hour + 1, hour - self.hours + 1)
+        for h in range(start, hour + 1):
+            slot = h % self.hours
+            for counts in self.series.values():
+                counts[slot] = 0
+        self.head_hour = hour
+
+    def _counts_for(self, command):
+        counts = self.series.get(command)
+        if counts is None:
+            counts = self.series[command] = array('I', bytes(4 * self.hours))
+        return counts
+
+    def apply(self, pending, save=True):
+        """Somma ai buffer gli utilizzi presi con `take_pending()` e salva il file (in un thread)."""
+        with self._lock:
+            self._load()
+            if pending:
+                self._advance(max(hour for hour, _ in pending))
+            oldest = self.head_hour - self.hours + 1 if self.head_hour is not None else None
+            for (hour, command), count in pending.items():
+                if oldest is not None and hour < oldest:
+                    continue  # Fuori dalla finestra conservata
+                self._counts_for(command)[hour % self.hours] += count
+            if save and pending:
+                self._save()
+
+    def hourly(self, hours, now=None):
+        """Utilizzi delle ultime `hours` ore per comando: {comando: [conteggi dal più vecchio]}."""
+        now_hour = int((now or time.time()) // 3600)
+        hours = min(hours, self.hours)
+        with self._lock:
+            self._load()
+            self._advance(now_hour)
+            slots = [h % self.hours for h in range(now_hour - hours + 1, now_hour + 1)]
+            return {command: [counts[slot] for slot in slots] for command, counts in self.series.items()}
+
+    def peak_hours(self, days, now=None):
+        """Utilizzi totali per ora del giorno (ora locale 0-23) negli ultimi `days` giorni."""
+        now_hour = int((now or time.time()) // 3600)
+        by_hour = [0] * 24
+        for command, counts in self.hourly(days * 24, now).items():
+            first_hour = now_hour - len(counts) + 1
+            for offset, count in enumerate(counts):
+                if count:
+                    by_hour[time.localtime((first_hour + offset) * 3600).tm_hour] += count
+        return by_hour
+
+    def daily_totals(self, days, now=None):
+        """Utilizzi per comando in ciascuno degli ultimi `days` periodi di 24 ore (dal più vecchio)."""
+        totals = {}
+        for command, counts in self.hourly(days * 24, now).items():
+            totals[command] = [sum(counts[i:i + 24]) for i in range(0, len(counts), 24)]
+        return totals
+
+
+usage_series = UsageTimeSeries(USAGE_FILE_PATH)
@@ -2,6 +2,10 @@ import time
 import configparser
 import os
 
+from utils.timer_table import create_timer_table
+from utils.daily_counters import DailyCounters
+from utils.user_registry import UserRegistry
+
 # Leggi il token dal file di configurazione
 config = configparser.ConfigParser()
 config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.ini')
@@ -43,21 +47,20 @@ EMOJIS = {
     "compattatore": "🗜️",  # Emoji per compattatore
 }
 
-# Statistiche giornaliere
-daily_stats = {
-    "avventura": 0,
-    "slot": 0,
-    "borsellino": 0, 
-    "nanoc": 0,
-    "nanor": 0,
-    "gica": 0,
-    "pozzo": 0,
-    "sonda": 0,
-    "forno": 0,
-    "compattatore": 0,  # Aggiunto contatore per compattatore
-    "unique_users": set()  # Set per utenti unici
+# --- Alias ---
+# Nomi accettati da "/usa <alias>"; i comandi senza alias si avviano direttamente (es. /avventura)
+ALIASES = {
+    "avventura": [],
+    "slot": ["sl", "slo", "slot"],
+    "borsellino": ["borsellino", "borse", "bors", "sel", "sell", "sellino"],
+    "nanoc": ["nanoc"], "nanor": ["nanor"], "gica": ["gica"],
+    "pozzo": ["pozzo"], "sonda": ["sonda"], "forno": ["forno"],
+    "compattatore": ["compattatore", "comp"],
 }
 
+# Statistiche giornaliere: contatori a doppio buffer, scambiati a mezzanotte
+daily_stats = DailyCounters(COOLDOWNS)
+
 # Strutture per tracciare le statistiche individuali di utilizzo per ogni utente
 # Formato: {user_id: {command: {"today": count, "total": count}}}
 user_stats = {}
@@ -67,17 +70,20 @@ daily_stats_subscribers = set()
 
 ADMIN_USERNAME = "LucaQuelloFigo"  # L'username che riceverà le statistiche
 
-# Dictionaries to track timer data
-avventura_times = {}  # Struttura: {user_id: timestamp}
-slot_times = {}
-borsellino_times = {}
-nanoc_times = {}
-nanor_times = {}
-gica_times = {}
-pozzo_times = {}
-sonda_times = {}
-forno_times = {}
-compattatore_times = {}  # Struttura: {user_id: timestamp}
+# Avvii dei timer: tabella colonnare (utenti x comandi) su NumPy se disponibile.
+# Ogni colonna resta accessibile come un dict {user_id: timestamp}.
+timer_table = create_timer_table(COOLDOWNS, use_numpy=config.getboolean('timers', 'numpy_table', fallback=True))
+
+avventura_times = timer_table.column("avventura")  # Struttura: {user_id: timestamp}
+slot_times = timer_table.column("slot")
+borsellino_times = timer_table.column("borsellino")
+nanoc_times = timer_table.column("nanoc")
+nanor_times = timer_table.column("nanor")
+gica_times = timer_table.column("gica")
+pozzo_times = timer_table.column("pozzo")
+sonda_times = timer_table.column("sonda")
+forno_times = timer_table.column("forno")
+compattatore_times = timer_table.column("compattatore")  # Struttura: {user_id: timestamp}
 
 # Set per memorizzare quali utenti hanno disattivato le notifiche
 disabled_avventura = set()
@@ -91,8 +97,8 @@ disabled_sonda = set()
 disabled_forno = set()
 disabled_compattatore = set()
 
-# Dizionari per tenere traccia dei task attivi per ogni comando
-active_avventura_tasks = {}  # {user_id: task}
+# Dizionari per tenere traccia delle notifiche pianificate per ogni comando
+active_avventura_tasks = {}  # {user_id: entry dello scheduler}
 active_slot_tasks = {}
 active_borsellino_tasks = {}
 active_nanoc_tasks = {}
@@ -106,37 +112,35 @@ active_compattatore_tasks = {}
 # Set per memorizzare gli utenti che hanno avviato il bot
 registered_users = set()
 
-# Funzione per salvare gli utenti registrati al bot in config.ini
-def save_registered_users():
-    # Converti il set in una stringa con gli ID separati da virgole
-    users_str = ','.join([str(user_id) for user_id in registered_users])
-    
-    # Assicurati che esista la sezione 'users'
-    if 'users' not in config:
-        config['users'] = {}
-    
-    config['users']['registered_ids'] = users_str
-    
+# Registro su file (un ID per riga, solo append): config.ini non viene mai riscritto a runtime
+REGISTERED_USERS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'registered_users.log')
+user_registry = UserRegistry(REGISTERED_USERS_PATH, registered_users)
+
+def register_user(user_id):
+    """Registra un utente che ha avviato il bot. Restituisce True se è nuovo."""
     try:
-        with open(config_path, 'w') as configfile:
-            config.write(configfile)
-        print(f"Saved {len(registered_users)} registered users to config.")
-    except Exception as e:
-        print(f"Error saving registered users: {e}")
+        return user_registry.register(user_id)
+    except OSError as e:
+        print(f"Error saving registered user {user_id}: {e}")
+        return False
 
-# Funzione per caricare gli utenti registrati da config.ini
+# Funzione per caricare gli utenti registrati
 def load_registered_users():
     try:
-        if 'users' in config and 'registered_ids' in config['users']:
-            users_str = config['users']['registered_ids']
-            if users_str:
-                ids = users_str.split(',')
-                for id_str in ids:
-                    try:
-                        registered_users.add(int(id_str))
-                    except ValueError:
-                        print(f"Warning: Invalid user ID in config: {id_str}")
-            print(f"Loaded {len(registered_users)} registered users from config.")
+        user_registry.load()
+        # Primo avvio con il registro: importa una sola volta gli ID salvati in config.ini
+        if not os.path.exists(REGISTERED_USERS_PATH) and 'users' in config and 'registered_ids' in config['users']:
+            legacy_ids = []
+            for id_str in config['users']['registered_ids'].split(','):
+                if not id_str:
+                    continue
+                try:
+                    legacy_ids.append(int(id_str))
+                except ValueError:
+                    print(f"Warning: Invalid user ID in config: {id_str}")
+            user_registry.import_ids(legacy_ids)
+            print("Imported registered users from config.ini (the [users] section is no longer updated).")
+        print(f"Loaded {len(registered_users)} registered users.")
     except Exception as e:
         print(f"Error loading registered users: {e}")
 
@@ -146,14 +150,14 @@ load_registered_users()
 # --- All Timer Data ---
 # Combine times dicts, cooldowns, disabled sets, active tasks, etc. for easier iteration
 TIMER_DATA = {
-    "avventura": {"times": avventura_times, "disabled": disabled_avventura, "active": active_avventura_tasks, "cooldown": COOLDOWNS["avventura"], "emoji": EMOJIS["avventura"]},
-    "slot": {"times": slot_times, "disabled": disabled_slot, "active": active_slot_tasks, "cooldown": COOLDOWNS["slot"], "emoji": EMOJIS["slot"]},
-    "borsellino": {"times": borsellino_times, "disabled": disabled_borsellino, "active": active_borsellino_tasks, "cooldown": COOLDOWNS["borsellino"], "emoji": EMOJIS["borsellino"]},
-    "nanoc": {"times": nanoc_times, "disabled": disabled_nanoc, "active": active_nanoc_tasks, "cooldown": COOLDOWNS["nanoc"], "emoji": EMOJIS["nanoc"]},
-    "nanor": {"times": nanor_times, "disabled": disabled_nanor, "active": active_nanor_tasks, "cooldown": COOLDOWNS["nanor"], "emoji": EMOJIS["nanor"]},
-    "gica": {"times": gica_times, "disabled": disabled_gica, "active": active_gica_tasks, "cooldown": COOLDOWNS["gica"], "emoji": EMOJIS["gica"]},
-    "pozzo": {"times": pozzo_times, "disabled": disabled_pozzo, "active": active_pozzo_tasks, "cooldown": COOLDOWNS["pozzo"], "emoji": EMOJIS["pozzo"]},
-    "sonda": {"times": sonda_times, "disabled": disabled_sonda, "active": active_sonda_tasks, "cooldown": COOLDOWNS["sonda"], "emoji": EMOJIS["sonda"]},
-    "forno": {"times": forno_times, "disabled": disabled_forno, "active": active_forno_tasks, "cooldown": COOLDOWNS["forno"], "emoji": EMOJIS["forno"]},
-    "compattatore": {"times": compattatore_times, "disabled": disabled_compattatore, "active": active_compattatore_tasks, "cooldown": COOLDOWNS["compattatore"], "emoji": EMOJIS["compattatore"]},
+    "avventura": {"times": avventura_times, "disabled": disabled_avventura, "active": active_avventura_tasks, "cooldown": COOLDOWNS["avventura"], "emoji": EMOJIS["avventura"], "aliases": ALIASES["avventura"]},
+    "slot": {"times": slot_times, "disabled": disabled_slot, "active": active_slot_tasks, "cooldown": COOLDOWNS["slot"], "emoji": EMOJIS["slot"], "aliases": ALIASES["slot"]},
+    "borsellino": {"times": borsellino_times, "disabled": disabled_borsellino, "active": active_borsellino_tasks, "cooldown": COOLDOWNS["borsellino"], "emoji": EMOJIS["borsellino"], "aliases": ALIASES["borsellino"]},
+    "nanoc": {"times": nanoc_times, "disabled": disabled_nanoc, "active": active_nanoc_tasks, "cooldown": COOLDOWNS["nanoc"], "emoji": EMOJIS["nanoc"], "aliases": ALIASES["nanoc"]},
+    "nanor": {"times": nanor_times, "disabled": disabled_nanor, "active": active_nanor_tasks, "cooldown": COOLDOWNS["nanor"], "emoji": EMOJIS["nanor"], "aliases": ALIASES["nanor"]},
+    "gica": {"times": gica_times, "disabled": disabled_gica, "active": active_gica_tasks, "cooldown": COOLDOWNS["gica"], "emoji": EMOJIS["gica"], "aliases": ALIASES["gica"]},
+    "pozzo": {"times": pozzo_times, "disabled": disabled_pozzo, "active": active_pozzo_tasks, "cooldown": COOLDOWNS["pozzo"], "emoji": EMOJIS["pozzo"], "aliases": ALIASES["pozzo"]},
+    "sonda": {"times": sonda_times, "disabled": disabled_sonda, "active": active_sonda_tasks, "cooldown": COOLDOWNS["sonda"], "emoji": EMOJIS["sonda"], "aliases": ALIASES["sonda"]},
+    "forno": {"times": forno_times, "disabled": disabled_forno, "active": active_forno_tasks, "cooldown": COOLDOWNS["forno"], "emoji": EMOJIS["forno"], "aliases": ALIASES["forno"]},
+    "compattatore": {"times": compattatore_times, "disabled": disabled_compattatore, "active": active_compattatore_tasks, "cooldown": COOLDOWNS["compattatore"], "emoji": EMOJIS["compattatore"], "aliases": ALIASES["compattatore"]},
 }
@@ -1,13 +1,16 @@
-import asyncio
 import time
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from utils.formatters import format_remaining_time, parse_dhms_time
+from utils.formatters import format_remaining_time
 from utils.helpers import cancel_active_task
+from utils.scheduler import notification_scheduler, USER_ID, USERNAME, REDUCED
 from utils.messaging import send_notification
-from utils.player_data import update_player_stats, update_last_timer, get_notification_status, update_player_notification_setting, get_preferred_notification_chat
+from utils.player_data import get_notification_status, get_preferred_notification_chat, get_timer_start, player_storage, current_day
+from utils.player_record import PlayerRecord
 from utils.timer_data import daily_stats, user_stats, TIMER_DATA
+from utils.stats_manager import usage_series
+from utils.keyed_locks import user_lock
 from utils.logger import logger
 
 class TimerHandler:
@@ -29,28 +32,40 @@ class TimerHandler:
         
         # Nome visualizzato (prima lettera maiuscola)
         self.display_name = command_name.capitalize()
+
+        # Le notifiche in scadenza vengono consegnate dallo scheduler centrale
+        notification_scheduler.register_handler(command_name, self._on_notification_due)
     
     async def check_cooldown(self, user_id):
         """Verifica se il cooldown è scaduto per un utente."""
         now = time.time()
-        last_time = self.times_dict.get(user_id, 0)
+        last_time = get_timer_start(user_id, self.command_name)
         return now - last_time >= self.cooldown
     
-    async def handle_command(self, update, context, regex_match):
-        """Gestisce l'esecuzione del comando."""
-        time_str = regex_match.group(1) if regex_match else None
+    async def handle_command(self, update, context, time_str=None, total_seconds=None):
+        """Gestisce l'esecuzione del comando.
+        
+        Args:
+            time_str: Tempo rimanente indicato dall'utente (dd:hh:mm:ss), se presente
+            total_seconds: Lo stesso tempo già convertito in secondi (None se non valido)
+        """
         user = update.effective_user
         user_id = user.id
         username = user.username or f"utente_{user_id}"
         
         logger.info(f"[{self.display_name}] Processing command for user {user_id} ({username})")
         
-        if time_str:
-            await self._handle_timer_modification(update, user_id, username, time_str)
-        else:
-            await self._handle_new_timer(update, user_id, username)
+        # Con gli update concorrenti, i comandi dello stesso utente vengono eseguiti uno alla volta
+        async with user_lock(user_id):
+            # Profilo caricato fuori dal loop: le letture successive lo trovano in cache
+            await player_storage.get(user_id)
+            
+            if time_str:
+                await self._handle_timer_modification(update, user_id, username, time_str, total_seconds)
+            else:
+                await self._handle_new_timer(update, user_id, username)
     
-    async def _handle_timer_modification(self, update, user_id, username, time_str):
+    async def _handle_timer_modification(self, update, user_id, username, time_str, total_seconds):
         """Gestisce la modifica di un timer esistente."""
         logger.info(f"[{self.display_name}] Modify request detected. Time string: {time_str}")
         
@@ -63,7 +78,6 @@ class TimerHandler:
             return
             
         try:
-            total_seconds = parse_dhms_time(time_str)
             if not total_seconds:
                 await update.message.reply_text(
                     f"@{username}, formato ora non valido. Usa il formato appropriato."
@@ -85,11 +99,8 @@ class TimerHandler:
                 f"@{username}, timer {self.command_name} modificato! Ti avviserò appena pronto."
             )
             if user_id not in self.disabled_set:
-                new_task = asyncio.create_task(
-                    self._notify_after_custom_duration(update, user_id, username, total_seconds)
-                )
-                self.active_tasks[user_id] = new_task
-                logger.info(f"[{self.display_name}] Scheduled MODIFIED reduced notification task for user {user_id}")
+                self.schedule_notification(user_id, username, total_seconds, reduced=True)
+                logger.info(f"[{self.display_name}] Scheduled MODIFIED reduced notification for user {user_id}")
 
         except ValueError:
             await update.message.reply_text(f"@{username}, formato ora non valido per la modifica.")
@@ -104,7 +115,7 @@ class TimerHandler:
         
         if not await self.check_cooldown(user_id):
             now = time.time()
-            last_start_time = self.times_dict.get(user_id, 0)
+            last_start_time = get_timer_start(user_id, self.command_name)
             if last_start_time > 0:
                 elapsed_time = now - last_start_time
                 remaining_seconds = max(0, int(self.cooldown - elapsed_time))
@@ -120,13 +131,13 @@ class TimerHandler:
 
         await cancel_active_task(user_id, self.active_tasks, self.display_name)
 
-        self.times_dict[user_id] = time.time()
-        daily_stats[self.command_name] += 1
-        daily_stats["unique_users"].add(user_id)
+        started_at = time.time()
+        self.times_dict[user_id] = started_at
+        daily_stats.record(self.command_name, user_id)
+        usage_series.record(self.command_name, started_at)
         
-        # Aggiorna statistiche personali dell'utente nel sistema persistente
-        update_player_stats(user_id, self.command_name)
-        update_last_timer(user_id, self.command_name, time.time())
+        # Aggiorna statistiche personali e ultimo avvio nel profilo, in un'unica modifica
+        await player_storage.update(user_id, self._record_use, started_at)
         
         # Aggiorna statistiche in memoria (retrocompatibilità)
         if user_id not in user_stats:
@@ -152,85 +163,64 @@ class TimerHandler:
             f"{update.effective_user.mention_html()}, {self.command_name} utilizzato! Ti avviserò appena pronto.",
             parse_mode="HTML"
         )
-        task = asyncio.create_task(self._notify_after_default_duration(update, user_id, username))
-        self.active_tasks[user_id] = task
-        logger.info(f"[{self.display_name}] Scheduled standard notification task for user {user_id}")
+        self.schedule_notification(user_id, username, self.cooldown)
+        logger.info(f"[{self.display_name}] Scheduled standard notification for user {user_id}")
     
-    async def _notify_after_default_duration(self, update, user_id, username):
-        """Invia una notifica dopo la durata standard del cooldown."""
-        sleep_duration = self.cooldown
-        task_id = asyncio.current_task().get_name() if hasattr(asyncio.current_task(), 'get_name') else id(asyncio.current_task())
-        logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Sleeping for {sleep_duration} seconds ({format_remaining_time(sleep_duration)}).")
-        try:
-            await asyncio.sleep(sleep_duration)
-        except asyncio.CancelledError:
-            logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Task cancelled during sleep.")
-            raise
+    def _record_use(self, record, started_at):
+        record.increment(self.command_name, current_day())
+        record.set_last_timer(self.command_name, started_at)
 
-        logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Woke up after {sleep_duration} seconds.")
-        
-        current_active_task = self.active_tasks.get(user_id)
-        if not current_active_task or current_active_task != asyncio.current_task():
-            logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Task is no longer active or has been replaced. Exiting.")
+    def _build_message(self, username):
+        """Costruisce il messaggio di notifica per questo comando."""
+        if self.command_name == "avventura":
+            return f"@{username}, puoi tornare ad avventurare!\n/avventura@InventoryBot"
+        return f"@{username}, puoi usare di nuovo {self.command_name}!\n/usa {self.command_name}"
+
+    async def _on_notification_due(self, bot, entry):
+        """Invia la notifica quando lo scheduler segnala la scadenza del timer."""
+        user_id = entry[USER_ID]
+        username = entry[USERNAME]
+        kind = "Reduced" if entry[REDUCED] else "Default"
+
+        if self.active_tasks.get(user_id) is not entry:
+            logger.info(f"[{self.display_name} {kind}] User {user_id}: Notification is no longer active or has been replaced. Skipping.")
             return
 
         try:
-            logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Sending notification.")
-            
-            # Personalizza il messaggio in base al comando
-            if self.command_name == "avventura":
-                message = f"@{username}, puoi tornare ad avventurare!\n/avventura@InventoryBot"
-            else:
-                message = f"@{username}, puoi usare di nuovo {self.command_name}!\n/usa {self.command_name}"
-                
-            await send_notification(update, user_id, username, message, self.display_name)
+            logger.info(f"[{self.display_name} {kind}] User {user_id}: Sending notification.")
+            if entry[REDUCED]:
+                async with user_lock(user_id):
+                    # Un comando eseguito nel frattempo può aver sostituito la notifica
+                    if self.active_tasks.get(user_id) is entry:
+                        past_time = time.time() - self.cooldown - 1  # -1 per sicurezza
+                        self.times_dict[user_id] = past_time
+                        # Anche nel profilo, così il cooldown ridotto resta valido dopo un riavvio
+                        await player_storage.update(user_id, PlayerRecord.set_last_timer, self.command_name, past_time)
+                        logger.info(f"[{self.display_name} {kind}] User {user_id}: Updated timestamp to allow immediate restart.")
+
+            await send_notification(user_id, username, self._build_message(username), self.display_name)
         except Exception as e:
-            logger.error(f"[{self.display_name} Default Task {task_id}] Error sending notification for user {user_id}: {e}")
+            logger.error(f"[{self.display_name} {kind}] Error sending notification for user {user_id}: {e}")
         finally:
-            if user_id in self.active_tasks and asyncio.current_task() == self.active_tasks.get(user_id):
-                logger.info(f"[{self.display_name} Default Task {task_id}] User {user_id}: Cleaning up active task entry.")
+            if self.active_tasks.get(user_id) is entry:
                 self.active_tasks.pop(user_id, None)
 
-    async def _notify_after_custom_duration(self, update, user_id, username, total_seconds):
-        """Invia una notifica dopo una durata personalizzata."""
-        sleep_duration = total_seconds
-        task_id = asyncio.current_task().get_name() if hasattr(asyncio.current_task(), 'get_name') else id(asyncio.current_task())
-        logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Sleeping for {sleep_duration} seconds ({format_remaining_time(sleep_duration)}).")
-        try:
-            await asyncio.sleep(sleep_duration)
-        except asyncio.CancelledError:
-            logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Task cancelled during sleep.")
-            raise
+    def schedule_notification(self, user_id, username, delay, reduced=False):
+        """Pianifica la notifica per l'utente tra `delay` secondi."""
+        entry = notification_scheduler.schedule(
+            user_id, self.command_name, time.time() + delay, username, reduced,
+            chat_id=get_preferred_notification_chat(user_id),
+            started_at=self.times_dict.get(user_id)
+        )
+        self.active_tasks[user_id] = entry
+        return entry
 
-        logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Woke up after {sleep_duration} seconds.")
-        
-        current_active_task = self.active_tasks.get(user_id)
-        if not current_active_task or current_active_task != asyncio.current_task():
-            logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Task is no longer active or has been replaced. Exiting.")
-            return
-            
-        try:
-            logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Sending notification.")
-            past_time = time.time() - self.cooldown - 1  # -1 per sicurezza
-            self.times_dict[user_id] = past_time
-            logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Updated timestamp to allow immediate restart.")
-            
-            # Personalizza il messaggio in base al comando
-            if self.command_name == "avventura":
-                message = f"@{username}, puoi tornare ad avventurare!\n/avventura@InventoryBot"
-            else:
-                message = f"@{username}, puoi usare di nuovo {self.command_name}!\n/usa {self.command_name}"
-                
-            await send_notification(update, user_id, username, message, self.display_name)
-        except Exception as e:
-            logger.error(f"[{self.display_name} Reduced Task {task_id}] Error sending reduced notification for user {user_id}: {e}")
-        finally:
-            if user_id in self.active_tasks and asyncio.current_task() == self.active_tasks.get(user_id):
-                logger.info(f"[{self.display_name} Reduced Task {task_id}] User {user_id}: Cleaning up active task entry.")
-                self.active_tasks.pop(user_id, None)
-    
     async def toggle_notifications(self, update, context):
         """Attiva/disattiva le notifiche per questo comando."""
+        async with user_lock(update.effective_user.id):
+            await self._toggle_notifications(update)
+
+    async def _toggle_notifications(self, update):
         user = update.effective_user
         user_id = user.id
         username = user.username or f"utente_{user_id}"
@@ -238,13 +228,14 @@ class TimerHandler:
         logger.info(f"[{self.display_name}] Toggle command received for user {user_id} (@{username})")
         
         # Ottieni stato attuale dalle impostazioni salvate
-        notifications_enabled = get_notification_status(user_id, self.command_name)
+        record = await player_storage.get(user_id)
+        notifications_enabled = record.notification_enabled(self.command_name)
         logger.info(f"[{self.display_name}] Current notification status: {'enabled' if notifications_enabled else 'disabled'}")
         
         # Aggiorna stato notifiche (manteniamo anche il vecchio sistema per retrocompatibilità)
         if notifications_enabled:
             self.disabled_set.add(user_id)
-            update_player_notification_setting(user_id, self.command_name, False)
+            await player_storage.update(user_id, PlayerRecord.set_notification, self.command_name, False)
             await update.message.reply_text(
                 f"@{username}, ho disattivato le notifiche per {self.command_name}."
             )
@@ -252,7 +243,7 @@ class TimerHandler:
         else:
             if user_id in self.disabled_set:
                 self.disabled_set.remove(user_id)
-            update_player_notification_setting(user_id, self.command_name, True)
+            await player_storage.update(user_id, PlayerRecord.set_notification, self.command_name, True)
             await update.message.reply_text(
                 f"@{username}, ho riattivato le notifiche per {self.command_name}."
             )
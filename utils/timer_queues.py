@@ -0,0 +1,218 @@
+import heapq
+import math
+import time
+
+# Posizioni dei campi in una entry delle code dei timer.
+# Una entry è una semplice lista (come suggerito dalla documentazione di heapq)
+# così da occupare poche decine di byte invece di un intero task asyncio.
+DUE_AT, SEQ, USER_ID, COMMAND, USERNAME, REDUCED = range(6)
+
+# Marcatore per le entry cancellate ancora presenti nell'heap
+_REMOVED = None
+
+
+class HeapTimerQueue:
+    """Coda dei timer basata su un min-heap con cancellazione lazy.
+
+    Inserimento e cancellazione costano O(log n) e O(1); l'ordinamento è
+    preciso al singolo istante di scadenza.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._removed_count = 0
+
+    def __len__(self):
+        return len(self._heap) - self._removed_count
+
+    def push(self, entry):
+        """Inserisce una entry e indica se è diventata la prima in scadenza."""
+        heapq.heappush(self._heap, entry)
+        return self._heap[0] is entry
+
+    def cancel(self, entry):
+        """Segna una entry come cancellata; verrà scartata all'estrazione."""
+        entry[COMMAND] = _REMOVED
+        self._removed_count += 1
+        # Compatta l'heap quando le entry cancellate sono la maggioranza
+        if self._removed_count > 64 and self._removed_count * 2 > len(self._heap):
+            self._heap = [e for e in self._heap if e[COMMAND] is not _REMOVED]
+            heapq.heapify(self._heap)
+            self._removed_count = 0
+
+    def pop_due(self, now):
+        """Estrae tutte le entry scadute e non cancellate."""
+        due = []
+        while self._heap and self._heap[0][DUE_AT] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[COMMAND] is _REMOVED:
+                self._removed_count -= 1
+                continue
+            due.append(entry)
+        return due
+
+    def next_due(self):
+        """Istante della prossima scadenza, o None se la coda è vuota."""
+        while self._heap and self._heap[0][COMMAND] is _REMOVED:
+            heapq.heappop(self._heap)
+            self._removed_count -= 1
+        return self._heap[0][DUE_AT] if self._heap else None
+
+    def entries(self):
+        """Restituisce le entry ancora in attesa (in ordine arbitrario)."""
+        return [e for e in self._heap if e[COMMAND] is not _REMOVED]
+
+
+class HierarchicalTimingWheel:
+    """Coda dei timer a ruote gerarchiche (giorni/ore/minuti/secondi).
+
+    Ogni entry finisce nel bucket della ruota più grossolana che la separa
+    dall'istante corrente e scende di livello (cascading) quando la ruota
+    superiore gira. Inserimento e cancellazione sono O(1); la risoluzione è
+    di un secondo, sufficiente per cooldown da 24h e 168h. La ruota salta
+    direttamente al prossimo bucket occupato, così lo scheduler dorme fino
+    alla prossima scadenza (o al prossimo cascading) invece di svegliarsi
+    ogni secondo.
+    """
+
+    DAY_SLOTS = 64
+
+    def __init__(self, now=None):
+        self._current = int(time.time() if now is None else now)
+        self._seconds = [{} for _ in range(60)]
+        self._minutes = [{} for _ in range(60)]
+        self._hours = [{} for _ in range(24)]
+        self._days = [{} for _ in range(self.DAY_SLOTS)]
+        self._overflow = {}
+        self._ready = {}
+        # seq -> bucket che contiene la entry, per la cancellazione O(1)
+        self._where = {}
+        # Ultimo valore di next_due(): una entry che scade prima deve risvegliare lo scheduler
+        self._wake_at = None
+
+    def __len__(self):
+        return len(self._where)
+
+    def push(self, entry):
+        """Inserisce una entry e indica se scade prima del risveglio già pianificato."""
+        if not self._where:
+            # Ruota vuota: riallinea l'istante corrente senza far girare i bucket
+            self._current = max(self._current, int(time.time()))
+        tick = math.ceil(entry[DUE_AT])
+        self._place(entry, tick)
+        return self._wake_at is None or tick < self._wake_at
+
+    def cancel(self, entry):
+        """Rimuove una entry dal suo bucket e la segna come cancellata (come nell'heap)."""
+        entry[COMMAND] = _REMOVED
+        bucket = self._where.pop(entry[SEQ], None)
+        if bucket is not None:
+            del bucket[entry[SEQ]]
+
+    def pop_due(self, now):
+        """Fa avanzare la ruota fino a `now` e restituisce le entry scadute."""
+        target = int(now)
+        if not self._where:
+            self._current = max(self._current, target)
+            return []
+
+        due = list(self._ready.values())
+        self._ready.clear()
+        while self._current < target:
+            tick = self._next_tick()
+            if tick is None or tick > target:
+                # Nessun bucket occupato fino a `target`: i tick intermedi non farebbero nulla
+                self._current = target
+                break
+            self._current = tick
+            due.extend(self._tick())
+        for entry in due:
+            del self._where[entry[SEQ]]
+        return due
+
+    def next_due(self):
+        """Prossimo tick utile (una scadenza o un cascading), o None se la ruota è vuota."""
+        if not self._where:
+            self._wake_at = None
+        elif self._ready:
+            self._wake_at = self._current
+        else:
+            self._wake_at = self._next_tick()
+        return self._wake_at
+
+    def entries(self):
+        """Restituisce le entry ancora in attesa (in ordine arbitrario)."""
+        buckets = {id(bucket): bucket for bucket in self._where.values()}
+        return [entry for bucket in buckets.values() for entry in bucket.values()]
+
+    def _place(self, entry, tick):
+        cur = self._current
+        if tick <= cur:
+            bucket = self._ready
+        elif tick // 60 == cur // 60:
+            bucket = self._seconds[tick % 60]
+        elif tick // 3600 == cur // 3600:
+            bucket = self._minutes[(tick // 60) % 60]
+        elif tick // 86400 == cur // 86400:
+            bucket = self._hours[(tick // 3600) % 24]
+        elif tick // 86400 - cur // 86400 < self.DAY_SLOTS:
+            bucket = self._days[(tick // 86400) % self.DAY_SLOTS]
+        else:
+            bucket = self._overflow
+        bucket[entry[SEQ]] = entry
+        self._where[entry[SEQ]] = bucket
+
+    def _next_tick(self):
+        """Primo tick successivo a quello corrente in cui un bucket occupato scade o scende di livello."""
+        cur = self._current
+        minute_end = cur - cur % 60 + 60
+        for tick in range(cur + 1, minute_end):
+            if self._seconds[tick % 60]:
+                return tick
+        hour_end = cur - cur % 3600 + 3600
+        for tick in range(minute_end, hour_end, 60):
+            if self._minutes[(tick // 60) % 60]:
+                return tick
+        day_end = cur - cur % 86400 + 86400
+        for tick in range(hour_end, day_end, 3600):
+            if self._hours[(tick // 3600) % 24]:
+                return tick
+        if self._overflow:
+            # Le entry oltre la ruota dei giorni vengono ricollocate a ogni cambio di giorno
+            return day_end
+        for tick in range(day_end, day_end + (self.DAY_SLOTS - 1) * 86400, 86400):
+            if self._days[(tick // 86400) % self.DAY_SLOTS]:
+                return tick
+        return None
+
+    def _cascade(self, bucket):
+        entries = list(bucket.values())
+        bucket.clear()
+        for entry in entries:
+            self._place(entry, math.ceil(entry[DUE_AT]))
+
+    def _tick(self):
+        cur = self._current
+        if cur % 86400 == 0:
+            self._cascade(self._days[(cur // 86400) % self.DAY_SLOTS])
+            if self._overflow:
+                self._cascade(self._overflow)
+        if cur % 3600 == 0:
+            self._cascade(self._hours[(cur // 3600) % 24])
+        if cur % 60 == 0:
+            self._cascade(self._minutes[(cur // 60) % 60])
+
+        bucket = self._seconds[cur % 60]
+        expired = list(bucket.values())
+        bucket.clear()
+        if self._ready:
+            # Entry scese direttamente a "pronte" durante il cascading
+            expired.extend(self._ready.values())
+            self._ready.clear()
+        return expired
+
+
+TIMER_QUEUES = {
+    "heap": HeapTimerQueue,
+    "wheel": HierarchicalTimingWheel,
+}
@@ -0,0 +1,208 @@
+import time
+from collections.abc import MutableMapping
+
+try:
+    import numpy as np
+except ImportError:  # NumPy è opzionale: senza, si usano i dizionari per comando
+    np = None
+
+
+class TimerColumn(MutableMapping):
+    """Vista `{user_id: timestamp}` su una colonna della tabella dei timer.
+
+    Sostituisce i vecchi dizionari `<comando>_times`: chi legge o scrive un
+    singolo utente continua a usarla come un dict. Le celle vuote valgono NaN.
+    """
+
+    __slots__ = ("_table", "_col")
+
+    def __init__(self, table, col):
+        self._table = table
+        self._col = col
+
+    def __getitem__(self, user_id):
+        row = self._table._rows.get(user_id)
+        if row is None:
+            raise KeyError(user_id)
+        value = self._table.times[row, self._col]
+        if value != value:  # NaN: nessun timer registrato
+            raise KeyError(user_id)
+        return float(value)
+
+    def __setitem__(self, user_id, timestamp):
+        # La riga va ottenuta prima: _row_for può riallocare la matrice
+        row = self._table._row_for(user_id)
+        self._table.times[row, self._col] = timestamp
+
+    def __delitem__(self, user_id):
+        row = self._table._rows.get(user_id)
+        if row is None or np.isnan(self._table.times[row, self._col]):
+            raise KeyError(user_id)
+        self._table.times[row, self._col] = np.nan
+
+    def __contains__(self, user_id):
+        row = self._table._rows.get(user_id)
+        return row is not None and not np.isnan(self._table.times[row, self._col])
+
+    def _present_rows(self):
+        table = self._table
+        return np.flatnonzero(~np.isnan(table.times[:table.size, self._col]))
+
+    def __iter__(self):
+        user_ids = self._table.user_ids
+        return iter([int(user_ids[row]) for row in self._present_rows()])
+
+    def __len__(self):
+        return len(self._present_rows())
+
+    def items(self):
+        table = self._table
+        rows = self._present_rows()
+        return list(zip(table.user_ids[rows].tolist(), table.times[rows, self._col].tolist()))
+
+
+class TimerTable:
+    """Tabella colonnare degli avvii dei timer di tutti gli utenti.
+
+    Una riga per utente (indice `user_id -> riga`) e una colonna per comando
+    in una matrice float64 (utenti x comandi), più il vettore dei cooldown.
+    Le interrogazioni sull'intera popolazione (chi è in cooldown, chi torna
+    disponibile entro un'ora, distribuzione dei tempi residui) sono
+    operazioni vettoriali invece di cicli sui dizionari.
+    """
+
+    numpy = True
+
+    def __init__(self, cooldowns, capacity=1024):
+        self.commands = list(cooldowns)
+        self._index = {command: col for col, command in enumerate(self.commands)}
+        self.cooldowns = np.array([cooldowns[command] for command in self.commands], dtype=np.float64)
+        self._rows = {}
+        self.size = 0
+        self.user_ids = np.zeros(capacity, dtype=np.int64)
+        self.times = np.full((capacity, len(self.commands)), np.nan)
+        self.columns = {command: TimerColumn(self, col) for command, col in self._index.items()}
+
+    def column(self, command):
+        return self.columns[command]
+
+    def _row_for(self, user_id):
+        row = self._rows.get(user_id)
+        if row is None:
+            row = self.size
+            if row == len(self.user_ids):
+                self._grow()
+            self.user_ids[row] = user_id
+            self._rows[user_id] = row
+            self.size += 1
+        return row
+
+    def _grow(self):
+        capacity = 2 * len(self.user_ids)
+        user_ids = np.zeros(capacity, dtype=np.int64)
+        user_ids[:self.size] = self.user_ids[:self.size]
+        times = np.full((capacity, len(self.commands)), np.nan)
+        times[:self.size] = self.times[:self.size]
+        self.user_ids, self.times = user_ids, times
+
+    def remaining(self, now=None):
+        """Matrice dei secondi residui di cooldown (NaN dove non c'è un timer)."""
+        now = time.time() if now is None else now
+        return self.times[:self.size] + self.cooldowns - now
+
+    def on_cooldown(self, command, now=None):
+        """Coppie (user_id, avvio) dei timer del comando ancora in cooldown."""
+        now = time.time() if now is None else now
+        col = self._index[command]
+        started = self.times[:self.size, col]
+        # I confronti con NaN sono falsi: le celle vuote restano escluse
+        mask = (started < now) & (started > now - self.cooldowns[col])
+        rows = np.flatnonzero(mask)
+        return list(zip(self.user_ids[rows].tolist(), started[rows].tolist()))
+
+    def cooldown_counts(self, now=None):
+        """Numero di utenti in cooldown per ogni comando."""
+        remaining = self.remaining(now)
+        counts = np.count_nonzero(remaining > 0, axis=0)
+        return dict(zip(self.commands, counts.tolist()))
+
+    def available_within(self, seconds, now=None):
+        """Numero di utenti che tornano disponibili entro `seconds`, per comando."""
+        remaining = self.remaining(now)
+        counts = np.count_nonzero((remaining > 0) & (remaining <= seconds), axis=0)
+        return dict(zip(self.commands, counts.tolist()))
+
+    def users_available_within(self, command, seconds, now=None):
+        """Utenti il cui timer del comando scade entro `seconds`, ordinati per scadenza."""
+        remaining = self.remaining(now)[:, self._index[command]]
+        rows = np.flatnonzero((remaining > 0) & (remaining <= seconds))
+        rows = rows[np.argsort(remaining[rows], kind="stable")]
+        return self.user_ids[rows].tolist()
+
+    def remaining_histogram(self, command, edges, now=None):
+        """Conteggi dei tempi residui del comando negli intervalli [edges[i], edges[i+1])."""
+        remaining = self.remaining(now)[:, self._index[command]]
+        counts, _ = np.histogram(remaining[remaining > 0], bins=edges)
+        return counts.tolist()
+
+
+class DictTimerTable:
+    """Stessa interfaccia di TimerTable sui dizionari per comando (senza NumPy)."""
+
+    numpy = False
+
+    def __init__(self, cooldowns):
+        self.commands = list(cooldowns)
+        self.cooldowns = dict(cooldowns)
+        self.columns = {command: {} for command in self.commands}
+
+    def column(self, command):
+        return self.columns[command]
+
+    def _remaining(self, command, now):
+        cooldown = self.cooldowns[command]
+        for timestamp in self.columns[command].values():
+            left = timestamp + cooldown - now
+            if left > 0:
+                yield left
+
+    def on_cooldown(self, command, now=None):
+        now = time.time() if now is None else now
+        cooldown = self.cooldowns[command]
+        return [(user_id, timestamp) for user_id, timestamp in self.columns[command].items()
+                if 0 < now - timestamp < cooldown]
+
+    def cooldown_counts(self, now=None):
+        now = time.time() if now is None else now
+        return {command: sum(1 for _ in self._remaining(command, now)) for command in self.commands}
+
+    def available_within(self, seconds, now=None):
+        now = time.time() if now is None else now
+        return {command: sum(1 for left in self._remaining(command, now) if left <= seconds)
+                for command in self.commands}
+
+    def users_available_within(self, command, seconds, now=None):
+        now = time.time() if now is None else now
+        cooldown = self.cooldowns[command]
+        pending = [(timestamp + cooldown - now, user_id)
+                   for user_id, timestamp in self.columns[command].items()
+                   if 0 < timestamp + cooldown - now <= seconds]
+        return [user_id for _, user_id in sorted(pending, key=lambda item: item[0])]
+
+    def remaining_histogram(self, command, edges, now=None):
+        now = time.time() if now is None else now
+        counts = [0] * (len(edges) - 1)
+        for left in self._remaining(command, now):
+            for i in range(len(counts)):
+                # Come np.histogram: l'ultimo intervallo include l'estremo destro
+                if edges[i] <= left < edges[i + 1] or (i == len(counts) - 1 and left == edges[-1]):
+                    counts[i] += 1
+                    break
+        return counts
+
+
+def create_timer_table(cooldowns, use_numpy=True):
+    """Tabella colonnare con NumPy se disponibile (e richiesta), altrimenti a dizionari."""
+    if use_numpy and np is not None:
+        return TimerTable(cooldowns)
+    return DictTimerTable(cooldowns)
@@ -0,0 +1,87 @@
+import os
+
+
+class UserRegistry:
+    """Registro degli utenti che hanno avviato il bot, su un log di soli append.
+
+    Il file contiene un ID per riga: una nuova registrazione aggiunge una
+    riga (costo costante, qualunque sia il numero di utenti) e all'avvio il
+    file viene letto riga per riga. Righe duplicate o troncate da un arresto
+    durante la scrittura vengono ignorate e, se sono troppe, il log viene
+    compattato riscrivendolo su un file temporaneo poi rinominato.
+
+    `users` è il set condiviso con il resto del bot (`registered_users`).
+    """
+
+    def __init__(self, path, users=None):
+        self.path = path
+        self.users = users if users is not None else set()
+        self._lines = 0
+
+    def __contains__(self, user_id):
+        return user_id in self.users
+
+    def __len__(self):
+        return len(self.users)
+
+    def load(self):
+        """Carica gli ID dal log e lo compatta se contiene troppe righe inutili."""
+        invalid = 0
+        self._lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    self._lines += 1
+                    # Riga finale senza "\n": append interrotto, l'ID potrebbe essere troncato
+                    if not line.endswith("\n"):
+                        invalid += 1
+                        continue
+                    try:
+                        self.users.add(int(line))
+                    except ValueError:
+                        invalid += 1
+        except FileNotFoundError:
+            return 0
+        if invalid or self._lines - len(self.users) > max(1000, len(self.users) // 4):
+            self.compact()
+        return len(self.users)
+
+    def import_ids(self, user_ids):
+        """Aggiunge in blocco ID provenienti da un'altra sorgente (es. il vecchio config.ini).
+
+        Il log viene sempre riscritto, anche se non c'è nulla di nuovo: così
+        esiste su disco e l'importazione non viene ripetuta al prossimo avvio.
+        """
+        before = len(self.users)
+        self.users.update(user_ids)
+        self.compact()
+        return len(self.users) - before
+
+    def register(self, user_id):
+        """Registra un utente. Restituisce True se è nuovo.
+
+        L'ID entra nel set solo dopo che la riga è stata scritta: se la
+        scrittura fallisce (OSError) l'utente resta non registrato e la
+        registrazione verrà ritentata.
+        """
+        if user_id in self.users:
+            return False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(f"{user_id}\n")
+        self.users.add(user_id)
+        self._lines += 1
+        return True
+
+    def compact(self):
+        """Riscrive il log con un ID per utente, sostituendo il file in modo atomico."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            for user_id in sorted(self.users):
+                file.write(f"{user_id}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self.users)
+        print(f"Registro utenti compattato: {len(self.users)} utenti.")
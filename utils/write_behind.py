@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+from utils.logger import logger
+
+
+class PartialWriteError(Exception):
+    """Sollevata da `write_batch` quando solo alcuni record del blocco sono stati scritti.
+
+    `keys` contiene le chiavi non scritte: il flusher le segna di nuovo come
+    sporche, senza riscrivere quelle già salvate.
+    """
+
+    def __init__(self, keys, message=None):
+        self.keys = list(keys)
+        super().__init__(message or f"{len(self.keys)} record non scritti")
+
+
+class WriteBehindFlusher:
+    """Scrittura differita (write-behind) dei record modificati.
+
+    Le modifiche segnano il record come "sporco"; un flusher in background
+    scrive i record sporchi a blocchi ogni `interval` secondi, o prima se
+    vengono raggiunti `batch_size` record. In caso di crash si perdono al
+    massimo le modifiche degli ultimi `interval` secondi.
+
+    Args:
+        snapshot: funzione `snapshot(key)` chiamata sul thread del loop che
+            restituisce una copia serializzata e immutabile del record (o None).
+        write_batch: funzione bloccante `write_batch([(key, snapshot), ...])`
+            eseguita in un thread, responsabile di un unico fsync per blocco.
+            Se fallisce solleva un'eccezione (PartialWriteError se solo per
+            alcuni record): i record non scritti tornano sporchi.
+        executor: pool in cui eseguire le scritture (None = pool di default del loop)
+    """
+
+    def __init__(self, snapshot, write_batch, interval=5.0, batch_size=200, after_flush=None, executor=None):
+        self._snapshot = snapshot
+        self._write_batch = write_batch
+        self._executor = executor
+        # Chiamata sul thread del loop dopo ogni flush riuscito (es. per liberare la cache)
+        self._after_flush = after_flush
+        self.interval = interval
+        self.batch_size = batch_size
+        # dict usato come set ordinato: i record vengono scritti in ordine di modifica
+        self._dirty = {}
+        # Record estratti ma non ancora scritti su disco
+        self._in_flight = set()
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self.last_flush = time.time()
+        self.flushed_records = 0
+        self.flushed_batches = 0
+
+    def mark_dirty(self, key):
+        """Segna un record come da salvare."""
+        self._dirty[key] = None
+        if len(self._dirty) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self, key):
+        """Rimuove un record dalla lista dei sospesi (es. se già scritto altrove)."""
+        self._dirty.pop(key, None)
+
+    def is_dirty(self, key):
+        """True se il record ha modifiche non ancora scritte su disco."""
+        return key in self._dirty or key in self._in_flight
+
+    def request_flush(self):
+        """Anticipa il prossimo flush senza attendere l'intervallo."""
+        if self._dirty and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending_count(self):
+        return len(self._dirty)
+
+    def _take_batch(self):
+        """Estrae i record sporchi e ne prende uno snapshot sul thread corrente."""
+        keys = list(self._dirty)
+        self._dirty.clear()
+        batch = []
+        for key in keys:
+            data = self._snapshot(key)
+            if data is not None:
+                batch.append((key, data))
+        return batch
+
+    def flush(self):
+        """Scrive in modo sincrono tutti i record sporchi (usato all'uscita)."""
+        batch = self._take_batch()
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    async def flush_async(self):
+        """Scrive i record sporchi in un thread separato, senza bloccare il loop."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        # Un solo blocco alla volta, così le scritture dello stesso record non si invertono
+        async with self._flush_lock:
+            batch = self._take_batch()
+            if batch:
+                self._in_flight.update(key for key, _ in batch)
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+                except PartialWriteError as e:
+                    # Riprova al prossimo giro solo i record non scritti
+                    for key in e.keys:
+                        self._dirty.setdefault(key, None)
+                    raise
+                except Exception:
+                    # Riprova al prossimo giro senza perdere le modifiche
+                    for key, _ in batch:
+                        self._dirty.setdefault(key, None)
+                    raise
+                finally:
+                    self._in_flight.clear()
+                if self._after_flush is not None:
+                    self._after_flush()
+            return len(batch)
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        self._write_batch(batch)
+        self.last_flush = time.time()
+        self.flushed_records += len(batch)
+        self.flushed_batches += 1
+        logger.info(f"[WriteBehind] Flushed {len(batch)} records in {time.perf_counter() - start:.3f}s")
+
+    def start(self):
+        """Avvia il flusher periodico."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Ferma il flusher e scrive tutto ciò che è ancora in sospeso."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_async()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush_async()
+            except Exception as e:
+                logger.error(f"[WriteBehind] Error flushing dirty records: {e}")